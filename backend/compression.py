@@ -0,0 +1,161 @@
+"""
+Compresión de respuestas negociada por Accept-Encoding (brotli si está instalado, gzip)
+A diferencia de GZipMiddleware de Starlette, no comprime text/event-stream (el feed
+SSE debe llegar evento por evento) y en respuestas por streaming comprime cada
+fragmento con flush para no retener datos hasta el final. Toda respuesta que se
+podría comprimir lleva Vary: Accept-Encoding, también cuando sale sin comprimir
+(cuerpo chico o cliente sin gzip/br), para que un caché no entregue una versión a
+un cliente que pidió la otra.
+"""
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se ofrece gzip
+    brotli = None
+
+# Tipos que no vale la pena comprimir (ya comprimidos o de streaming en vivo)
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip",
+                          "application/gzip", "application/octet-stream", "application/vnd.apache.parquet")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Elige br o gzip según Accept-Encoding (respeta q=0); None si ninguno aplica"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        else:
+            # wbits 16 + MAX_WBITS produce el formato gzip
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def add_vary(headers: list) -> list:
+    """Une los Vary existentes en uno solo que incluye Accept-Encoding"""
+    vary = [value for key, value in headers if key.lower() == b"vary"]
+    if not any(item.strip().lower() in (b"accept-encoding", b"*") for value in vary for item in value.split(b",")):
+        vary.append(b"Accept-Encoding")
+    return [(key, value) for key, value in headers if key.lower() != b"vary"] + [(b"vary", b", ".join(vary))]
+
+
+def compress_body(encoding: str, body: bytes, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        level = self.levels[encoding] if encoding else None
+        await _CompressedResponse(self.app, encoding, level, self.minimum_size)(scope, receive, send)
+
+
+class _CompressedResponse:
+    def __init__(self, app, encoding: str, level: int, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            # Se decide al ver el primer fragmento del cuerpo
+            self.start_message = message
+            headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in message["headers"]}
+            content_type = headers.get("content-type", "")
+            compressible = "content-encoding" not in headers and not content_type.startswith(EXCLUDED_CONTENT_TYPES)
+            if compressible:
+                self.start_message = message = {**message, "headers": add_vary(message["headers"])}
+            self.passthrough = not compressible or self.encoding is None or message["status"] in (204, 304)
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                # Cuerpo completo: comprimir solo si supera el umbral
+                if len(body) < self.minimum_size:
+                    await self.send(self.start_message)
+                    await self.send(message)
+                    return
+                compressed = compress_body(self.encoding, body, self.level)
+                await self.send(self._start_headers(len(compressed)))
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            # Streaming: comprimir cada fragmento a medida que llega
+            self.compressor = _Compressor(self.encoding, self.level)
+            await self.send(self._start_headers(None))
+
+        chunk = self.compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _start_headers(self, content_length):
+        # start_message ya trae Vary: Accept-Encoding
+        headers = [
+            (key, value) for key, value in self.start_message["headers"]
+            if key.lower() not in (b"content-length", b"etag")
+        ]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        # El ETag identifica la representación sin comprimir: se marca débil
+        for key, value in self.start_message["headers"]:
+            if key.lower() == b"etag":
+                headers.append((b"etag", value if value.startswith(b"W/") else b"W/" + value))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return {**self.start_message, "headers": headers}
@@ -0,0 +1,215 @@
+"""
+Exportación por streaming de préstamos, cuotas y pagos a CSV o Parquet
+Los documentos se leen con cursores de Motor (batch_size configurable) y se
+escriben por bloques: CSV cada rows_per_chunk filas y Parquet un row group cada
+row_group_size filas, así la memoria depende del tamaño del bloque y no del total.
+Parquet requiere pyarrow (dependencia opcional).
+"""
+import csv
+import io
+from datetime import datetime, timezone
+
+from payment_ledger import PaymentLedger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Sin pyarrow solo se exporta CSV
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+# Columnas exportadas por conjunto de datos: (campo, tipo)
+EXPORT_DATASETS = {
+    "loans": {
+        "collection": "loans",
+        "date_field": "created_at",
+        "columns": [
+            ("id", "str"), ("loan_number", "str"), ("client_id", "str"), ("client_name", "str"),
+            ("lender_id", "str"), ("lender_name", "str"), ("amount", "int"), ("interest_rate", "float"),
+            ("term_months", "int"), ("monthly_payment", "int"), ("total_amount", "int"), ("status", "str"),
+            ("payment_frequency", "str"), ("created_at", "date"), ("approved_at", "date"),
+            ("start_date", "date"), ("closed_at", "date"),
+        ],
+    },
+    "schedules": {
+        "collection": "payment_schedules",
+        "date_field": "due_date",
+        "columns": [
+            ("id", "str"), ("loan_id", "str"), ("client_id", "str"), ("client_name", "str"),
+            ("lender_id", "str"), ("payment_number", "int"), ("due_date", "date"), ("amount", "int"),
+            ("status", "str"), ("paid_date", "date"),
+        ],
+    },
+    "payments": {
+        "collection": "payments",
+        "date_field": "payment_date",
+        "columns": [
+            ("id", "str"), ("loan_id", "str"), ("client_id", "str"), ("amount", "int"),
+            ("payment_date", "date"), ("payment_number", "int"), ("notes", "str"),
+        ],
+    },
+}
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def parse_date_bound(value: str) -> str:
+    """Fecha YYYY-MM-DD (o ISO completa) -> cadena ISO en UTC comparable con la base"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.isoformat()
+
+
+async def dataset_filter(database, dataset: str, start: str = None, end: str = None,
+                         lender_id: str = None, include_archived: bool = False) -> dict:
+    """Filtro por rango de fechas [start, end) y prestamista para el conjunto de datos"""
+    query = {}
+    date_field = EXPORT_DATASETS[dataset]["date_field"]
+    if start or end:
+        query[date_field] = {}
+        if start:
+            query[date_field]["$gte"] = parse_date_bound(start)
+        if end:
+            query[date_field]["$lt"] = parse_date_bound(end)
+    if lender_id:
+        if dataset == "payments":
+            # Los pagos no guardan el prestamista: filtrar por sus préstamos
+            loan_ids = [loan["id"] async for loan in database.loans.find({"lender_id": lender_id}, {"_id": 0, "id": 1})]
+            if include_archived:
+                loan_ids += [loan["id"] async for loan in database.loans_archive.find(
+                    {"lender_id": lender_id}, {"_id": 0, "id": 1})]
+            query["loan_id"] = {"$in": loan_ids}
+        else:
+            query["lender_id"] = lender_id
+    return query
+
+
+async def iterate_dataset(database, dataset: str, query: dict, include_archived: bool = False,
+                          time_series: bool = False, batch_size: int = 2000, outbox_database=None):
+    """Documentos del conjunto de datos (y de su archivo) leídos por lotes"""
+    projection = {"_id": 0, "archived_at": 0}
+    if dataset == "payments":
+        ledger = PaymentLedger(database, time_series, outbox_database=outbox_database)
+        async for doc in ledger.iterate(query, projection, batch_size):
+            yield doc
+    else:
+        async for doc in database[EXPORT_DATASETS[dataset]["collection"]].find(query, projection).batch_size(batch_size):
+            yield doc
+    if include_archived:
+        archive = database[EXPORT_DATASETS[dataset]["collection"] + "_archive"]
+        async for doc in archive.find(query, projection).batch_size(batch_size):
+            yield doc
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):  # Enums
+        return value.value
+    return value
+
+
+async def csv_stream(docs, columns: list, rows_per_chunk: int = 5000):
+    """Encabezado y luego bloques de rows_per_chunk filas como bytes UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    names = [name for name, _ in columns]
+    writer.writerow(names)
+    rows = 0
+    async for doc in docs:
+        writer.writerow([_csv_value(doc.get(name)) for name in names])
+        rows += 1
+        if rows % rows_per_chunk == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _parquet_schema(columns: list):
+    types = {
+        "str": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "date": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _parquet_value(value, kind: str):
+    if value is None:
+        return None
+    if kind == "date":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if kind == "int":
+        return round(value)
+    if kind == "float":
+        return float(value)
+    if hasattr(value, "value"):
+        return value.value
+    return str(value)
+
+
+class _ChunkSink:
+    """Destino de ParquetWriter que acumula lo escrito hasta que se drena"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+async def parquet_stream(docs, columns: list, row_group_size: int = 50000):
+    """Archivo Parquet emitido por row groups; cada uno se envía apenas se escribe"""
+    if not parquet_available():
+        raise RuntimeError("La exportación Parquet requiere instalar pyarrow")
+    schema = _parquet_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    values = {name: [] for name, _ in columns}
+    count = 0
+
+    def write_group():
+        writer.write_table(pa.Table.from_pydict(values, schema=schema), row_group_size=row_group_size)
+        for column in values.values():
+            column.clear()
+
+    try:
+        async for doc in docs:
+            for name, kind in columns:
+                values[name].append(_parquet_value(doc.get(name), kind))
+            count += 1
+            if count % row_group_size == 0:
+                write_group()
+                yield sink.drain()
+        if count % row_group_size or count == 0:
+            write_group()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,174 @@
+"""
+Bus de eventos para el feed de Server-Sent Events
+Las rutas de escritura publican cambios (préstamo nuevo, aprobación, pago, cambio
+de estado) y cada conexión SSE recibe los que le corresponden sin consultar la base.
+
+Sin attach el bus es local al proceso. Con attach(db) (varios workers o réplicas)
+cada evento se guarda en la colección limitada (capped) events con un id tomado
+de counters, y cada proceso la lee con un cursor tailable y entrega a sus
+suscriptores todos los eventos, también los propios: los ids y el orden (el de
+inserción en events) son los mismos en todos los procesos y Last-Event-ID sirve
+aunque el cliente se reconecte a otro.
+"""
+import asyncio
+import itertools
+import json
+import logging
+from collections import deque
+from datetime import datetime, timezone
+
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Eventos recientes que se reenvían a un cliente que se reconecta con Last-Event-ID
+REPLAY_BUFFER_SIZE = 500
+# Eventos pendientes por suscriptor; si un cliente no lee se le pide recargar
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Colección compartida entre procesos y espera antes de volver a abrir el cursor
+EVENTS_COLLECTION = "events"
+RELAY_RETRY_SECONDS = 1
+
+
+class Subscription:
+    def __init__(self, lender_id: str = None, client_id: str = None):
+        self.lender_id = lender_id
+        self.client_id = client_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event: dict) -> bool:
+        if self.lender_id and event.get("lender_id") != self.lender_id:
+            return False
+        if self.client_id and event.get("client_id") != self.client_id:
+            return False
+        return True
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = set()
+        self._recent = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._ids = itertools.count(1)
+        self._db = None
+        self._relay_task = None
+        self._writes = set()
+
+    async def attach(self, db, capped_bytes: int):
+        """Comparte los eventos con los demás procesos a través de db.events"""
+        try:
+            await db.create_collection(EVENTS_COLLECTION, capped=True, size=capped_bytes)
+        except CollectionInvalid:
+            pass
+        try:
+            # Un cursor tailable sobre una colección vacía muere enseguida
+            await db[EVENTS_COLLECTION].insert_one({"_id": "start"})
+        except DuplicateKeyError:
+            pass
+        self._db = db
+        self._relay_task = asyncio.create_task(self._relay())
+
+    async def detach(self):
+        # Guardar los eventos en camino antes de cortar la lectura
+        await asyncio.gather(*self._writes, return_exceptions=True)
+        if self._relay_task:
+            self._relay_task.cancel()
+            await asyncio.gather(self._relay_task, return_exceptions=True)
+        self._db = None
+        self._relay_task = None
+
+    def publish(self, event_type: str, data: dict, lender_id: str = None, client_id: str = None):
+        event = {
+            "type": event_type,
+            "lender_id": lender_id,
+            "client_id": client_id,
+            "data": data,
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+        if self._db is None:
+            self._deliver({"id": next(self._ids), **event})
+            return
+        # publish no espera a la base: lo entrega el relay cuando lee la colección
+        task = asyncio.create_task(self._store(event))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _store(self, event: dict):
+        try:
+            counter = await self._db.counters.find_one_and_update(
+                {"_id": "events"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            await self._db[EVENTS_COLLECTION].insert_one({"id": counter["seq"], **event})
+        except Exception:
+            logger.exception(f"No se pudo publicar el evento {event['type']}")
+
+    async def _relay(self):
+        collection = self._db[EVENTS_COLLECTION]
+        while True:
+            try:
+                # Empezar después del último documento guardado: los anteriores ya no
+                # tienen suscriptores en este proceso. Los ids del contador no siguen
+                # el orden de inserción (dos publicadores pueden insertar cruzados),
+                # así que se ubica por _id y no comparando ids
+                last = await collection.find_one({}, sort=[("$natural", -1)])
+                started = last is None
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    # Termina cuando el servidor no tiene eventos nuevos tras esperar
+                    async for doc in cursor:
+                        if not started:
+                            started = doc["_id"] == last["_id"]
+                        elif "id" in doc:
+                            doc.pop("_id")
+                            self._deliver(doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Se cortó la lectura de la colección de eventos")
+            # El cursor murió (se cortó la conexión o la colección se reescribió antes
+            # de leerla): los eventos intermedios se pierden y los clientes recargan
+            for subscription in list(self._subscribers):
+                self._resync(subscription, self._recent[-1]["id"] if self._recent else 0)
+            await asyncio.sleep(RELAY_RETRY_SECONDS)
+
+    def _deliver(self, event: dict):
+        self._recent.append(event)
+        for subscription in list(self._subscribers):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente lento: vaciar su cola y avisarle que recargue todo
+                self._resync(subscription, event["id"])
+
+    def _resync(self, subscription: Subscription, event_id: int):
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait({"id": event_id, "type": "resync", "data": {}})
+
+    def subscribe(self, lender_id: str = None, client_id: str = None, last_event_id: int = None) -> Subscription:
+        subscription = Subscription(lender_id, client_id)
+        latest_id = self._recent[-1]["id"] if self._recent else 0
+        if last_event_id is not None and last_event_id != latest_id:
+            # Reenviar lo entregado después de last_event_id en el orden de entrega
+            # (el de la colección events, igual en todos los procesos), no por id
+            position = next((index for index, event in enumerate(self._recent) if event["id"] == last_event_id), None)
+            if position is None:
+                # Se perdieron eventos fuera del buffer (o el proceso se reinició)
+                subscription.queue.put_nowait({"id": latest_id, "type": "resync", "data": {}})
+            else:
+                missed = list(itertools.islice(self._recent, position + 1, None))
+                for event in missed[-SUBSCRIBER_QUEUE_SIZE:]:
+                    if subscription.wants(event):
+                        subscription.queue.put_nowait(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+
+def format_sse(event: dict) -> str:
+    """Serializa un evento en el formato de text/event-stream"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
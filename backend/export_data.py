@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Exporta préstamos, cuotas o pagos a CSV o Parquet desde la línea de comandos
+Usa los mismos generadores que GET /api/admin/export/{dataset}: lee con cursores
+por lotes y escribe por bloques, así la memoria no crece con el tamaño del archivo.
+
+    python export_data.py schedules --format parquet --output cuotas.parquet
+    python export_data.py payments --start 2026-01-01 --end 2026-02-01 --lender-id <id>
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from data_export import (
+    EXPORT_DATASETS, EXPORT_FORMATS, parquet_available,
+    dataset_filter, iterate_dataset, csv_stream, parquet_stream
+)
+from mongo_pool import create_client
+from payment_ledger import is_time_series
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+async def export(args) -> int:
+    client, _ = create_client(args.mongo_url)
+    try:
+        db = client[args.db_name]
+        query = await dataset_filter(db, args.dataset, args.start, args.end, args.lender_id, args.include_archived)
+        docs = iterate_dataset(
+            db, args.dataset, query,
+            include_archived=args.include_archived,
+            time_series=await is_time_series(db),
+            batch_size=args.batch_size
+        )
+        columns = EXPORT_DATASETS[args.dataset]["columns"]
+        if args.format == "parquet":
+            chunks = parquet_stream(docs, columns, args.row_group_size)
+        else:
+            chunks = csv_stream(docs, columns, args.chunk_rows)
+
+        output = args.output or f"{args.dataset}.{args.format}"
+        started = time.perf_counter()
+        written = 0
+        with open(output, "wb") as handle:
+            async for chunk in chunks:
+                handle.write(chunk)
+                written += len(chunk)
+        print(f"{output}: {written / 1_048_576:.1f} MB en {time.perf_counter() - started:.1f} s")
+        return 0
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("dataset", choices=sorted(EXPORT_DATASETS))
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--output", help="archivo de salida (por defecto <dataset>.<formato>)")
+    parser.add_argument("--start", help="fecha inicial incluida (YYYY-MM-DD)")
+    parser.add_argument("--end", help="fecha final excluida (YYYY-MM-DD)")
+    parser.add_argument("--lender-id")
+    parser.add_argument("--include-archived", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get("EXPORT_BATCH_SIZE", 2000)))
+    parser.add_argument("--chunk-rows", type=int, default=int(os.environ.get("EXPORT_CSV_CHUNK_ROWS", 5000)))
+    parser.add_argument("--row-group-size", type=int, default=int(os.environ.get("EXPORT_ROW_GROUP_SIZE", 50000)))
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME"))
+    args = parser.parse_args()
+    if not args.mongo_url or not args.db_name:
+        parser.error("MONGO_URL y DB_NAME son obligatorios (entorno o argumentos)")
+    if args.format == "parquet" and not parquet_available():
+        parser.error("la exportación Parquet requiere instalar pyarrow")
+    return asyncio.run(export(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
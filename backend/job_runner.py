@@ -0,0 +1,182 @@
+"""
+Cola de trabajos en segundo plano para operaciones administrativas largas
+Cada trabajo se guarda en la colección jobs (estado, progreso y resultado) y se
+ejecuta dentro del proceso con asyncio, con un máximo de trabajos simultáneos.
+Al iniciar se retoman los trabajos encolados y los interrumpidos por un reinicio,
+por lo que los manejadores deben poder ejecutarse de nuevo sin efectos duplicados.
+
+Con varios procesos solo uno ejecuta trabajos (el que tiene el lease, ver
+leader_lease.py); los demás solo los guardan en jobs y el que ejecuta los toma al
+revisar la colección cada POLL_SECONDS.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 30
+# Un trabajo "running" sin latido en este tiempo quedó huérfano (proceso caído)
+STALE_AFTER_SECONDS = 120
+# Cada cuánto se buscan trabajos encolados por otros procesos o huérfanos
+POLL_SECONDS = 5
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobRunner:
+    def __init__(self, concurrency: int = 2):
+        self.concurrency = max(1, concurrency)
+        self.handlers = {}
+        self.db = None
+        self._queue = None
+        self._queued = set()
+        self._workers = []
+
+    def register(self, job_type: str, handler):
+        """handler(params, report) -> resultado; report(done, total) actualiza el progreso"""
+        self.handlers[job_type] = handler
+
+    def attach(self, db):
+        """Permite encolar trabajos sin ejecutarlos en este proceso"""
+        self.db = db
+
+    async def start(self, db):
+        """Ejecuta trabajos en este proceso: los pendientes y los que se encolen"""
+        self.db = db
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        await self._requeue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._poll()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _requeue(self):
+        # Trabajos que quedaron en ejecución cuando su proceso se detuvo
+        stale_before = (datetime.now(timezone.utc) - timedelta(seconds=STALE_AFTER_SECONDS)).isoformat()
+        resumed = await self.db.jobs.update_many(
+            {"status": JobStatus.RUNNING, "heartbeat_at": {"$lt": stale_before}},
+            {"$set": {"status": JobStatus.QUEUED}}
+        )
+        if resumed.modified_count:
+            logger.info(f"Se retoman {resumed.modified_count} trabajos interrumpidos")
+
+        async for job in self.db.jobs.find({"status": JobStatus.QUEUED}, {"_id": 0, "id": 1}).sort("created_at", 1):
+            self._put(job["id"])
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            try:
+                await self._requeue()
+            except Exception:
+                logger.exception("Error buscando trabajos pendientes")
+
+    def _put(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def enqueue(self, job_type: str, params: dict, requested_by: str = None) -> dict:
+        if job_type not in self.handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {job_type}")
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "params": params,
+            "requested_by": requested_by,
+            "status": JobStatus.QUEUED,
+            "progress": {"done": 0, "total": None, "percentage": 0.0},
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "heartbeat_at": None
+        }
+        await self.db.jobs.insert_one(dict(job))
+        if self._queue is not None:
+            self._put(job["id"])
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Error inesperado ejecutando el trabajo {job_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Tomar el trabajo; si otro proceso ya lo tomó no hay nada que hacer
+        job = await self.db.jobs.find_one_and_update(
+            {"id": job_id, "status": JobStatus.QUEUED},
+            {"$set": {"status": JobStatus.RUNNING, "started_at": _now(), "heartbeat_at": _now()},
+             "$inc": {"attempts": 1}},
+            projection={"_id": 0, "type": 1, "params": 1}
+        )
+        if not job:
+            return
+
+        handler = self.handlers.get(job["type"])
+        if handler is None:
+            await self._finish(job_id, JobStatus.FAILED, error=f"Tipo de trabajo desconocido: {job['type']}")
+            return
+
+        async def report(done: int, total: int = None):
+            percentage = round(done / total * 100, 1) if total else 0.0
+            await self.db.jobs.update_one(
+                {"id": job_id},
+                {"$set": {
+                    "progress": {"done": done, "total": total, "percentage": percentage},
+                    "heartbeat_at": _now()
+                }}
+            )
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await handler(job["params"], report)
+        except asyncio.CancelledError:
+            # Apagado del proceso: queda "running" y se retoma al reiniciar
+            raise
+        except Exception as e:
+            logger.exception(f"Falló el trabajo {job_id} ({job['type']})")
+            await self._finish(job_id, JobStatus.FAILED, error=str(e))
+        else:
+            await self._finish(job_id, JobStatus.COMPLETED, result=result)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await self.db.jobs.update_one({"id": job_id}, {"$set": {"heartbeat_at": _now()}})
+
+    async def _finish(self, job_id: str, status: JobStatus, result=None, error: str = None):
+        update = {"status": status, "result": result, "error": error, "finished_at": _now()}
+        if status == JobStatus.COMPLETED:
+            update["progress.percentage"] = 100.0
+        await self.db.jobs.update_one({"id": job_id}, {"$set": update})
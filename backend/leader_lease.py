@@ -0,0 +1,78 @@
+"""
+Elección de un único proceso para las tareas de fondo
+Con varios workers (o varias réplicas) cada proceso intenta tomar un lease en la
+colección leases: el que lo tiene lo renueva periódicamente y ejecuta las tareas;
+si deja de renovarlo (proceso caído o sin conexión) otro lo toma cuando expira.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    def __init__(self, name: str, ttl_seconds: int = 30):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._task = None
+
+    async def acquire(self, db) -> bool:
+        """Toma o renueva el lease; False si lo tiene otro proceso vigente"""
+        now = datetime.now(timezone.utc)
+        try:
+            # Si el lease es de otro y no expiró, el filtro no coincide y el upsert
+            # choca con el _id existente
+            await db.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": self.holder, "expires_at": now + self.ttl}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def start(self, db, on_elected, on_deposed):
+        """Intenta tomar el lease cada ttl/3; llama on_elected()/on_deposed() al cambiar"""
+        self._task = asyncio.create_task(self._run(db, on_elected, on_deposed))
+
+    async def stop(self, db, on_deposed):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            await on_deposed()
+            # Liberarlo para que otro proceso no espere a que expire
+            await db.leases.delete_one({"_id": self.name, "holder": self.holder})
+
+    async def _run(self, db, on_elected, on_deposed):
+        while True:
+            try:
+                elected = await self.acquire(db)
+            except Exception:
+                # Sin poder renovar no hay garantía de seguir siendo el único
+                logger.exception(f"No se pudo renovar el lease {self.name}")
+                elected = False
+            try:
+                if elected and not self.is_leader:
+                    logger.info(f"{self.holder} ejecuta las tareas de {self.name}")
+                    self.is_leader = True
+                    await on_elected()
+                elif not elected and self.is_leader:
+                    logger.warning(f"{self.holder} perdió el lease {self.name}")
+                    self.is_leader = False
+                    await on_deposed()
+            except Exception:
+                logger.exception(f"Error iniciando o deteniendo las tareas de {self.name}")
+            await asyncio.sleep(self.ttl.total_seconds() / 3)
@@ -0,0 +1,195 @@
+"""
+Cálculos de amortización de préstamos
+Funciones puras (sin dependencias de base de datos) usadas por la API,
+los scripts de carga y los benchmarks
+"""
+
+def calculate_loan(amount: int, interest_rate: float, term_months: int, payment_frequency_days: int = 30, 
+                   system_fee_percentage: float = 0.5, insurance_fee_percentage: float = 1.0) -> dict:
+    """
+    Calcula un préstamo con frecuencia de pago flexible y cargos adicionales
+    
+    Args:
+        amount: Monto del préstamo solicitado
+        interest_rate: Tasa de interés anual (%)
+        term_months: Cantidad de pagos a realizar
+        payment_frequency_days: Días entre cada pago
+        system_fee_percentage: Porcentaje de sistematización (default 0.5%)
+        insurance_fee_percentage: Porcentaje de seguro (default 1.0%)
+    
+    Returns:
+        dict con payment_amount, total_payments, total_amount, total_interest, fees, schedule
+    """
+    # Calcular cargos adicionales
+    system_fee_amount = round(amount * (system_fee_percentage / 100))
+    insurance_fee_amount = round(amount * (insurance_fee_percentage / 100))
+    total_fees = system_fee_amount + insurance_fee_amount
+    
+    # Monto base para calcular intereses (monto original + cargos)
+    base_amount = amount + total_fees
+    
+    # El término "term_months" ahora representa la CANTIDAD DE PAGOS, no meses
+    total_payments = term_months
+    
+    # Calcular tasa de interés por período según la frecuencia
+    annual_rate = interest_rate / 100
+    period_rate = annual_rate * (payment_frequency_days / 365)
+    
+    if period_rate == 0:
+        payment_amount = base_amount / total_payments
+    else:
+        # Fórmula de amortización ajustada por período sobre el monto base
+        payment_amount = base_amount * (period_rate * (1 + period_rate)**total_payments) / ((1 + period_rate)**total_payments - 1)
+    
+    # Redondear a enteros
+    payment_amount = round(payment_amount)
+    total_amount = payment_amount * total_payments
+    total_interest = total_amount - base_amount
+    
+    # Generar schedule de pagos
+    schedule = []
+    balance = base_amount
+    for i in range(1, total_payments + 1):
+        interest_payment = balance * period_rate
+        principal_payment = payment_amount - interest_payment
+        balance -= principal_payment
+        schedule.append({
+            "payment_number": i,
+            "payment": payment_amount,
+            "principal": round(principal_payment),
+            "interest": round(interest_payment),
+            "balance": round(max(balance, 0))
+        })
+    
+    return {
+        "payment_amount": payment_amount,
+        "total_payments": total_payments,
+        "total_amount": total_amount,
+        "total_interest": total_interest,
+        "system_fee_amount": system_fee_amount,
+        "insurance_fee_amount": insurance_fee_amount,
+        "total_fees": total_fees,
+        "base_amount": base_amount,  # Monto original + fees
+        "schedule": schedule,
+        "payment_frequency_days": payment_frequency_days
+    }
+
+
+def interest_for_payment(original_amount: int, interest_rate: float, monthly_payment: int,
+                         payment_number: int, payment_amount: int) -> float:
+    """
+    Calcula la porción de intereses de un pago reproduciendo la amortización
+    
+    Args:
+        original_amount: Monto original del préstamo
+        interest_rate: Tasa de interés anual (%)
+        monthly_payment: Valor de la cuota del préstamo
+        payment_number: Número de la cuota a la que se aplica el pago
+        payment_amount: Monto efectivamente pagado
+    
+    Returns:
+        Interés contenido en el pago (proporcional si es un pago parcial)
+    """
+    monthly_rate = interest_rate / 100 / 12
+    
+    # Calcular el balance restante antes de este pago
+    balance = original_amount
+    for i in range(1, payment_number):
+        interest_for_period = balance * monthly_rate
+        principal_for_period = monthly_payment - interest_for_period
+        balance -= principal_for_period
+    
+    # El interés de esta cuota es el balance multiplicado por la tasa mensual
+    interest_for_this_payment = balance * monthly_rate
+    
+    # Si el pago es menor que la cuota completa (pago parcial), 
+    # calcular proporción del interés
+    if payment_amount < monthly_payment:
+        return (payment_amount / monthly_payment) * interest_for_this_payment
+    
+    # Para pagos normales o mayores, tomar el interés calculado
+    return interest_for_this_payment
+
+
+def allocate_payment(pending_schedules: list, payment_amount: int) -> dict:
+    """
+    Aplica un pago a las cuotas pendientes en orden, sin tocar la base de datos
+    
+    Args:
+        pending_schedules: Cuotas no pagadas ordenadas por número (con id y amount)
+        payment_amount: Monto del pago
+    
+    Returns:
+        dict con paid_ids (cuotas que quedan pagadas), partial (id y nuevo monto de
+        la cuota abonada parcialmente o None) y completes_loan (no queda saldo)
+    """
+    paid_ids = []
+    partial = None
+    remaining_payment = payment_amount
+    
+    for schedule in pending_schedules:
+        if remaining_payment <= 0:
+            break
+        
+        schedule_amount = schedule["amount"]
+        if remaining_payment >= schedule_amount:
+            # Pago completo de esta cuota
+            paid_ids.append(schedule["id"])
+            remaining_payment -= schedule_amount
+        else:
+            # Pago parcial de esta cuota - queda el monto pendiente
+            partial = {"id": schedule["id"], "amount": schedule_amount - remaining_payment}
+            remaining_payment = 0
+    
+    # El préstamo se completa si no queda ninguna cuota con saldo
+    settled = set(paid_ids)
+    completes_loan = partial is None and all(
+        schedule["id"] in settled or schedule["amount"] <= 0 for schedule in pending_schedules
+    )
+    
+    return {"paid_ids": paid_ids, "partial": partial, "completes_loan": completes_loan}
+
+
+def remaining_after_allocation(pending_schedules: list, allocation: dict) -> list:
+    """Cuotas que siguen sin pagar después de aplicar allocate_payment (en orden)"""
+    if allocation["completes_loan"]:
+        return []
+    settled = set(allocation["paid_ids"])
+    partial = allocation["partial"]
+    remaining = []
+    for schedule in pending_schedules:
+        if schedule["id"] in settled:
+            continue
+        if partial and schedule["id"] == partial["id"]:
+            schedule = {**schedule, "amount": partial["amount"]}
+        remaining.append(schedule)
+    return remaining
+
+
+def balance_snapshot(unpaid_schedules: list, schedule_count: int, paid_count: int,
+                     total_paid: int, payment_count: int) -> dict:
+    """
+    Saldo del préstamo que se guarda en el documento (loan.balance)
+    
+    Args:
+        unpaid_schedules: Cuotas no pagadas ordenadas por número (amount, due_date, payment_number)
+        schedule_count: Total de cuotas del cronograma
+        paid_count: Cuotas pagadas
+        total_paid: Suma de los pagos registrados
+        payment_count: Cantidad de pagos registrados
+    
+    Returns:
+        dict con outstanding, total_paid, paid_count, schedule_count, payment_count y
+        la próxima cuota con saldo (next_payment_number, next_due_date, next_due_amount)
+    """
+    next_due = next((schedule for schedule in unpaid_schedules if schedule["amount"] > 0), None)
+    return {
+        "outstanding": sum(schedule["amount"] for schedule in unpaid_schedules),
+        "total_paid": total_paid,
+        "paid_count": paid_count,
+        "schedule_count": schedule_count,
+        "payment_count": payment_count,
+        "next_payment_number": next_due["payment_number"] if next_due else None,
+        "next_due_date": next_due["due_date"] if next_due else None,
+        "next_due_amount": next_due["amount"] if next_due else None,
+    }
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Convierte la colección payments en una colección de series de tiempo
+
+MongoDB no convierte una colección existente ni permite renombrar una de series de
+tiempo, así que la migración renombra payments a payments_legacy, crea payments
+como serie de tiempo (payment_date como campo de tiempo, loan_id y client_id en
+meta) y copia los pagos por lotes. La API debe estar detenida mientras corre y
+arrancar después con PAYMENTS_STORAGE=timeseries.
+
+    python migrate_payments.py                 # migrar
+    python migrate_payments.py --drop-legacy   # migrar y borrar payments_legacy
+    python migrate_payments.py --rollback      # volver a la colección normal, con los
+                                               # pagos registrados después de migrar
+
+Al terminar la copia se guarda una marca en system_state: volver a ejecutar la
+migración con la marca presente no toca payments (la API ya pudo registrar pagos
+nuevos en la serie de tiempo). Sin la marca, una serie de tiempo junto a
+payments_legacy es una copia interrumpida y se repite desde cero.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from payment_ledger import TIME_SERIES_OPTIONS, from_storage, to_storage
+
+load_dotenv(Path(__file__).parent / '.env')
+
+LEGACY = "payments_legacy"
+MARKER = {"id": "payments_migration"}
+
+
+def collection_type(db, name):
+    info = list(db.list_collections(filter={"name": name}))
+    return info[0].get("type", "collection") if info else None
+
+
+def migrate(db, batch_size: int, drop_legacy: bool):
+    current = collection_type(db, "payments")
+    if current == "timeseries" and collection_type(db, LEGACY) is None:
+        print("payments ya es una colección de series de tiempo")
+        return 0
+    if current == "timeseries" and db.system_state.find_one(MARKER) is not None:
+        print(f"La migración ya terminó y payments puede tener pagos nuevos: no se vuelve a copiar "
+              f"desde {LEGACY}. Para volver atrás usar --rollback")
+        if drop_legacy:
+            db[LEGACY].drop()
+            print(f"{LEGACY} eliminada")
+        return 0
+    if current == "timeseries":
+        # Una ejecución anterior quedó a medias antes de la marca: se repite la copia
+        print("Se encontró una migración incompleta: se vuelve a copiar desde payments_legacy")
+        db.payments.drop()
+    elif current is not None:
+        if collection_type(db, LEGACY) is not None:
+            print(f"Ya existe {LEGACY}: revisar o usar --rollback antes de migrar", file=sys.stderr)
+            return 1
+        db.payments.rename(LEGACY)
+    elif collection_type(db, LEGACY) is None:
+        db.create_collection("payments", timeseries=TIME_SERIES_OPTIONS)
+        print("No había pagos: se creó payments como serie de tiempo")
+        return 0
+
+    db.create_collection("payments", timeseries=TIME_SERIES_OPTIONS)
+    total = db[LEGACY].count_documents({})
+    copied = skipped = 0
+    batch = []
+    for doc in db[LEGACY].find({}, {"_id": 0}).sort("_id", 1).batch_size(batch_size):
+        if not doc.get("payment_date"):
+            skipped += 1
+            continue
+        batch.append(to_storage(doc))
+        if len(batch) >= batch_size:
+            db.payments.insert_many(batch, ordered=False)
+            copied += len(batch)
+            batch = []
+            print(f"{copied}/{total} pagos copiados", end="\r")
+    if batch:
+        db.payments.insert_many(batch, ordered=False)
+        copied += len(batch)
+
+    migrated = db.payments.count_documents({})
+    print(f"\n{migrated} pagos en la serie de tiempo ({skipped} sin payment_date omitidos)")
+    if migrated != total - skipped:
+        print(f"La cantidad no coincide con {LEGACY} ({total}): se conserva para revisar", file=sys.stderr)
+        return 1
+    db.system_state.update_one(
+        MARKER, {"$set": {"completed_at": datetime.now(timezone.utc), "copied": migrated}}, upsert=True
+    )
+    if drop_legacy:
+        db[LEGACY].drop()
+        print(f"{LEGACY} eliminada")
+    return 0
+
+
+def copy_missing(db, docs) -> int:
+    """Inserta en payments_legacy los pagos (formato de la API) que todavía no tiene"""
+    ids = [doc["id"] for doc in docs]
+    existing = {doc["id"] for doc in db[LEGACY].find({"id": {"$in": ids}}, {"_id": 0, "id": 1})}
+    missing = [doc for doc in docs if doc["id"] not in existing]
+    if missing:
+        db[LEGACY].insert_many(missing, ordered=False)
+    return len(missing)
+
+
+def rollback(db, batch_size: int):
+    """Vuelve a la colección normal sin perder los pagos registrados después de migrar
+
+    Antes de cambiar las colecciones copia a payments_legacy los pagos de la serie de
+    tiempo (y los que quedaron en payments_outbox) que no estén ya en ella. Si la
+    migración se hizo con --drop-legacy, payments_legacy se reconstruye completa.
+    """
+    if collection_type(db, "payments") != "timeseries":
+        print("payments no es una colección de series de tiempo: no hay nada que revertir", file=sys.stderr)
+        return 1
+    if collection_type(db, LEGACY) is None:
+        print(f"No existe {LEGACY}: se reconstruye desde la serie de tiempo")
+        db.create_collection(LEGACY)
+    db[LEGACY].create_index("id")
+
+    copied = 0
+    batch = []
+    for doc in db.payments.find({}, {"_id": 0}).batch_size(batch_size):
+        batch.append(from_storage(doc))
+        if len(batch) >= batch_size:
+            copied += copy_missing(db, batch)
+            batch = []
+    if batch:
+        copied += copy_missing(db, batch)
+
+    # Pagos confirmados que no alcanzaron a pasar del outbox (ya están en formato de la API)
+    pending = list(db.payments_outbox.find({}, {"_id": 0}))
+    if pending:
+        copied += copy_missing(db, pending)
+    print(f"{copied} pagos posteriores a la migración copiados a {LEGACY}")
+
+    db.payments.drop()
+    db[LEGACY].rename("payments")
+    db.system_state.delete_one(MARKER)
+    if pending:
+        db.payments_outbox.delete_many({"id": {"$in": [doc["id"] for doc in pending]}})
+    print("payments volvió a ser una colección normal")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME"))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop-legacy", action="store_true", help=f"borrar {LEGACY} si la copia coincide")
+    parser.add_argument("--rollback", action="store_true", help=f"restaurar payments desde {LEGACY}")
+    args = parser.parse_args()
+    if not args.mongo_url or not args.db_name:
+        parser.error("MONGO_URL y DB_NAME son obligatorios (entorno o argumentos)")
+
+    db = MongoClient(args.mongo_url)[args.db_name]
+    return rollback(db, args.batch_size) if args.rollback else migrate(db, args.batch_size, args.drop_legacy)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
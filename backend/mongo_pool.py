@@ -0,0 +1,148 @@
+"""
+Configuración del cliente de MongoDB y métricas del pool de conexiones
+Las opciones del pool, la compresión de red y los timeouts salen de variables de
+entorno. El cliente se crea al iniciar cada worker (no al importar el módulo) para
+que un proceso hijo nunca herede conexiones abiertas por el padre antes del fork.
+"""
+import os
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+
+def _env_int(name: str, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def available_compressors(requested: str) -> list:
+    """Compresores pedidos que se pueden usar; zstd y snappy son dependencias opcionales"""
+    usable = []
+    for name in [item.strip().lower() for item in requested.split(",") if item.strip()]:
+        if name == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                continue
+        elif name == "snappy":
+            try:
+                import snappy  # noqa: F401
+            except ImportError:
+                continue
+        elif name != "zlib":
+            continue
+        usable.append(name)
+    return usable
+
+
+def client_options() -> dict:
+    """Opciones de AsyncIOMotorClient a partir del entorno (valores por worker)"""
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 60000),
+        # Límite de conexiones que se abren a la vez: evita tormentas al arrancar workers
+        "maxConnecting": _env_int("MONGO_MAX_CONNECTING", 2),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 60000),
+    }
+    compressors = available_compressors(os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib"))
+    if compressors:
+        options["compressors"] = compressors
+        if "zlib" in compressors:
+            options["zlibCompressionLevel"] = _env_int("MONGO_ZLIB_LEVEL", 6)
+    return options
+
+
+def reporting_read_preference():
+    """Preferencia de lectura para reportes y analítica
+    
+    Por defecto secondaryPreferred con un retraso máximo de réplica (MongoDB exige al
+    menos 90 segundos); REPORTING_READ_PREFERENCE=primary la desactiva. Sin replica set
+    el driver usa el primario, así que no cambia nada en un servidor standalone.
+    """
+    if os.environ.get("REPORTING_READ_PREFERENCE", "secondaryPreferred").lower() == "primary":
+        return Primary()
+    max_staleness = max(_env_int("REPORTING_MAX_STALENESS_SECONDS", 120), 90)
+    return SecondaryPreferred(max_staleness=max_staleness)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Cuenta conexiones en uso y solicitudes esperando un hueco del pool"""
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.peak_checked_out = 0
+        self.peak_waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "max_pool_size": self.max_pool_size,
+            "open_connections": self.open,
+            "checked_out": self.checked_out,
+            "waiting": self.waiting,
+            "saturation": round(self.checked_out / self.max_pool_size, 4) if self.max_pool_size else 0.0,
+            "peak_checked_out": self.peak_checked_out,
+            "peak_waiting": self.peak_waiting,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+    def connection_check_out_started(self, event):
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+    def connection_checked_out(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checked_out += 1
+        self.checkouts += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_check_out_failed(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open = max(0, self.open - 1)
+
+    def pool_cleared(self, event):
+        self.pool_clears += 1
+
+    # Eventos sin efecto en las métricas
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+def create_client(mongo_url: str):
+    """Crea el cliente con las opciones del entorno; devuelve (cliente, métricas del pool)"""
+    options = client_options()
+    metrics = PoolMetrics(options["maxPoolSize"])
+    return AsyncIOMotorClient(mongo_url, event_listeners=[metrics], **options), metrics
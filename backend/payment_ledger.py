@@ -0,0 +1,218 @@
+"""
+Acceso al libro de pagos con la colección payments normal o de series de tiempo
+En modo series de tiempo payment_date se guarda como fecha BSON (campo de tiempo)
+y loan_id/client_id dentro de meta (metaField). Esta capa traduce filtros, pipelines
+y documentos para que las rutas sigan viendo el formato de siempre: loan_id y
+client_id en la raíz y payment_date como cadena ISO.
+
+MongoDB no permite escribir en series de tiempo dentro de una transacción: los
+pagos se insertan en payments_outbox (colección normal, dentro de la transacción)
+y flush los pasa a payments después de confirmar. Si el proceso cae entre ambos
+pasos, el flush del arranque los recupera.
+"""
+from datetime import datetime, timezone
+
+META_FIELDS = ("loan_id", "client_id")
+TIME_FIELD = "payment_date"
+
+# Opciones de create_collection para payments en modo series de tiempo
+TIME_SERIES_OPTIONS = {
+    "timeField": TIME_FIELD,
+    "metaField": "meta",
+    "granularity": "hours",
+}
+
+
+def _to_datetime(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def to_storage(doc: dict) -> dict:
+    """Documento de la API -> documento de la colección de series de tiempo"""
+    stored = {key: value for key, value in doc.items() if key not in META_FIELDS}
+    stored["meta"] = {field: doc.get(field) for field in META_FIELDS}
+    stored[TIME_FIELD] = _to_datetime(doc[TIME_FIELD])
+    return stored
+
+
+def from_storage(doc: dict) -> dict:
+    """Documento de la colección de series de tiempo -> formato de la API"""
+    doc = dict(doc)
+    meta = doc.pop("meta", None) or {}
+    for field in META_FIELDS:
+        if field in meta:
+            doc[field] = meta[field]
+    if isinstance(doc.get(TIME_FIELD), datetime):
+        doc[TIME_FIELD] = _to_datetime(doc[TIME_FIELD]).isoformat()
+    return doc
+
+
+def _translate_value(field: str, value):
+    if field != TIME_FIELD:
+        return value
+    if isinstance(value, dict):
+        return {op: [_to_datetime(item) for item in operand] if isinstance(operand, list) else _to_datetime(operand)
+                for op, operand in value.items()}
+    return _to_datetime(value)
+
+
+def translate_filter(query: dict) -> dict:
+    """Filtro sobre campos de la API -> filtro sobre meta.* y fechas BSON"""
+    translated = {}
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor"):
+            translated[key] = [translate_filter(item) for item in value]
+        elif key in META_FIELDS:
+            translated[f"meta.{key}"] = value
+        else:
+            translated[key] = _translate_value(key, value)
+    return translated
+
+
+def _translate_refs(value):
+    if isinstance(value, str) and value.startswith("$") and value[1:] in META_FIELDS:
+        return f"$meta.{value[1:]}"
+    if isinstance(value, dict):
+        return {key: _translate_refs(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_translate_refs(item) for item in value]
+    return value
+
+
+def translate_pipeline(pipeline: list) -> list:
+    """Traduce los $match y las referencias $loan_id / $client_id de un pipeline"""
+    translated = []
+    for stage in pipeline:
+        if "$match" in stage:
+            translated.append({"$match": translate_filter(stage["$match"])})
+        else:
+            translated.append(_translate_refs(stage))
+    return translated
+
+
+async def is_time_series(database) -> bool:
+    """True si la colección payments de database es de series de tiempo"""
+    collections = await database.list_collections(filter={"name": "payments"}).to_list(None)
+    return bool(collections) and collections[0].get("type") == "timeseries"
+
+
+class PaymentLedger:
+    def __init__(self, database, time_series: bool, outbox_database=None):
+        self.time_series = time_series
+        self.collection = database.payments
+        # El outbox se lee y escribe siempre en el primario
+        self.outbox = (outbox_database if outbox_database is not None else database).payments_outbox
+
+    async def insert_many(self, docs: list, session=None):
+        if not docs:
+            return
+        target = self.outbox if self.time_series else self.collection
+        await target.insert_many([dict(doc) for doc in docs], ordered=False, session=session)
+
+    async def insert_one(self, doc: dict, session=None):
+        await self.insert_many([doc], session=session)
+
+    async def flush(self, ids: list = None) -> int:
+        """Pasa los pagos del outbox a la serie de tiempo (todos si ids es None)"""
+        if not self.time_series:
+            return 0
+        query = {"id": {"$in": ids}} if ids is not None else {}
+        pending = await self.outbox.find(query, {"_id": 0}).to_list(None)
+        if not pending:
+            return 0
+        # Un flush anterior pudo insertar y caer antes de borrar: no duplicar
+        dates = [_to_datetime(doc[TIME_FIELD]) for doc in pending]
+        existing = await self.collection.find(
+            {"id": {"$in": [doc["id"] for doc in pending]}, TIME_FIELD: {"$gte": min(dates), "$lte": max(dates)}},
+            {"_id": 0, "id": 1}
+        ).to_list(None)
+        existing_ids = {doc["id"] for doc in existing}
+        new_docs = [to_storage(doc) for doc in pending if doc["id"] not in existing_ids]
+        if new_docs:
+            await self.collection.insert_many(new_docs, ordered=False)
+        await self.outbox.delete_many({"id": {"$in": [doc["id"] for doc in pending]}})
+        return len(new_docs)
+
+    async def find(self, query: dict, projection: dict = None, length: int = None, session=None) -> list:
+        projection = projection or {"_id": 0}
+        if not self.time_series:
+            return await self.collection.find(query, projection, session=session).to_list(length)
+        docs = await self.collection.find(
+            translate_filter(query), _storage_projection(projection), session=session
+        ).to_list(length)
+        docs = [from_storage(doc) for doc in docs]
+        # Pagos confirmados que todavía no pasaron del outbox
+        docs += await self.outbox.find(query, projection, session=session).to_list(length)
+        return docs
+
+    async def iterate(self, query: dict, projection: dict = None, batch_size: int = 1000):
+        """Como find pero con un cursor por lotes (exportaciones sin cargar todo en memoria)"""
+        projection = projection or {"_id": 0}
+        if not self.time_series:
+            async for doc in self.collection.find(query, projection).batch_size(batch_size):
+                yield doc
+            return
+        async for doc in self.collection.find(translate_filter(query), _storage_projection(projection)).batch_size(batch_size):
+            yield from_storage(doc)
+        async for doc in self.outbox.find(query, projection).batch_size(batch_size):
+            yield doc
+
+    async def aggregate(self, pipeline: list, session=None, **kwargs) -> list:
+        """Agrega sobre payments y, en series de tiempo, también sobre el outbox
+
+        Si el pipeline termina en un $group que solo usa $sum, las filas de ambas
+        colecciones con el mismo _id se combinan; si no, se concatenan como en find.
+        """
+        if not self.time_series:
+            return await self.collection.aggregate(pipeline, session=session, **kwargs).to_list(None)
+        rows = await self.collection.aggregate(translate_pipeline(pipeline), session=session, **kwargs).to_list(None)
+        # Pagos confirmados que todavía no pasaron del outbox
+        pending = await self.outbox.aggregate(pipeline, session=session, **kwargs).to_list(None)
+        if not pending:
+            return rows
+        group = pipeline[-1].get("$group") if pipeline else None
+        if group is None or not _mergeable_group(group):
+            return rows + pending
+        return _merge_groups(group, rows + pending)
+
+    async def delete_many(self, query: dict):
+        if self.time_series:
+            await self.outbox.delete_many(query)
+            return await self.collection.delete_many(translate_filter(query))
+        return await self.collection.delete_many(query)
+
+
+def _mergeable_group(group: dict) -> bool:
+    # Solo $sum: con $min/$max payment_date sería fecha BSON en un lado y cadena en el otro
+    return all(
+        isinstance(accumulator, dict) and list(accumulator) == ["$sum"]
+        for field, accumulator in group.items() if field != "_id"
+    )
+
+
+def _merge_groups(group: dict, rows: list) -> list:
+    """Combina filas de un mismo $group calculado sobre colecciones distintas"""
+    merged = {}
+    for row in rows:
+        key = repr(row["_id"])
+        if key not in merged:
+            merged[key] = dict(row)
+            continue
+        for field in group:
+            if field != "_id":
+                merged[key][field] += row[field]
+    return list(merged.values())
+
+
+def _storage_projection(projection: dict) -> dict:
+    translated = {}
+    for key, value in projection.items():
+        if key in META_FIELDS:
+            translated["meta"] = value
+        else:
+            translated[key] = value
+    return translated
@@ -0,0 +1,219 @@
+"""
+Analítica de cartera: días de mora (DPD), cartera en riesgo (PAR) y
+proyección de flujo de caja
+Los agrupamientos se hacen en MongoDB y los indicadores se calculan con pandas
+de forma vectorizada sobre tablas pequeñas (un registro por préstamo o periodo)
+"""
+from datetime import datetime, timezone
+
+import pandas as pd
+
+PAR_THRESHOLDS = [1, 7, 30, 90]
+
+
+def par_snapshot_pipeline(unpaid_statuses: list, active_status: str) -> list:
+    """Una fila por préstamo activo: saldo pendiente y cuota impaga más antigua"""
+    return [
+        {"$match": {"status": {"$in": unpaid_statuses}}},
+        {"$group": {
+            "_id": "$loan_id",
+            "outstanding": {"$sum": "$amount"},
+            "oldest_due": {"$min": "$due_date"}
+        }},
+        {"$lookup": {
+            "from": "loans",
+            "localField": "_id",
+            "foreignField": "id",
+            "as": "loan"
+        }},
+        {"$unwind": "$loan"},
+        {"$match": {"loan.status": active_status}},
+        {"$project": {
+            "_id": 0,
+            "loan_id": "$_id",
+            "outstanding": 1,
+            "oldest_due": 1,
+            "lender_id": "$loan.lender_id",
+            "lender_name": "$loan.lender_name",
+            "payment_frequency": "$loan.payment_frequency"
+        }}
+    ]
+
+
+def _summarize(frame: pd.DataFrame) -> dict:
+    outstanding = int(frame["outstanding"].sum())
+    summary = {
+        "loans_count": int(len(frame)),
+        "outstanding": outstanding,
+        "loans_in_arrears": int((frame["dpd"] > 0).sum()),
+    }
+    for threshold in PAR_THRESHOLDS:
+        at_risk = int(frame[f"risk_{threshold}"].sum())
+        summary[f"par{threshold}_amount"] = at_risk
+        summary[f"par{threshold}"] = round(at_risk / outstanding * 100, 2) if outstanding else 0.0
+    return summary
+
+
+def _summarize_groups(frame: pd.DataFrame, keys: list) -> list:
+    sums = frame.groupby(keys, dropna=False).agg(
+        loans_count=("loan_id", "size"),
+        outstanding=("outstanding", "sum"),
+        loans_in_arrears=("in_arrears", "sum"),
+        **{f"par{t}_amount": (f"risk_{t}", "sum") for t in PAR_THRESHOLDS}
+    ).reset_index()
+    for threshold in PAR_THRESHOLDS:
+        sums[f"par{threshold}"] = (
+            (sums[f"par{threshold}_amount"] / sums["outstanding"].where(sums["outstanding"] > 0) * 100)
+            .fillna(0.0)
+            .round(2)
+        )
+    sums = sums.sort_values("outstanding", ascending=False)
+    sums = sums.astype(object).where(sums.notna(), None)
+    rows = sums.to_dict(orient="records")
+    for row in rows:
+        for field in ["loans_count", "outstanding", "loans_in_arrears"] + [f"par{t}_amount" for t in PAR_THRESHOLDS]:
+            row[field] = int(row[field])
+    return rows
+
+
+def build_par_report(rows: list, as_of: datetime) -> dict:
+    """Calcula DPD y PAR1/7/30/90 global, por prestamista y por frecuencia de pago"""
+    columns = ["loan_id", "outstanding", "oldest_due", "lender_id", "lender_name", "payment_frequency"]
+    frame = pd.DataFrame(rows, columns=columns)
+
+    # Días calendario desde la cuota impaga más antigua
+    oldest_due = pd.to_datetime(frame["oldest_due"], utc=True, format="ISO8601", errors="coerce").dt.normalize()
+    today = pd.Timestamp(as_of).normalize()
+    frame["dpd"] = (today - oldest_due).dt.days.clip(lower=0).fillna(0).astype(int)
+    frame["in_arrears"] = (frame["dpd"] > 0).astype(int)
+    frame["outstanding"] = frame["outstanding"].fillna(0).astype("int64")
+    for threshold in PAR_THRESHOLDS:
+        frame[f"risk_{threshold}"] = frame["outstanding"].where(frame["dpd"] > threshold, 0)
+
+    return {
+        "as_of": as_of.date().isoformat(),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "thresholds": PAR_THRESHOLDS,
+        "overall": _summarize(frame),
+        "by_lender": _summarize_groups(frame, ["lender_id", "lender_name"]),
+        "by_frequency": _summarize_groups(frame, ["payment_frequency"]),
+    }
+
+
+# Expresiones para agrupar due_date (cadena ISO) por periodo
+PERIOD_EXPRESSIONS = {
+    "day": {"$substr": ["$due_date", 0, 10]},
+    "week": {"$dateToString": {"format": "%G-W%V", "date": {"$dateFromString": {"dateString": "$due_date"}}}},
+    "month": {"$substr": ["$due_date", 0, 7]},
+}
+
+
+def cash_flow_pipeline(unpaid_statuses: list, start: str, end: str, granularity: str,
+                       lender_id: str = None) -> list:
+    """Cuotas impagas con vencimiento en [start, end) sumadas por prestamista y periodo"""
+    match = {"status": {"$in": unpaid_statuses}, "due_date": {"$gte": start, "$lt": end}}
+    if lender_id:
+        match["lender_id"] = lender_id
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"lender_id": "$lender_id", "period": PERIOD_EXPRESSIONS[granularity]},
+            "amount": {"$sum": "$amount"},
+            "installments": {"$sum": 1}
+        }},
+        # Solo queda un grupo por prestamista y periodo: el $lookup del nombre es barato
+        {"$lookup": {
+            "from": "users",
+            "localField": "_id.lender_id",
+            "foreignField": "id",
+            "as": "lender"
+        }},
+        {"$project": {
+            "_id": 0,
+            "lender_id": "$_id.lender_id",
+            "lender_name": {"$arrayElemAt": ["$lender.name", 0]},
+            "period": "$_id.period",
+            "amount": 1,
+            "installments": 1
+        }}
+    ]
+
+
+def collection_rate_pipeline(paid_status: str, unpaid_statuses: list, start: str, end: str) -> list:
+    """Fracción del monto vencido en [start, end) que ya fue pagada, por prestamista
+
+    amount es lo que falta de la cuota (un pago parcial lo reduce); lo vencido es
+    installment_amount y lo pagado de una cuota impaga es la diferencia. Las cuotas
+    creadas antes de installment_amount solo cuentan su amount.
+    """
+    installment = {"$ifNull": ["$installment_amount", "$amount"]}
+    # status primero: el rango sobre due_date usa el índice (status, due_date)
+    return [
+        {"$match": {
+            "status": {"$in": [paid_status, *unpaid_statuses]},
+            "due_date": {"$gte": start, "$lt": end}
+        }},
+        {"$group": {
+            "_id": "$lender_id",
+            "due": {"$sum": installment},
+            "paid": {"$sum": {"$cond": [
+                {"$eq": ["$status", paid_status]},
+                installment,
+                {"$subtract": [installment, "$amount"]}
+            ]}}
+        }},
+        {"$project": {"_id": 0, "lender_id": "$_id", "due": 1, "paid": 1}}
+    ]
+
+
+def collection_rates(rows: list) -> dict:
+    """Tasa de recaudo histórica global y por prestamista (1.0 si no hay historia)"""
+    total_due = sum(row["due"] for row in rows)
+    total_paid = sum(row["paid"] for row in rows)
+    overall = round(total_paid / total_due, 4) if total_due else 1.0
+    by_lender = {
+        row["lender_id"]: round(row["paid"] / row["due"], 4) if row["due"] else overall
+        for row in rows
+    }
+    return {"overall": overall, "by_lender": by_lender}
+
+
+def build_cash_flow_projection(rows: list, rates: dict = None) -> dict:
+    """Arma la proyección total y por prestamista; aplica el descuento por recaudo si hay tasas"""
+    columns = ["lender_id", "lender_name", "period", "amount", "installments"]
+    frame = pd.DataFrame(rows, columns=columns)
+    frame["amount"] = frame["amount"].fillna(0).astype("int64")
+    frame["installments"] = frame["installments"].fillna(0).astype("int64")
+    if rates:
+        rate = frame["lender_id"].map(rates["by_lender"]).fillna(rates["overall"]).astype(float)
+        frame["expected"] = (frame["amount"] * rate).round().astype("int64")
+    else:
+        frame["expected"] = frame["amount"]
+
+    totals = frame.groupby("period", sort=True)[["amount", "installments", "expected"]].sum().reset_index()
+    by_lender = []
+    for (lender_id, lender_name), group in frame.sort_values("period").groupby(
+            ["lender_id", "lender_name"], dropna=False, sort=False):
+        by_lender.append({
+            "lender_id": None if pd.isna(lender_id) else lender_id,
+            "lender_name": None if pd.isna(lender_name) else lender_name,
+            "amount": int(group["amount"].sum()),
+            "expected": int(group["expected"].sum()),
+            "buckets": [
+                {"period": period, "amount": int(amount), "installments": int(installments), "expected": int(expected)}
+                for period, amount, installments, expected in zip(
+                    group["period"], group["amount"], group["installments"], group["expected"])
+            ]
+        })
+    by_lender.sort(key=lambda item: item["amount"], reverse=True)
+
+    return {
+        "total_amount": int(frame["amount"].sum()),
+        "total_expected": int(frame["expected"].sum()),
+        "buckets": [
+            {"period": period, "amount": int(amount), "installments": int(installments), "expected": int(expected)}
+            for period, amount, installments, expected in zip(
+                totals["period"], totals["amount"], totals["installments"], totals["expected"])
+        ],
+        "by_lender": by_lender,
+    }
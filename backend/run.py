@@ -0,0 +1,32 @@
+"""
+Punto de entrada para producción: uvicorn, con un worker por defecto
+Cada worker importa server.py por su cuenta y crea su cliente de MongoDB en el
+evento de arranque, así ningún proceso comparte sockets heredados del padre.
+Con más de un worker el feed SSE pasa por la colección capped events
+(EVENT_FANOUT=mongo) para que cada cliente vea los eventos de todos los workers.
+
+    python run.py
+    API_WORKERS=4 MONGO_MAX_POOL_SIZE=25 python run.py
+"""
+import os
+
+import uvicorn
+
+
+def worker_count() -> int:
+    return int(os.environ.get("API_WORKERS") or os.environ.get("WEB_CONCURRENCY") or 1)
+
+
+if __name__ == "__main__":
+    workers = worker_count()
+    if workers > 1:
+        # Los workers heredan el entorno: el bus en memoria no llega a los demás
+        os.environ.setdefault("EVENT_FANOUT", "mongo")
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", 8001)),
+        workers=workers,
+        proxy_headers=True,
+        timeout_keep_alive=int(os.environ.get("KEEP_ALIVE_SECONDS", 5)),
+    )
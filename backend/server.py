@@ -1,34 +1,140 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, Request, UploadFile, File, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany, UpdateOne, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from typing import List, Optional
 import uuid
+import random
+import hashlib
+import json
+import time
+import csv
+import io
 from datetime import datetime, timezone, timedelta
+from functools import partial
+from dateutil.relativedelta import relativedelta
 import bcrypt
 import jwt
 from enum import Enum
+from loan_math import (
+    calculate_loan, interest_for_payment, allocate_payment,
+    remaining_after_allocation, balance_snapshot
+)
+from job_runner import JobRunner
+from leader_lease import LeaderLease
+from event_bus import EventBus, format_sse
+from compression import CompressionMiddleware
+from mongo_pool import create_client, reporting_read_preference
+from payment_ledger import PaymentLedger, TIME_SERIES_OPTIONS, is_time_series
+from data_export import (
+    EXPORT_DATASETS, EXPORT_FORMATS, parquet_available,
+    dataset_filter, iterate_dataset, csv_stream, parquet_stream
+)
+from portfolio_analytics import (
+    par_snapshot_pipeline, build_par_report,
+    cash_flow_pipeline, collection_rate_pipeline, collection_rates, build_cash_flow_projection
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection: el cliente se crea en el arranque de cada worker (ver connect_mongo)
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client = None
+db = None
+# Misma base con lectura en secundarios: solo para reportes y analítica (ver connect_mongo)
+reporting_db = None
+pool_metrics = None
+
+# Almacenamiento de payments: standard o timeseries (se crea así si todavía no existe;
+# una colección existente se convierte con migrate_payments.py)
+PAYMENTS_STORAGE = os.environ.get('PAYMENTS_STORAGE', 'standard').lower()
+payments_time_series = False
+
+# Transacciones multi-documento: auto (detectar replica set), on u off
+MONGO_TRANSACTIONS = os.environ.get('MONGO_TRANSACTIONS', 'auto').lower()
+transactions_supported = None
+
+# Idempotency-Key: cuánto se guarda la respuesta y cuánto puede tardar una solicitud en curso
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 60 * 60 * 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+# Reintentos de una operación cuando otra modificó el mismo préstamo en paralelo
+OCC_MAX_RETRIES = int(os.environ.get('OCC_MAX_RETRIES', 5))
+
+# Comentario keep-alive del feed SSE para que proxies no cierren la conexión
+SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+# Eventos SSE entre procesos: memory (un solo worker) o mongo (colección capped events)
+EVENT_FANOUT = os.environ.get('EVENT_FANOUT', 'memory').lower()
+EVENTS_CAPPED_BYTES = int(os.environ.get('EVENTS_CAPPED_BYTES', 16 * 1024 * 1024))
+
+# Cache-Control de las lecturas con ETag: el navegador guarda la respuesta pero
+# revalida siempre (If-None-Match), así los cambios se ven de inmediato
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+# Compresión de respuestas: tamaño mínimo en bytes y niveles (brotli es opcional)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+
+# Trabajos administrativos en segundo plano que corren a la vez
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+
+# Tamaño de lote para actualizaciones masivas
+BULK_CHUNK_SIZE = 1000
+# Límite de filas por carga masiva de pagos
+BULK_PAYMENT_MAX_ROWS = int(os.environ.get('BULK_PAYMENT_MAX_ROWS', 20000))
+# Préstamos por transacción en la aprobación masiva
+BULK_APPROVE_CHUNK_SIZE = 200
+
+# Archivo: préstamos cerrados hace más de estos meses salen de las colecciones activas
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 12))
+# Préstamos por lote al archivar (con sus cuotas y pagos)
+ARCHIVE_BATCH_SIZE = 500
+
+# Exportaciones: documentos por lote del cursor, filas por bloque CSV y por row group Parquet
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 2000))
+EXPORT_CSV_CHUNK_ROWS = int(os.environ.get('EXPORT_CSV_CHUNK_ROWS', 5000))
+EXPORT_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_ROW_GROUP_SIZE', 50000))
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+# Cuánto se reutiliza un usuario verificado sin volver a leerlo de la base
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_CACHE_TTL_SECONDS', 60))
+# Rutas accesibles sin token (login, registro y calculadora pública)
+PUBLIC_ROUTES = {
+    ("POST", "/api/auth/register"),
+    ("POST", "/api/auth/login"),
+    ("GET", "/api/config/system"),
+    ("POST", "/api/loans/calculate"),
+}
+ADMIN_PATH_PREFIXES = ("/api/admin/", "/api/bundles/admin-dashboard")
+
+# Barrido de cuotas vencidas (LATE / OVERDUE)
+SCHEDULE_SWEEP_INTERVAL_SECONDS = int(os.environ.get('SCHEDULE_SWEEP_INTERVAL_SECONDS', 900))
+OVERDUE_AFTER_DAYS = int(os.environ.get('OVERDUE_AFTER_DAYS', 30))
+# Cuotas que el barrido lee y actualiza por lote
+SCHEDULE_SWEEP_BATCH_SIZE = 5000
+# Con varios workers solo el que tiene el lease corre el barrido y los trabajos
+BACKGROUND_LEASE_SECONDS = int(os.environ.get('BACKGROUND_LEASE_SECONDS', 30))
 
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
+job_runner = JobRunner(concurrency=JOB_CONCURRENCY)
+event_bus = EventBus()
+background_lease = LeaderLease("background_tasks", BACKGROUND_LEASE_SECONDS)
 
 # Enums
 class UserRole(str, Enum):
@@ -50,6 +156,9 @@ class PaymentStatus(str, Enum):
     LATE = "late"
     OVERDUE = "overdue"
 
+# Estados de cuota que todavía tienen saldo por cobrar
+UNPAID_STATUSES = [PaymentStatus.PENDING, PaymentStatus.LATE, PaymentStatus.OVERDUE]
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -63,6 +172,12 @@ class User(BaseModel):
     active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class AuthenticatedUser(BaseModel):
+    id: str
+    email: str
+    name: str
+    role: UserRole
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
@@ -81,6 +196,17 @@ class Token(BaseModel):
     token_type: str
     user: User
 
+class LoanBalance(BaseModel):
+    """Saldo mantenido en el préstamo con cada pago (evita sumar cuotas y pagos al leer)"""
+    outstanding: int
+    total_paid: int = 0
+    paid_count: int = 0
+    schedule_count: int = 0
+    payment_count: int = 0
+    next_payment_number: Optional[int] = None
+    next_due_date: Optional[datetime] = None
+    next_due_amount: Optional[int] = None
+
 class Loan(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -106,6 +232,9 @@ class Loan(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     approved_at: Optional[datetime] = None
     start_date: Optional[datetime] = None
+    version: int = 0  # Se incrementa en cada escritura: control de concurrencia optimista y ETag
+    closed_at: Optional[datetime] = None  # Cuándo pasó a completado o rechazado (para archivar)
+    balance: Optional[LoanBalance] = None  # Se crea al aprobar y se actualiza con cada pago
 
 class LoanCreate(BaseModel):
     amount: int
@@ -119,6 +248,14 @@ class LoanApproval(BaseModel):
     lender_id: str
     start_date: datetime
 
+class BulkApprovalItem(BaseModel):
+    loan_id: str
+    start_date: datetime
+
+class BulkLoanApproval(BaseModel):
+    lender_id: str
+    loans: List[BulkApprovalItem]
+
 class Payment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -134,15 +271,26 @@ class PaymentCreate(BaseModel):
     amount: int
     notes: Optional[str] = None
 
+class BulkPaymentRow(BaseModel):
+    loan_id: str
+    amount: int
+    client_id: Optional[str] = None  # Por defecto el cliente del préstamo
+    notes: Optional[str] = None
+
+class BulkPaymentImport(BaseModel):
+    payments: List[BulkPaymentRow]
+
 class PaymentSchedule(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     loan_id: str
     client_id: str
     client_name: str
+    lender_id: Optional[str] = None  # Denormalizado desde el préstamo para consultas por prestamista
     payment_number: int
     due_date: datetime
-    amount: int
+    amount: int  # Monto pendiente: un pago parcial lo reduce
+    installment_amount: Optional[int] = None  # Monto original de la cuota
     status: PaymentStatus
     paid_date: Optional[datetime] = None
 
@@ -181,76 +329,491 @@ def create_token(user_id: str) -> str:
     to_encode = {"sub": user_id, "exp": expire}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def calculate_loan(amount: int, interest_rate: float, term_months: int, payment_frequency_days: int = 30, 
-                   system_fee_percentage: float = 0.5, insurance_fee_percentage: float = 1.0) -> dict:
+class UserCache:
+    """Usuarios verificados en memoria durante un TTL corto
+    
+    Evita un users.find_one por solicitud. Las escrituras que cambian rol, datos o
+    estado activo invalidan la entrada; con varios workers cada uno tiene su caché y
+    el TTL acota cuánto tarda en verse un cambio hecho en otro worker.
+    """
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+    
+    def get(self, user_id: str) -> Optional[AuthenticatedUser]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(user_id, None)
+            return None
+        return user
+    
+    def set(self, user: AuthenticatedUser):
+        self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+    
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+user_cache = UserCache(AUTH_CACHE_TTL_SECONDS)
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def auth_error(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+async def authenticate(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> Optional[AuthenticatedUser]:
+    """Dependencia global: verifica el JWT y deja el usuario en request.state.user"""
+    path = request.url.path
+    if (request.method, path) in PUBLIC_ROUTES:
+        return None
+    
+    token = credentials.credentials if credentials else None
+    if token is None and path == "/api/events/stream":
+        # EventSource no permite encabezados: el token viaja en la query
+        token = request.query_params.get("token")
+    if not token:
+        raise auth_error("No autenticado")
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise auth_error("La sesión expiró, inicie sesión de nuevo")
+    except jwt.InvalidTokenError:
+        raise auth_error("Token inválido")
+    
+    user_id = payload.get("sub")
+    user = user_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one(
+            {"id": user_id},
+            {"_id": 0, "id": 1, "email": 1, "name": 1, "role": 1, "active": 1}
+        )
+        if not user_doc or not user_doc.get("active", True):
+            raise auth_error("Usuario inactivo o inexistente")
+        user = AuthenticatedUser(**user_doc)
+        user_cache.set(user)
+    
+    if path.startswith(ADMIN_PATH_PREFIXES) and user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Se requiere rol de administrador")
+    
+    request.state.user = user
+    return user
+
+def current_user(request: Request) -> AuthenticatedUser:
+    """Usuario autenticado de la solicitud (para usar con Depends)"""
+    return request.state.user
+
+def ensure_self_or_admin(user: AuthenticatedUser, user_id: str):
+    if user.role != UserRole.ADMIN and user.id != user_id:
+        raise HTTPException(status_code=403, detail="No tiene acceso a los datos de otro usuario")
+
+def require_roles(*roles: UserRole):
+    """Dependencia que exige uno de los roles; devuelve el usuario autenticado"""
+    def dependency(request: Request) -> AuthenticatedUser:
+        user = request.state.user
+        if user.role not in roles:
+            raise HTTPException(status_code=403, detail="No tiene permiso para esta operación")
+        return user
+    return dependency
+
+require_admin = require_roles(UserRole.ADMIN)
+# Administradores y prestamistas (cobro, cuotas, hoja de ruta)
+require_staff = require_roles(UserRole.ADMIN, UserRole.LENDER)
+
+def ensure_loan_access(user: AuthenticatedUser, loan: dict):
+    """El admin accede a todo; el cliente a sus préstamos y el prestamista a los asignados"""
+    if user.role == UserRole.ADMIN:
+        return
+    if user.role == UserRole.CLIENT and loan.get("client_id") == user.id:
+        return
+    if user.role == UserRole.LENDER and loan.get("lender_id") == user.id:
+        return
+    raise HTTPException(status_code=403, detail="No tiene acceso a este préstamo")
+
+async def find_assignable_lender(lender_id: str, session=None) -> dict:
+    """Prestamista al que se asigna un préstamo (404 si no existe, 400 si no es prestamista)"""
+    lender = await db.users.find_one({"id": lender_id}, {"_id": 0}, session=session)
+    if not lender:
+        raise HTTPException(status_code=404, detail="Lender not found")
+    if lender["role"] != UserRole.LENDER:
+        raise HTTPException(status_code=400, detail="El usuario asignado debe ser prestamista")
+    return lender
+
+def build_schedule_docs(loan: dict, start_date: datetime, lender_id: Optional[str]) -> List[dict]:
+    """Documentos del cronograma de pagos de un préstamo que se activa"""
+    return build_schedule_docs_many([(loan, start_date, lender_id)])
+
+def build_schedule_docs_many(items: list, now: Optional[datetime] = None) -> List[dict]:
+    """Cronogramas de varios préstamos (loan, start_date, lender_id) en una sola pasada
+    
+    Arma los documentos directamente con la forma de PaymentSchedule, sin validar un
+    modelo por cuota, para que aprobar lotes grandes no sea dominado por pydantic.
+    """
+    now = now or datetime.now(timezone.utc)
+    docs = []
+    for loan, start_date, lender_id in items:
+        # Días entre pagos según la forma de pago del préstamo
+        step = timedelta(days=loan.get("payment_frequency_days", 30))
+        for i in range(1, loan["term_months"] + 1):
+            due_date = start_date + step * i
+            docs.append({
+                "id": str(uuid.uuid4()),
+                "loan_id": loan["id"],
+                "client_id": loan["client_id"],
+                "client_name": loan["client_name"],
+                "lender_id": lender_id,
+                "payment_number": i,
+                "due_date": due_date.isoformat(),
+                "amount": loan["monthly_payment"],
+                "installment_amount": loan["monthly_payment"],
+                "status": schedule_status_for_due_date(due_date, now),
+                "paid_date": None
+            })
+    return docs
+
+def initial_balance(schedule_docs: List[dict]) -> dict:
+    """Saldo de un préstamo recién aprobado: todas sus cuotas por cobrar"""
+    return balance_snapshot(schedule_docs, len(schedule_docs), 0, 0, 0)
+
+async def compute_loan_balance(loan_id: str, session=None, archived: bool = False) -> dict:
+    """Recalcula loan.balance desde cuotas y pagos (préstamos anteriores al saldo guardado)"""
+    schedules_collection = db.payment_schedules_archive if archived else db.payment_schedules
+    schedules = await schedules_collection.find(
+        {"loan_id": loan_id},
+        {"_id": 0, "payment_number": 1, "due_date": 1, "amount": 1, "status": 1},
+        session=session
+    ).sort("payment_number", 1).to_list(None)
+    totals_pipeline = [
+        {"$match": {"loan_id": loan_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]
+    if archived:
+        totals = await db.payments_archive.aggregate(totals_pipeline, session=session).to_list(1)
+    else:
+        totals = await payment_ledger().aggregate(totals_pipeline, session=session)
+    totals = totals[0] if totals else {"total": 0, "count": 0}
+    unpaid = [schedule for schedule in schedules if schedule["status"] in UNPAID_STATUSES]
+    paid_count = sum(1 for schedule in schedules if schedule["status"] == PaymentStatus.PAID)
+    return balance_snapshot(unpaid, len(schedules), paid_count, totals["total"], totals["count"])
+
+async def reserve_loan_numbers(count: int, session=None) -> List[str]:
+    """Reserva count números de crédito consecutivos (YYYYMMNN) con un solo $inc
+    
+    El contador del mes vive en counters; la primera vez se inicializa con los
+    préstamos ya aprobados en el mes, como se numeraba antes. La inicialización va
+    fuera de la sesión: dentro de una transacción el choque de dos upsert abortaría
+    la transacción, fuera basta con ignorar el DuplicateKeyError. Solo el $inc
+    forma parte de la transacción del llamador.
     """
-    Calcula un préstamo con frecuencia de pago flexible y cargos adicionales
-    
-    Args:
-        amount: Monto del préstamo solicitado
-        interest_rate: Tasa de interés anual (%)
-        term_months: Cantidad de pagos a realizar
-        payment_frequency_days: Días entre cada pago
-        system_fee_percentage: Porcentaje de sistematización (default 0.5%)
-        insurance_fee_percentage: Porcentaje de seguro (default 1.0%)
-    
-    Returns:
-        dict con payment_amount, total_payments, total_amount, total_interest, fees, schedule
+    now = datetime.now(timezone.utc)
+    year_month = now.strftime("%Y%m")  # YYYYMM
+    counter_id = f"loan_number:{year_month}"
+    
+    if await db.counters.find_one({"_id": counter_id}) is None:
+        start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+        if now.month == 12:
+            end_of_month = datetime(now.year + 1, 1, 1, tzinfo=timezone.utc)
+        else:
+            end_of_month = datetime(now.year, now.month + 1, 1, tzinfo=timezone.utc)
+        approved_count = await db.loans.count_documents({
+            "approved_at": {
+                "$gte": start_of_month.isoformat(),
+                "$lt": end_of_month.isoformat()
+            },
+            "loan_number": {"$ne": None}
+        })
+        try:
+            await db.counters.update_one(
+                {"_id": counter_id},
+                {"$setOnInsert": {"seq": approved_count}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Otro proceso lo inicializó al mismo tiempo
+    
+    counter = await db.counters.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"seq": count}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    first = counter["seq"] - count + 1
+    return [f"{year_month}{consecutive:02d}" for consecutive in range(first, counter["seq"] + 1)]
+
+async def supports_transactions() -> bool:
+    """Las transacciones requieren replica set o mongos; se detecta una vez por proceso"""
+    global transactions_supported
+    if transactions_supported is None:
+        if MONGO_TRANSACTIONS in ("on", "off"):
+            transactions_supported = MONGO_TRANSACTIONS == "on"
+        else:
+            try:
+                hello = await client.admin.command("hello")
+                transactions_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+            except Exception:
+                transactions_supported = False
+    return transactions_supported
+
+async def run_in_transaction(callback):
+    """Ejecuta callback(session) en una transacción multi-documento
+    
+    with_transaction reintenta ante errores transitorios y commits de resultado
+    desconocido, por lo que callback debe hacer todas sus lecturas con la sesión.
+    En un mongod standalone se ejecuta sin sesión (session=None).
     """
-    # Calcular cargos adicionales
-    system_fee_amount = round(amount * (system_fee_percentage / 100))
-    insurance_fee_amount = round(amount * (insurance_fee_percentage / 100))
-    total_fees = system_fee_amount + insurance_fee_amount
+    if not await supports_transactions():
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
+VERSION_CONFLICT_DETAIL = "El préstamo fue modificado por otra operación, intente de nuevo"
+
+class VersionConflict(Exception):
+    """El préstamo cambió entre la lectura y la escritura"""
+
+async def claim_loan(loan: dict, update: dict, session=None):
+    """Aplica update al préstamo solo si su versión sigue siendo la que se leyó
     
-    # Monto base para calcular intereses (monto original + cargos)
-    base_amount = amount + total_fees
+    Incrementa la versión en la misma escritura; si otra operación la cambió antes
+    lanza VersionConflict para que el llamador vuelva a leer y reintente. Los
+    préstamos anteriores sin campo version coinciden con el filtro version: None.
+    """
+    result = await db.loans.update_one(
+        {"id": loan["id"], "version": loan.get("version")},
+        {**update, "$inc": {"version": 1}},
+        session=session
+    )
+    if result.matched_count == 0:
+        raise VersionConflict(loan["id"])
+
+async def run_with_version_retry(callback):
+    """run_in_transaction que vuelve a ejecutar callback ante VersionConflict"""
+    for attempt in range(OCC_MAX_RETRIES):
+        try:
+            return await run_in_transaction(callback)
+        except VersionConflict:
+            # Espera corta con jitter para no chocar de nuevo con la misma operación
+            await asyncio.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    raise HTTPException(status_code=409, detail=VERSION_CONFLICT_DETAIL)
+
+class IdempotencyRecord:
+    """Clave reservada por run_idempotent para una operación
+    
+    complete(result, session) guarda la respuesta dentro de la transacción de la
+    operación: el pago (o la aprobación) y la clave completada se confirman juntos.
+    La escritura exige que la clave siga reservada con la misma marca de tiempo; si
+    otra solicitud la retomó, falla con 409 y la transacción se aborta.
+    
+    Las operaciones que confirman en varias transacciones (la carga masiva de pagos)
+    guardan cada parte con save_progress; progress trae lo ya guardado cuando una
+    solicitud retoma la clave de otra que no terminó.
+    """
+    def __init__(self, record_id: Optional[str] = None, locked_at: Optional[datetime] = None, progress: Optional[list] = None):
+        self.record_id = record_id
+        self.locked_at = locked_at
+        self.progress = progress or []
+    
+    async def _update(self, update: dict, session=None):
+        if self.record_id is None:
+            return
+        saved = await db.idempotency_keys.update_one(
+            {"_id": self.record_id, "state": "processing", "created_at": self.locked_at},
+            update,
+            session=session
+        )
+        if saved.matched_count == 0:
+            raise HTTPException(status_code=409, detail="Una solicitud con esta Idempotency-Key aún se está procesando")
     
-    # El término "term_months" ahora representa la CANTIDAD DE PAGOS, no meses
-    total_payments = term_months
+    async def complete(self, result, session=None):
+        await self._update(
+            {"$set": {"state": "completed", "status_code": 200, "response": jsonable_encoder(result)}},
+            session=session
+        )
     
-    # Calcular tasa de interés por período según la frecuencia
-    annual_rate = interest_rate / 100
-    period_rate = annual_rate * (payment_frequency_days / 365)
+    async def save_progress(self, results: list, session=None):
+        await self._update({"$push": {"progress": {"$each": jsonable_encoder(results)}}}, session=session)
+
+async def run_idempotent(scope: str, user: AuthenticatedUser, key: Optional[str], request_body: dict, operation):
+    """Ejecuta operation(idempotency) una sola vez por Idempotency-Key y usuario
     
-    if period_rate == 0:
-        payment_amount = base_amount / total_payments
+    La primera solicitud reserva la clave en idempotency_keys (índice TTL) y la
+    operación guarda la respuesta con idempotency.complete dentro de su transacción;
+    los reintentos con la misma clave reciben esa respuesta sin volver a tocar
+    préstamos ni cuotas. Si la operación falla no queda nada guardado, así que el
+    cliente puede reintentar. La clave se separa por usuario: dos usuarios pueden
+    usar el mismo valor sin verse. Sin replica set (sin transacciones) la respuesta
+    se guarda justo después de las escrituras, no de forma atómica con ellas.
+    """
+    if not key:
+        return await operation(IdempotencyRecord())
+    
+    record_id = f"{scope}:{user.id}:{key}"
+    request_hash = hashlib.sha256(
+        json.dumps(jsonable_encoder(request_body), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    # MongoDB guarda milisegundos: la marca debe compararse igual al leerla
+    now = datetime.now(timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    
+    try:
+        await db.idempotency_keys.insert_one({
+            "_id": record_id,
+            "state": "processing",
+            "request_hash": request_hash,
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        record = await db.idempotency_keys.find_one({"_id": record_id})
+        if record is None:
+            raise HTTPException(status_code=409, detail="Idempotency-Key en uso, reintente")
+        if record["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key ya fue usada con otros datos")
+        if record["state"] == "completed":
+            return JSONResponse(
+                status_code=record["status_code"],
+                content=record["response"],
+                headers={"Idempotency-Replayed": "true"}
+            )
+        # Una solicitud en curso que no terminó (ej. el proceso se reinició) se puede
+        # retomar: si la original llega a confirmar, su complete ya no coincide y aborta
+        started_at = record["created_at"].replace(tzinfo=timezone.utc)
+        taken_over = None
+        if started_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+            # El progreso se lee en la misma escritura que retoma la clave: la solicitud
+            # original ya no puede agregar partes después
+            taken_over = await db.idempotency_keys.find_one_and_update(
+                {"_id": record_id, "state": "processing", "created_at": record["created_at"]},
+                {"$set": {"created_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+        if not taken_over:
+            raise HTTPException(status_code=409, detail="Una solicitud con esta Idempotency-Key aún se está procesando")
+        progress = taken_over.get("progress", [])
     else:
-        # Fórmula de amortización ajustada por período sobre el monto base
-        payment_amount = base_amount * (period_rate * (1 + period_rate)**total_payments) / ((1 + period_rate)**total_payments - 1)
-    
-    # Redondear a enteros
-    payment_amount = round(payment_amount)
-    total_amount = payment_amount * total_payments
-    total_interest = total_amount - base_amount
-    
-    # Generar schedule de pagos
-    schedule = []
-    balance = base_amount
-    for i in range(1, total_payments + 1):
-        interest_payment = balance * period_rate
-        principal_payment = payment_amount - interest_payment
-        balance -= principal_payment
-        schedule.append({
-            "payment_number": i,
-            "payment": payment_amount,
-            "principal": round(principal_payment),
-            "interest": round(interest_payment),
-            "balance": round(max(balance, 0))
+        progress = []
+    
+    try:
+        return await operation(IdempotencyRecord(record_id, now, progress))
+    except Exception:
+        # Liberar la clave solo si sigue reservada por esta solicitud y no confirmó
+        # ninguna parte; con progreso guardado queda reservada para retomarla
+        await db.idempotency_keys.delete_one({
+            "_id": record_id, "state": "processing", "created_at": now, "progress": {"$exists": False}
         })
-    
+        raise
+
+def make_etag(*parts) -> str:
+    """ETag fuerte a partir de las versiones que determinan la respuesta"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Respuesta 304 si If-None-Match coincide con etag (sin armar el cuerpo)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # If-None-Match usa comparación débil: W/"x" equivale a "x"
+    if "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL})
+    return None
+
+def set_cache_headers(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+
+async def get_revision(name: str) -> int:
+    """Revisión de una colección sin versión por documento (ej. usuarios)"""
+    counter = await db.counters.find_one({"_id": f"revision:{name}"})
+    return counter["seq"] if counter else 0
+
+async def bump_revision(name: str):
+    await db.counters.update_one({"_id": f"revision:{name}"}, {"$inc": {"seq": 1}}, upsert=True)
+
+RESPONSE_FORMATS = ("rows", "columnar")
+
+def to_columnar(rows: List[dict]) -> dict:
+    """Lista de dicts como arreglos paralelos (format=columnar)
+    
+    Las columnas con el mismo valor en todas las filas (loan_id, client_name...) se
+    envían una sola vez en constants. Fila i = constants + {col: columns[col][i]}.
+    """
+    keys = list(dict.fromkeys(key for row in rows for key in row))
+    columns = {key: [row.get(key) for row in rows] for key in keys}
+    constants = {}
+    if len(rows) > 1:
+        constants = {key: values[0] for key, values in columns.items() if all(value == values[0] for value in values)}
     return {
-        "payment_amount": payment_amount,
-        "total_payments": total_payments,
-        "total_amount": total_amount,
-        "total_interest": total_interest,
-        "system_fee_amount": system_fee_amount,
-        "insurance_fee_amount": insurance_fee_amount,
-        "total_fees": total_fees,
-        "base_amount": base_amount,  # Monto original + fees
-        "schedule": schedule,
-        "payment_frequency_days": payment_frequency_days
+        "format": "columnar",
+        "count": len(rows),
+        "constants": constants,
+        "columns": {key: values for key, values in columns.items() if key not in constants}
     }
 
+def check_response_format(format: Optional[str]) -> str:
+    if format and format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format} (rows o columnar)")
+    return format or "rows"
+
+def start_of_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def schedule_status_for_due_date(due_date: datetime, now: Optional[datetime] = None) -> PaymentStatus:
+    """Estado de una cuota no pagada según su fecha de vencimiento
+    
+    LATE si venció antes de hoy, OVERDUE si lleva más de OVERDUE_AFTER_DAYS vencida
+    """
+    if due_date.tzinfo is None:
+        due_date = due_date.replace(tzinfo=timezone.utc)
+    today = start_of_day(now or datetime.now(timezone.utc))
+    if due_date < today - timedelta(days=OVERDUE_AFTER_DAYS):
+        return PaymentStatus.OVERDUE
+    if due_date < today:
+        return PaymentStatus.LATE
+    return PaymentStatus.PENDING
+
+def payment_ledger(database=None) -> PaymentLedger:
+    """Libro de pagos sobre database (por defecto el primario) según el tipo de payments"""
+    return PaymentLedger(database if database is not None else db, payments_time_series, outbox_database=db)
+
+async def find_loan_with_archive(loan_id: str, projection: Optional[dict] = None, database=None):
+    """Busca el préstamo en loans y, si no está, en loans_archive; devuelve (préstamo, archivado)"""
+    database = database if database is not None else db
+    projection = projection or {"_id": 0}
+    loan = await database.loans.find_one({"id": loan_id}, projection)
+    if loan is not None:
+        return loan, False
+    loan = await database.loans_archive.find_one({"id": loan_id}, projection)
+    return loan, loan is not None
+
+async def count_loans_with_archive(query: dict, database=None) -> int:
+    """count_documents sobre loans más loans_archive (reportes que no deben bajar al archivar)"""
+    database = database if database is not None else db
+    live, archived = await asyncio.gather(
+        database.loans.count_documents(query),
+        database.loans_archive.count_documents(query)
+    )
+    return live + archived
+
+async def find_payments_with_archive(query: dict, length: int = None, database=None) -> List[dict]:
+    """Pagos del libro y de payments_archive que cumplen query"""
+    database = database if database is not None else db
+    live, archived = await asyncio.gather(
+        payment_ledger(database).find(query, {"_id": 0}, length),
+        database.payments_archive.find(query, {"_id": 0, "archived_at": 0}).to_list(length)
+    )
+    return live + archived
+
+async def find_archived_loans_for_stats(query: dict) -> List[dict]:
+    """Estado y montos de los préstamos archivados, para que las estadísticas no cambien al archivar"""
+    return await db.loans_archive.find(
+        query, {"_id": 0, "status": 1, "amount": 1, "total_amount": 1}
+    ).to_list(None)
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
@@ -259,6 +822,11 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
+    # El registro es público: solo el primer administrador se crea así, los demás
+    # los promueve un administrador desde la gestión de usuarios
+    if user_data.role == UserRole.ADMIN and await db.users.find_one({"role": UserRole.ADMIN}, {"_id": 1}):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede asignar el rol de administrador")
+    
     # Hash password
     hashed_password = hash_password(user_data.password)
     
@@ -278,6 +846,7 @@ async def register(user_data: UserCreate):
     user_doc["created_at"] = user_doc["created_at"].isoformat()
     
     await db.users.insert_one(user_doc)
+    await bump_revision("users")
     
     # Create token
     token = create_token(user.id)
@@ -303,8 +872,8 @@ async def login(credentials: UserLogin):
     return Token(access_token=token, token_type="bearer", user=user)
 
 # User Routes
-@api_router.get("/users", response_model=List[User])
-async def get_users(role: Optional[str] = None):
+async def find_users(role: Optional[str] = None) -> List[dict]:
+    """Usuarios sin contraseña, opcionalmente filtrados por rol"""
     query = {}
     if role:
         query["role"] = role
@@ -315,8 +884,31 @@ async def get_users(role: Optional[str] = None):
             user["created_at"] = datetime.fromisoformat(user["created_at"])
     return users
 
+@api_router.get("/users", response_model=List[User])
+async def get_users(
+    request: Request,
+    response: Response,
+    role: Optional[str] = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    # Toda escritura de usuarios incrementa la revisión "users"
+    etag = make_etag("users", await get_revision("users"), role)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    set_cache_headers(response, etag)
+    return await find_users(role)
+
 @api_router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
+async def get_user(user_id: str, current: AuthenticatedUser = Depends(current_user)):
+    # Un prestamista puede ver los datos de los clientes de sus préstamos
+    if current.role == UserRole.LENDER and current.id != user_id:
+        ownership = {"client_id": user_id, "lender_id": current.id}
+        if not (await db.loans.find_one(ownership, {"_id": 1})
+                or await db.loans_archive.find_one(ownership, {"_id": 1})):
+            raise HTTPException(status_code=403, detail="No tiene acceso a los datos de otro usuario")
+    else:
+        ensure_self_or_admin(current, user_id)
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -326,7 +918,8 @@ async def get_user(user_id: str):
 
 # Loan Routes
 @api_router.post("/loans/calculate", response_model=LoanCalculationResult)
-async def calculate_loan_route(data: LoanCalculation):
+async def calculate_loan_route(data: LoanCalculation, format: Optional[str] = None):
+    response_format = check_response_format(format)
     result = calculate_loan(
         data.amount, 
         data.interest_rate, 
@@ -335,10 +928,27 @@ async def calculate_loan_route(data: LoanCalculation):
         data.system_fee_percentage,
         data.insurance_fee_percentage
     )
+    if response_format == "columnar":
+        return JSONResponse({**result, "schedule": to_columnar(result["schedule"])})
     return LoanCalculationResult(**result)
 
 @api_router.post("/loans", response_model=Loan)
-async def create_loan(loan_data: LoanCreate, client_id: str, client_name: str):
+async def create_loan(
+    loan_data: LoanCreate,
+    client_id: Optional[str] = None,
+    user: AuthenticatedUser = Depends(require_roles(UserRole.CLIENT, UserRole.ADMIN))
+):
+    # El cliente solicita a su nombre; un admin puede registrar la solicitud de un cliente
+    if user.role == UserRole.CLIENT:
+        client_id, client_name = user.id, user.name
+    else:
+        if not client_id:
+            raise HTTPException(status_code=400, detail="client_id es obligatorio")
+        client = await db.users.find_one({"id": client_id, "role": UserRole.CLIENT}, {"_id": 0, "name": 1})
+        if not client:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        client_name = client["name"]
+    
     # Obtener información de la frecuencia de pago desde la configuración
     config = await db.system_config.find_one({}, {"_id": 0})
     
@@ -389,10 +999,21 @@ async def create_loan(loan_data: LoanCreate, client_id: str, client_name: str):
     loan_doc["created_at"] = loan_doc["created_at"].isoformat()
     
     await db.loans.insert_one(loan_doc)
+    event_bus.publish("loan.created", {
+        "loan_id": loan.id,
+        "client_name": client_name,
+        "amount": loan.amount,
+        "status": loan.status
+    }, client_id=client_id)
     return loan
 
-@api_router.get("/loans", response_model=List[Loan])
-async def get_loans(client_id: Optional[str] = None, lender_id: Optional[str] = None, status: Optional[str] = None):
+async def find_loans(
+    client_id: Optional[str] = None,
+    lender_id: Optional[str] = None,
+    status: Optional[str] = None,
+    include_archived: bool = False
+) -> List[dict]:
+    """Préstamos filtrados por cliente, prestamista y estado (y del archivo si se pide)"""
     query = {}
     if client_id:
         query["client_id"] = client_id
@@ -402,8 +1023,10 @@ async def get_loans(client_id: Optional[str] = None, lender_id: Optional[str] =
         query["status"] = status
     
     loans = await db.loans.find(query, {"_id": 0}).to_list(1000)
+    if include_archived:
+        loans += await db.loans_archive.find(query, {"_id": 0, "archived_at": 0}).to_list(1000)
     for loan in loans:
-        for field in ["created_at", "approved_at", "start_date"]:
+        for field in ["created_at", "approved_at", "start_date", "closed_at"]:
             if field in loan and loan[field] and isinstance(loan[field], str):
                 loan[field] = datetime.fromisoformat(loan[field])
         # Convert float amounts to integers for existing data
@@ -412,12 +1035,46 @@ async def get_loans(client_id: Optional[str] = None, lender_id: Optional[str] =
                 loan[amount_field] = round(loan[amount_field])
     return loans
 
+@api_router.get("/loans", response_model=List[Loan])
+async def get_loans(
+    client_id: Optional[str] = None,
+    lender_id: Optional[str] = None,
+    status: Optional[str] = None,
+    include_archived: bool = False,
+    user: AuthenticatedUser = Depends(current_user)
+):
+    # Clientes y prestamistas solo ven sus propios préstamos
+    if user.role == UserRole.CLIENT:
+        client_id = user.id
+    elif user.role == UserRole.LENDER:
+        lender_id = user.id
+    return await find_loans(client_id, lender_id, status, include_archived)
+
 @api_router.get("/loans/{loan_id}", response_model=Loan)
-async def get_loan(loan_id: str):
-    loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
+async def get_loan(
+    loan_id: str,
+    request: Request,
+    response: Response,
+    user: AuthenticatedUser = Depends(current_user)
+):
+    # Toda escritura sobre el préstamo incrementa version: basta leer ese campo
+    current, archived = await find_loan_with_archive(
+        loan_id, {"_id": 0, "version": 1, "client_id": 1, "lender_id": 1}
+    )
+    if not current:
+        raise HTTPException(status_code=404, detail="Loan not found")
+    ensure_loan_access(user, current)
+    etag = make_etag("loan", loan_id, current.get("version", 0))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
+    loans = db.loans_archive if archived else db.loans
+    loan = await loans.find_one({"id": loan_id}, {"_id": 0})
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
-    for field in ["created_at", "approved_at", "start_date"]:
+    set_cache_headers(response, make_etag("loan", loan_id, loan.get("version", 0)))
+    for field in ["created_at", "approved_at", "start_date", "closed_at"]:
         if field in loan and loan[field] and isinstance(loan[field], str):
             loan[field] = datetime.fromisoformat(loan[field])
     # Convert float amounts to integers for existing data
@@ -427,241 +1084,650 @@ async def get_loan(loan_id: str):
     return Loan(**loan)
 
 @api_router.post("/loans/{loan_id}/approve")
-async def approve_loan(loan_id: str, approval: LoanApproval):
-    loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
-    if not loan:
-        raise HTTPException(status_code=404, detail="Loan not found")
-    
-    # Get lender info
-    lender = await db.users.find_one({"id": approval.lender_id}, {"_id": 0})
-    if not lender:
-        raise HTTPException(status_code=404, detail="Lender not found")
-    
-    # Generar número de crédito automático: YYYYMMNN
-    now = datetime.now(timezone.utc)
-    year_month = now.strftime("%Y%m")  # YYYYMM
-    
-    # Contar préstamos aprobados este mes para obtener el consecutivo
-    start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-    if now.month == 12:
-        end_of_month = datetime(now.year + 1, 1, 1, tzinfo=timezone.utc)
-    else:
-        end_of_month = datetime(now.year, now.month + 1, 1, tzinfo=timezone.utc)
-    
-    # Contar préstamos aprobados en este mes
-    approved_count = await db.loans.count_documents({
-        "approved_at": {
-            "$gte": start_of_month.isoformat(),
-            "$lt": end_of_month.isoformat()
-        }
-    })
-    
-    # Número consecutivo (el siguiente disponible)
-    consecutive = approved_count + 1
-    loan_number = f"{year_month}{consecutive:02d}"  # Formato: YYYYMMNN
-    
-    # Update loan
-    await db.loans.update_one(
-        {"id": loan_id},
-        {"$set": {
+async def approve_loan(
+    loan_id: str,
+    approval: LoanApproval,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    approved_response = {"message": "Loan approved successfully"}
+    
+    async def approve(session, idempotency):
+        loan = await db.loans.find_one({"id": loan_id}, {"_id": 0}, session=session)
+        if not loan:
+            raise HTTPException(status_code=404, detail="Loan not found")
+        if loan["status"] != LoanStatus.PENDING:
+            raise HTTPException(status_code=400, detail="Solo se pueden aprobar préstamos pendientes")
+        
+        # Get lender info
+        lender = await find_assignable_lender(approval.lender_id, session=session)
+        
+        # Generar número de crédito automático: YYYYMMNN
+        loan_number = (await reserve_loan_numbers(1, session=session))[0]
+        schedule_docs = build_schedule_docs(loan, approval.start_date, approval.lender_id)
+        
+        # Update loan (falla si otra aprobación lo tomó primero)
+        await claim_loan(loan, {"$set": {
             "status": LoanStatus.ACTIVE,
             "lender_id": approval.lender_id,
             "lender_name": lender["name"],
             "loan_number": loan_number,
             "approved_at": datetime.now(timezone.utc).isoformat(),
-            "start_date": approval.start_date.isoformat()
-        }}
-    )
-    
-    # Create payment schedule
-    if isinstance(loan["created_at"], str):
-        loan["created_at"] = datetime.fromisoformat(loan["created_at"])
+            "start_date": approval.start_date.isoformat(),
+            "balance": initial_balance(schedule_docs)
+        }}, session=session)
+        
+        # Create payment schedule
+        await db.payment_schedules.insert_many(schedule_docs, session=session)
+        await idempotency.complete(approved_response, session=session)
+        return {"client_id": loan["client_id"], "loan_number": loan_number, "lender_name": lender["name"]}
+    
+    async def operation(idempotency):
+        # Préstamo, número, cronograma y clave de idempotencia se escriben juntos o no se escriben
+        approved = await run_with_version_retry(partial(approve, idempotency=idempotency))
+        event_bus.publish("loan.approved", {
+            "loan_id": loan_id,
+            "loan_number": approved["loan_number"],
+            "lender_name": approved["lender_name"],
+            "status": LoanStatus.ACTIVE
+        }, lender_id=approval.lender_id, client_id=approved["client_id"])
+        return approved_response
+    
+    return await run_idempotent(f"approve:{loan_id}", admin, idempotency_key, approval.model_dump(), operation)
+
+@api_router.post("/loans/bulk-approve")
+async def bulk_approve_loans(payload: BulkLoanApproval, admin: AuthenticatedUser = Depends(require_admin)):
+    """Aprueba varios préstamos pendientes de un prestamista con resultado por préstamo
+    
+    Busca al prestamista y los préstamos una vez y arma todos los cronogramas en una
+    pasada. Cada grupo se escribe en una transacción: los números de crédito se
+    reservan con un solo $inc, un bulk_write reclama los préstamos (versión y estado
+    pendiente) asignando el número en la misma escritura y sus cronogramas se
+    insertan por lotes. Un préstamo que cambió desde la lectura no se reclama y deja
+    su número sin usar. Si un grupo falla, los demás quedan aprobados.
+    """
+    lender = await find_assignable_lender(payload.lender_id)
     
-    # Obtener días entre pagos según la forma de pago del préstamo
-    payment_frequency_days = loan.get("payment_frequency_days", 30)
+    loan_ids = [item.loan_id for item in payload.loans]
+    loans = {
+        loan["id"]: loan
+        for loan in await db.loans.find({"id": {"$in": loan_ids}}, {"_id": 0}).to_list(None)
+    }
     
-    for i in range(1, loan["term_months"] + 1):
-        # Calcular fecha de vencimiento según la frecuencia de pago
-        due_date = approval.start_date + timedelta(days=payment_frequency_days * i)
-        schedule = PaymentSchedule(
-            loan_id=loan_id,
-            client_id=loan["client_id"],
-            client_name=loan["client_name"],
-            payment_number=i,
-            due_date=due_date,
-            amount=loan["monthly_payment"],
-            status=PaymentStatus.PENDING
-        )
-        schedule_doc = schedule.model_dump()
-        schedule_doc["due_date"] = schedule_doc["due_date"].isoformat()
-        await db.payment_schedules.insert_one(schedule_doc)
+    results = {}
+    to_approve = []
+    seen = set()
+    for item in payload.loans:
+        if item.loan_id in seen:
+            continue  # Un préstamo repetido se aprueba una vez, con la primera fecha
+        seen.add(item.loan_id)
+        loan = loans.get(item.loan_id)
+        if not loan:
+            results[item.loan_id] = {"loan_id": item.loan_id, "status": "error", "detail": "Loan not found"}
+        elif loan["status"] != LoanStatus.PENDING:
+            results[item.loan_id] = {"loan_id": item.loan_id, "status": "error", "detail": "Solo se pueden aprobar préstamos pendientes"}
+        else:
+            to_approve.append((item, loan))
     
-    return {"message": "Loan approved successfully"}
+    if to_approve:
+        now = datetime.now(timezone.utc)
+        approved_at = now.isoformat()
+        schedules_by_loan = {}
+        for doc in build_schedule_docs_many(
+            [(loan, item.start_date, payload.lender_id) for item, loan in to_approve], now
+        ):
+            schedules_by_loan.setdefault(doc["loan_id"], []).append(doc)
+        
+        for i in range(0, len(to_approve), BULK_APPROVE_CHUNK_SIZE):
+            chunk = to_approve[i:i + BULK_APPROVE_CHUNK_SIZE]
+            
+            async def approve_chunk(session, chunk=chunk):
+                loan_numbers = dict(zip(
+                    [loan["id"] for _, loan in chunk],
+                    await reserve_loan_numbers(len(chunk), session=session)
+                ))
+                claim = await db.loans.bulk_write([
+                    UpdateOne(
+                        {"id": loan["id"], "version": loan.get("version"), "status": LoanStatus.PENDING},
+                        {"$set": {
+                            "status": LoanStatus.ACTIVE,
+                            "lender_id": payload.lender_id,
+                            "lender_name": lender["name"],
+                            "approved_at": approved_at,
+                            "start_date": item.start_date.isoformat(),
+                            "loan_number": loan_numbers[loan["id"]],
+                            "balance": initial_balance(schedules_by_loan[loan["id"]])
+                        }, "$inc": {"version": 1}}
+                    )
+                    for item, loan in chunk
+                ], ordered=False, session=session)
+                
+                if claim.matched_count == len(chunk):
+                    claimed = chunk
+                else:
+                    # Algún préstamo cambió desde la lectura: son nuestros los que quedaron
+                    # con la versión siguiente y la marca de aprobación de esta solicitud
+                    current = {
+                        loan["id"]: loan
+                        for loan in await db.loans.find(
+                            {"id": {"$in": [loan["id"] for _, loan in chunk]}},
+                            {"_id": 0, "id": 1, "version": 1, "approved_at": 1},
+                            session=session
+                        ).to_list(None)
+                    }
+                    claimed = [
+                        (item, loan) for item, loan in chunk
+                        if loan["id"] in current
+                        and current[loan["id"]].get("version") == (loan.get("version") or 0) + 1
+                        and current[loan["id"]].get("approved_at") == approved_at
+                    ]
+                if not claimed:
+                    return []
+                
+                schedule_docs = [doc for _, loan in claimed for doc in schedules_by_loan[loan["id"]]]
+                for j in range(0, len(schedule_docs), BULK_CHUNK_SIZE):
+                    await db.payment_schedules.insert_many(
+                        schedule_docs[j:j + BULK_CHUNK_SIZE], ordered=False, session=session
+                    )
+                return [(item.loan_id, loan_numbers[loan["id"]]) for item, loan in claimed]
+            
+            try:
+                claimed = dict(await run_in_transaction(approve_chunk))
+            except Exception as e:
+                logger.exception("Error aprobando lote de préstamos")
+                for item, _ in chunk:
+                    results[item.loan_id] = {"loan_id": item.loan_id, "status": "error", "detail": f"Error al aprobar: {e}"}
+                continue
+            
+            for item, loan in chunk:
+                if item.loan_id in claimed:
+                    loan_number = claimed[item.loan_id]
+                    results[item.loan_id] = {"loan_id": item.loan_id, "status": "approved", "loan_number": loan_number}
+                    event_bus.publish("loan.approved", {
+                        "loan_id": item.loan_id,
+                        "loan_number": loan_number,
+                        "lender_name": lender["name"],
+                        "status": LoanStatus.ACTIVE
+                    }, lender_id=payload.lender_id, client_id=loan["client_id"])
+                else:
+                    results[item.loan_id] = {
+                        "loan_id": item.loan_id,
+                        "status": "error",
+                        "detail": "El préstamo fue modificado por otra operación"
+                    }
+    
+    ordered = [results[loan_id] for loan_id in dict.fromkeys(loan_ids)]
+    approved = sum(1 for result in ordered if result["status"] == "approved")
+    return {
+        "total": len(ordered),
+        "approved": approved,
+        "failed": len(ordered) - approved,
+        "results": ordered
+    }
 
 @api_router.post("/loans/{loan_id}/reject")
-async def reject_loan(loan_id: str):
-    result = await db.loans.update_one(
+async def reject_loan(loan_id: str, admin: AuthenticatedUser = Depends(require_admin)):
+    loan = await db.loans.find_one_and_update(
         {"id": loan_id},
-        {"$set": {"status": LoanStatus.REJECTED}}
+        {"$set": {"status": LoanStatus.REJECTED, "closed_at": datetime.now(timezone.utc).isoformat()},
+         "$inc": {"version": 1}},
+        projection={"_id": 0, "client_id": 1, "lender_id": 1}
     )
-    if result.matched_count == 0:
+    if loan is None:
         raise HTTPException(status_code=404, detail="Loan not found")
+    event_bus.publish("loan.rejected", {"loan_id": loan_id, "status": LoanStatus.REJECTED},
+                      lender_id=loan.get("lender_id"), client_id=loan["client_id"])
     return {"message": "Loan rejected"}
 
 # Payment Routes
 @api_router.post("/payments", response_model=Payment)
-async def create_payment(payment_data: PaymentCreate, client_id: str):
-    # Get loan
-    loan = await db.loans.find_one({"id": payment_data.loan_id}, {"_id": 0})
-    if not loan:
-        raise HTTPException(status_code=404, detail="Préstamo no encontrado")
-    
-    if loan["status"] != LoanStatus.ACTIVE:
-        raise HTTPException(status_code=400, detail="Solo se pueden hacer pagos en préstamos activos")
-    
+async def create_payment(
+    payment_data: PaymentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: AuthenticatedUser = Depends(current_user)
+):
     payment_amount = payment_data.amount
     if payment_amount <= 0:
         raise HTTPException(status_code=400, detail="El monto del pago debe ser mayor a cero")
     
-    # Obtener todas las cuotas pendientes ordenadas por número
-    pending_schedules = await db.payment_schedules.find(
-        {"loan_id": payment_data.loan_id, "status": PaymentStatus.PENDING},
-        {"_id": 0}
-    ).sort("payment_number", 1).to_list(1000)
-    
-    if not pending_schedules:
-        raise HTTPException(status_code=400, detail="Este préstamo ya está completamente pagado")
-    
-    # Calcular saldo total pendiente
-    total_pending = sum(schedule["amount"] for schedule in pending_schedules)
-    
-    # VALIDACIÓN: Evitar que el pago sea mayor al saldo pendiente
-    if payment_amount > total_pending:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"El monto a pagar (${payment_amount:,}) es mayor al saldo pendiente (${total_pending:,}). No se pueden registrar pagos en exceso."
-        )
-    
-    # Crear el registro de pago
-    payment = Payment(
-        loan_id=payment_data.loan_id,
-        client_id=client_id,
-        amount=payment_amount,
-        payment_number=pending_schedules[0]["payment_number"],
-        notes=payment_data.notes or f"Pago procesado - Saldo pendiente antes: ${total_pending}"
-    )
-    
-    payment_doc = payment.model_dump()
-    payment_doc["payment_date"] = payment_doc["payment_date"].isoformat()
-    await db.payments.insert_one(payment_doc)
-    
-    # Verificar si el pago cubre todo el saldo restante (pago exacto)
-    if payment_amount == total_pending:
-        # Pago total exacto: marcar todas las cuotas como pagadas
-        await db.payment_schedules.update_many(
-            {"loan_id": payment_data.loan_id, "status": PaymentStatus.PENDING},
-            {"$set": {
-                "status": PaymentStatus.PAID,
-                "paid_date": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+    async def apply_payment(session, idempotency):
+        # Get loan
+        loan = await db.loans.find_one({"id": payment_data.loan_id}, {"_id": 0}, session=session)
+        if not loan:
+            raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+        # Paga el cliente del préstamo, su prestamista o un admin; el pago queda a nombre del cliente
+        ensure_loan_access(user, loan)
         
-        # Marcar préstamo como completado
-        await db.loans.update_one(
-            {"id": payment_data.loan_id},
-            {"$set": {"status": LoanStatus.COMPLETED}}
-        )
+        if loan["status"] != LoanStatus.ACTIVE:
+            raise HTTPException(status_code=400, detail="Solo se pueden hacer pagos en préstamos activos")
         
-        payment.notes += f" | Pago total - Préstamo completado"
+        # Saldo guardado en el préstamo: valida el pago sin sumar las cuotas
+        balance = loan.get("balance") or await compute_loan_balance(payment_data.loan_id, session=session)
+        total_pending = balance["outstanding"]
+        if total_pending <= 0:
+            raise HTTPException(status_code=400, detail="Este préstamo ya está completamente pagado")
         
-    else:
-        # Pago parcial: aplicar a cuotas secuencialmente
-        remaining_payment = payment_amount
+        # VALIDACIÓN: Evitar que el pago sea mayor al saldo pendiente
+        if payment_amount > total_pending:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"El monto a pagar (${payment_amount:,}) es mayor al saldo pendiente (${total_pending:,}). No se pueden registrar pagos en exceso."
+            )
         
-        for schedule in pending_schedules:
-            if remaining_payment <= 0:
-                break
-                
-            schedule_amount = schedule["amount"]
+        # Cuotas pendientes ordenadas por número, para repartir el pago
+        pending_schedules = await db.payment_schedules.find(
+            {"loan_id": payment_data.loan_id, "status": {"$in": UNPAID_STATUSES}},
+            {"_id": 0},
+            session=session
+        ).sort("payment_number", 1).to_list(1000)
+        
+        if not pending_schedules:
+            raise HTTPException(status_code=400, detail="Este préstamo ya está completamente pagado")
+        
+        # Aplicar el pago a las cuotas secuencialmente (en memoria)
+        allocation = allocate_payment(pending_schedules, payment_amount)
+        paid_date = datetime.now(timezone.utc).isoformat()
+        
+        # Reclamar la versión del préstamo antes de escribir: si otro pago se aplicó
+        # sobre las mismas cuotas desde la lectura, se reintenta con datos frescos
+        paid_count = len(pending_schedules) if allocation["completes_loan"] else len(allocation["paid_ids"])
+        loan_update = {"balance": balance_snapshot(
+            remaining_after_allocation(pending_schedules, allocation),
+            balance["schedule_count"],
+            balance["paid_count"] + paid_count,
+            balance["total_paid"] + payment_amount,
+            balance["payment_count"] + 1
+        )}
+        if allocation["completes_loan"]:
+            loan_update.update(status=LoanStatus.COMPLETED, closed_at=paid_date)
+        await claim_loan(loan, {"$set": loan_update}, session=session)
+        
+        # Crear el registro de pago
+        payment = Payment(
+            loan_id=payment_data.loan_id,
+            client_id=loan["client_id"],
+            amount=payment_amount,
+            payment_number=pending_schedules[0]["payment_number"],
+            notes=payment_data.notes or f"Pago procesado - Saldo pendiente antes: ${total_pending}"
+        )
+        
+        payment_doc = payment.model_dump()
+        payment_doc["payment_date"] = payment_doc["payment_date"].isoformat()
+        await payment_ledger().insert_one(payment_doc, session=session)
+        
+        if allocation["completes_loan"]:
+            # Sin saldo restante: marcar todas las cuotas (incluidas las de monto 0) como pagadas
+            await db.payment_schedules.update_many(
+                {"loan_id": payment_data.loan_id, "status": {"$in": UNPAID_STATUSES}},
+                {"$set": {"status": PaymentStatus.PAID, "paid_date": paid_date}},
+                session=session
+            )
             
-            if remaining_payment >= schedule_amount:
-                # Pago completo de esta cuota
-                await db.payment_schedules.update_one(
-                    {"id": schedule["id"]},
-                    {"$set": {
-                        "status": PaymentStatus.PAID,
-                        "paid_date": datetime.now(timezone.utc).isoformat()
-                    }}
-                )
-                remaining_payment -= schedule_amount
+            if payment_amount == total_pending:
+                payment.notes += f" | Pago total - Préstamo completado"
             else:
-                # Pago parcial de esta cuota - actualizar el monto pendiente
-                new_amount = schedule_amount - remaining_payment
+                payment.notes += " | Préstamo completado"
+        else:
+            if allocation["paid_ids"]:
+                await db.payment_schedules.update_many(
+                    {"id": {"$in": allocation["paid_ids"]}},
+                    {"$set": {"status": PaymentStatus.PAID, "paid_date": paid_date}},
+                    session=session
+                )
+            if allocation["partial"]:
+                # Pago parcial de una cuota - actualizar el monto pendiente
                 await db.payment_schedules.update_one(
-                    {"id": schedule["id"]},
-                    {"$set": {"amount": new_amount}}
+                    {"id": allocation["partial"]["id"]},
+                    {"$set": {"amount": allocation["partial"]["amount"]}},
+                    session=session
                 )
-                remaining_payment = 0
-                break
         
-        # Verificar si todas las cuotas están pagadas después de procesar
-        final_check = await db.payment_schedules.count_documents({
-            "loan_id": payment_data.loan_id,
-            "status": PaymentStatus.PENDING,
-            "amount": {"$gt": 0}
+        applied.update(lender_id=loan.get("lender_id"), client_id=loan["client_id"],
+                       loan_completed=allocation["completes_loan"])
+        await idempotency.complete(payment, session=session)
+        return payment
+    
+    async def operation(idempotency):
+        # El pago, su aplicación a cuotas y préstamo y la clave de idempotencia
+        # se confirman en una sola transacción
+        payment = await run_with_version_retry(partial(apply_payment, idempotency=idempotency))
+        await payment_ledger().flush([payment.id])
+        event_bus.publish("payment.created", {
+            "payment_id": payment.id,
+            "loan_id": payment.loan_id,
+            "amount": payment.amount,
+            "payment_number": payment.payment_number,
+            "loan_completed": applied["loan_completed"]
+        }, lender_id=applied["lender_id"], client_id=applied["client_id"])
+        return payment
+    
+    applied = {}
+    return await run_idempotent("payment", user, idempotency_key, payment_data.model_dump(), operation)
+
+async def apply_payment_groups(groups: list, user: AuthenticatedUser, idempotency: IdempotencyRecord, session) -> dict:
+    """Aplica un tramo de la carga masiva: filas agrupadas por préstamo, en orden
+    
+    Lee préstamos y cuotas impagas con dos consultas, reparte cada pago en memoria con
+    allocate_payment (los pagos posteriores ven el saldo que dejaron los anteriores) y
+    persiste todo con insert_many/bulk_write. Devuelve el resultado por fila y el
+    prestamista/cliente de cada préstamo afectado (para los eventos).
+    """
+    results = []
+    loan_ids = [group[0][1].loan_id for group in groups]
+    loans = {
+        loan["id"]: loan
+        for loan in await db.loans.find({"id": {"$in": loan_ids}}, {"_id": 0}, session=session).to_list(None)
+    }
+    pending_by_loan = {loan_id: [] for loan_id in loans}
+    async for schedule in db.payment_schedules.find(
+        {"loan_id": {"$in": list(loans)}, "status": {"$in": UNPAID_STATUSES}},
+        {"_id": 0, "id": 1, "loan_id": 1, "payment_number": 1, "amount": 1, "due_date": 1},
+        session=session
+    ).sort([("loan_id", 1), ("payment_number", 1)]).batch_size(BULK_CHUNK_SIZE):
+        pending_by_loan[schedule["loan_id"]].append(schedule)
+    
+    paid_date = datetime.now(timezone.utc).isoformat()
+    payment_docs = []
+    schedule_changes = {}  # id de cuota -> $set final
+    touched_loans = {}
+    completed_loans = []
+    balances = {}  # id de préstamo -> saldo después de las filas aplicadas
+    
+    for index, row in (item for group in groups for item in group):
+        loan = loans.get(row.loan_id)
+        pending = pending_by_loan.get(row.loan_id, [])
+        
+        if row.amount <= 0:
+            error = "El monto del pago debe ser mayor a cero"
+        elif not loan:
+            error = "Préstamo no encontrado"
+        elif user.role != UserRole.ADMIN and loan.get("lender_id") != user.id:
+            error = "No tiene acceso a este préstamo"
+        elif row.client_id and row.client_id != loan["client_id"]:
+            error = "El cliente no corresponde al préstamo"
+        elif loan["status"] != LoanStatus.ACTIVE:
+            error = "Solo se pueden hacer pagos en préstamos activos"
+        else:
+            error = None
+        
+        if not error:
+            # Saldo guardado en el préstamo (o el que dejaron las filas anteriores),
+            # igual que en create_payment
+            if loan["id"] not in balances:
+                balances[loan["id"]] = loan.get("balance") or await compute_loan_balance(loan["id"], session=session)
+            balance = balances[loan["id"]]
+            total_pending = balance["outstanding"]
+            if total_pending <= 0 or not pending:
+                error = "Este préstamo ya está completamente pagado"
+            elif row.amount > total_pending:
+                error = f"El monto a pagar (${row.amount:,}) es mayor al saldo pendiente (${total_pending:,})"
+        if error:
+            results.append({"row": index, "loan_id": row.loan_id, "status": "error", "detail": error})
+            continue
+        
+        allocation = allocate_payment(pending, row.amount)
+        notes = row.notes or f"Pago procesado - Saldo pendiente antes: ${total_pending}"
+        payment = Payment(
+            loan_id=row.loan_id,
+            client_id=loan["client_id"],
+            amount=row.amount,
+            payment_number=pending[0]["payment_number"],
+            notes=notes + (" | Préstamo completado" if allocation["completes_loan"] else "")
+        )
+        payment_doc = payment.model_dump()
+        payment_doc["payment_date"] = payment_doc["payment_date"].isoformat()
+        payment_docs.append(payment_doc)
+        touched_loans[loan["id"]] = loan
+        
+        paid_count = len(pending) if allocation["completes_loan"] else len(allocation["paid_ids"])
+        balances[loan["id"]] = balance_snapshot(
+            remaining_after_allocation(pending, allocation),
+            balance["schedule_count"],
+            balance["paid_count"] + paid_count,
+            balance["total_paid"] + row.amount,
+            balance["payment_count"] + 1
+        )
+        
+        # Actualizar el estado en memoria para las filas siguientes del mismo préstamo
+        settled = set(allocation["paid_ids"])
+        if allocation["completes_loan"]:
+            settled.update(schedule["id"] for schedule in pending)
+            loan["status"] = LoanStatus.COMPLETED
+            completed_loans.append(loan["id"])
+        for schedule_id in settled:
+            schedule_changes[schedule_id] = {"status": PaymentStatus.PAID, "paid_date": paid_date}
+        if allocation["partial"]:
+            partial = allocation["partial"]
+            schedule_changes[partial["id"]] = {"amount": partial["amount"]}
+            for schedule in pending:
+                if schedule["id"] == partial["id"]:
+                    schedule["amount"] = partial["amount"]
+        pending_by_loan[row.loan_id] = [schedule for schedule in pending if schedule["id"] not in settled]
+        
+        results.append({
+            "row": index,
+            "loan_id": row.loan_id,
+            "status": "applied",
+            "payment_id": payment.id,
+            "loan_completed": allocation["completes_loan"]
         })
+    
+    if touched_loans:
+        # Reclamar la versión de cada préstamo antes de escribir nada: el reclamo solo
+        # incrementa version, así un conflicto no deja saldos escritos (sin transacción)
+        # con pagos que no se registraron
+        claimed = await db.loans.bulk_write([
+            UpdateOne({"id": loan["id"], "version": loan.get("version")}, {"$inc": {"version": 1}})
+            for loan in touched_loans.values()
+        ], ordered=False, session=session)
+        if claimed.matched_count < len(touched_loans):
+            raise VersionConflict("bulk")
         
-        if final_check == 0:
-            # Marcar cualquier cuota con monto 0 como pagada
-            await db.payment_schedules.update_many(
-                {"loan_id": payment_data.loan_id, "status": PaymentStatus.PENDING},
-                {"$set": {
-                    "status": PaymentStatus.PAID,
-                    "paid_date": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-            
-            # Marcar préstamo como completado
-            await db.loans.update_one(
-                {"id": payment_data.loan_id},
-                {"$set": {"status": LoanStatus.COMPLETED}}
+        for i in range(0, len(payment_docs), BULK_CHUNK_SIZE):
+            await payment_ledger().insert_many(payment_docs[i:i + BULK_CHUNK_SIZE], session=session)
+        
+        operations = [UpdateOne({"id": schedule_id}, {"$set": change}) for schedule_id, change in schedule_changes.items()]
+        for i in range(0, len(operations), BULK_CHUNK_SIZE):
+            await db.payment_schedules.bulk_write(operations[i:i + BULK_CHUNK_SIZE], ordered=False, session=session)
+        
+        # Saldos (y cierre de los completados); el reclamo ya incrementó la versión
+        completed = set(completed_loans)
+        await db.loans.bulk_write([
+            UpdateOne({"id": loan_id}, {"$set": {
+                "balance": balances[loan_id],
+                **({"status": LoanStatus.COMPLETED, "closed_at": paid_date} if loan_id in completed else {})
+            }})
+            for loan_id in touched_loans
+        ], ordered=False, session=session)
+    
+    # El tramo y su resultado en la clave de idempotencia se confirman juntos
+    await idempotency.save_progress(results, session=session)
+    return {
+        "results": results,
+        "owners": {loan_id: (loan.get("lender_id"), loan["client_id"]) for loan_id, loan in touched_loans.items()}
+    }
+
+async def import_payments(rows: list, user: AuthenticatedUser, idempotency: IdempotencyRecord) -> dict:
+    """Aplica un lote de pagos en orden, agrupados por préstamo
+    
+    Los grupos de filas de cada préstamo se reparten en tramos de hasta
+    BULK_CHUNK_SIZE filas (un grupo nunca se parte) y cada tramo corre en su propia
+    transacción con reintento ante VersionConflict: un préstamo modificado en paralelo
+    solo repite su tramo. Si el tramo agota los reintentos se repite préstamo por
+    préstamo y solo las filas de los préstamos que siguen en conflicto se reportan con
+    error, igual que las filas inválidas (o de préstamos de otro prestamista).
+    
+    Cada tramo guarda su resultado en la clave de idempotencia al confirmar; si la
+    solicitud se corta a mitad del lote, el reintento con la misma clave retoma desde
+    ahí sin volver a aplicar los tramos ya confirmados.
+    """
+    results = list(idempotency.progress)
+    done = {result["row"] for result in results}
+    groups = {}
+    for index, row in enumerate(rows, start=1):
+        if index in done:
+            continue
+        if isinstance(row, BulkPaymentRow):
+            groups.setdefault(row.loan_id, []).append((index, row))
+        else:
+            results.append({"row": index, "status": "error", "detail": row})
+    
+    chunks = []
+    chunk_rows = BULK_CHUNK_SIZE
+    for group in groups.values():
+        if chunk_rows + len(group) > BULK_CHUNK_SIZE:
+            chunks.append([])
+            chunk_rows = 0
+        chunks[-1].append(group)
+        chunk_rows += len(group)
+    
+    owners = {}
+    new_payment_ids = []
+    for chunk in chunks:
+        try:
+            applied = [await run_with_version_retry(partial(apply_payment_groups, chunk, user, idempotency))]
+        except HTTPException as e:
+            if e.status_code != 409 or e.detail != VERSION_CONFLICT_DETAIL:
+                raise
+            applied = []
+            conflicted = chunk
+            if len(chunk) > 1:
+                conflicted = []
+                for group in chunk:
+                    try:
+                        applied.append(await run_with_version_retry(partial(apply_payment_groups, [group], user, idempotency)))
+                    except HTTPException as e:
+                        if e.status_code != 409 or e.detail != VERSION_CONFLICT_DETAIL:
+                            raise
+                        conflicted.append(group)
+            results.extend(
+                {"row": index, "loan_id": row.loan_id, "status": "error", "detail": VERSION_CONFLICT_DETAIL}
+                for group in conflicted for index, row in group
             )
-            
-            payment.notes += " | Préstamo completado"
+        for chunk_applied in applied:
+            results.extend(chunk_applied["results"])
+            owners.update(chunk_applied["owners"])
+            new_payment_ids.extend(result["payment_id"] for result in chunk_applied["results"] if result["status"] == "applied")
+    
+    results.sort(key=lambda result: result["row"])
+    applied = [result for result in results if result["status"] == "applied"]
+    summary = {
+        "total": len(rows),
+        "applied": len(applied),
+        "failed": len(results) - len(applied),
+        "amount_applied": sum(rows[result["row"] - 1].amount for result in applied),
+        "loans_completed": [result["loan_id"] for result in applied if result["loan_completed"]],
+        "results": results
+    }
+    await idempotency.complete(summary)
+    await payment_ledger().flush([result["payment_id"] for result in applied])
+    
+    # Un evento por préstamo afectado, no por fila, para no inundar el feed (los
+    # tramos de una solicitud anterior ya publicaron los suyos)
+    new_payment_ids = set(new_payment_ids)
+    by_loan = {}
+    for result in applied:
+        if result["payment_id"] in new_payment_ids:
+            by_loan.setdefault(result["loan_id"], []).append(result)
+    for loan_id, loan_results in by_loan.items():
+        lender_id, client_id = owners[loan_id]
+        event_bus.publish("payment.created", {
+            "payment_ids": [result["payment_id"] for result in loan_results],
+            "loan_id": loan_id,
+            "loan_completed": any(result["loan_completed"] for result in loan_results),
+            "bulk": True
+        }, lender_id=lender_id, client_id=client_id)
+    return summary
+
+def parse_payment_upload(content: bytes, filename: str) -> list:
+    """Convierte un archivo CSV (con encabezado) o NDJSON en filas de pago
     
-    return payment
+    Las filas que no se pueden leer quedan como texto con el error para reportarlas
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".csv"):
+        records = [dict(record) for record in csv.DictReader(io.StringIO(text))]
+    else:
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                records.append("JSON inválido")
+    
+    rows = []
+    for record in records:
+        if isinstance(record, str):
+            rows.append(record)
+            continue
+        try:
+            # Celdas vacías del CSV equivalen a campos ausentes
+            rows.append(BulkPaymentRow.model_validate(
+                {key: value for key, value in record.items() if value not in ("", None)}
+            ))
+        except ValidationError as e:
+            rows.append("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+    return rows
+
+@api_router.post("/payments/bulk")
+async def create_payments_bulk(
+    payload: BulkPaymentImport,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: AuthenticatedUser = Depends(require_staff)
+):
+    """Registra un lote de pagos (ej. cierre de caja del cobrador) con resultado por fila"""
+    if len(payload.payments) > BULK_PAYMENT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BULK_PAYMENT_MAX_ROWS} pagos por lote")
+    return await run_idempotent(
+        "payments-bulk",
+        user,
+        idempotency_key,
+        payload.model_dump(),
+        lambda idempotency: import_payments(payload.payments, user, idempotency)
+    )
 
-@api_router.post("/admin/fix-completed-loans")
-async def fix_completed_loans(admin_id: str):
-    """Corrige préstamos que deberían estar completados pero tienen cuotas con monto 0"""
+@api_router.post("/payments/bulk/upload")
+async def upload_payments_bulk(
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: AuthenticatedUser = Depends(require_staff)
+):
+    """Igual que /payments/bulk pero desde un archivo .csv (loan_id,amount,client_id,notes) o NDJSON"""
+    rows = parse_payment_upload(await file.read(), file.filename or "")
+    if len(rows) > BULK_PAYMENT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BULK_PAYMENT_MAX_ROWS} pagos por lote")
+    return await run_idempotent(
+        "payments-bulk",
+        user,
+        idempotency_key,
+        {"rows": [row.model_dump() if isinstance(row, BulkPaymentRow) else row for row in rows]},
+        lambda idempotency: import_payments(rows, user, idempotency)
+    )
+
+async def fix_completed_loans_job(params: dict, report) -> dict:
+    """Corrige préstamos que deberían estar completados pero tienen cuotas con monto 0
     
+    Primero completa los préstamos y después marca las cuotas, para que si el trabajo
+    se interrumpe y se retoma vuelva a encontrar las cuotas pendientes.
+    """
     # Buscar todas las cuotas pendientes con monto 0
     schedules_with_zero = await db.payment_schedules.find({
-        "status": PaymentStatus.PENDING,
+        "status": {"$in": UNPAID_STATUSES},
         "amount": 0
-    }, {"_id": 0}).to_list(1000)
-    
-    loans_to_fix = set()
+    }, {"_id": 0, "id": 1, "loan_id": 1}).to_list(None)
     
-    # Marcar cuotas con monto 0 como pagadas
-    for schedule in schedules_with_zero:
-        await db.payment_schedules.update_one(
-            {"id": schedule["id"]},
-            {"$set": {
-                "status": PaymentStatus.PAID,
-                "paid_date": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        loans_to_fix.add(schedule["loan_id"])
+    loans_to_fix = list({schedule["loan_id"] for schedule in schedules_with_zero})
+    total_steps = len(loans_to_fix) + len(schedules_with_zero)
     
     # Verificar cada préstamo afectado
     completed_loans = []
-    
-    for loan_id in loans_to_fix:
-        # Verificar si todas las cuotas están pagadas
+    for done, loan_id in enumerate(loans_to_fix, start=1):
+        # Verificar si todas las cuotas con saldo están pagadas
         remaining_schedules = await db.payment_schedules.count_documents({
             "loan_id": loan_id,
-            "status": PaymentStatus.PENDING,
+            "status": {"$in": UNPAID_STATUSES},
             "amount": {"$gt": 0}
         })
         
@@ -669,9 +1735,31 @@ async def fix_completed_loans(admin_id: str):
             # Marcar préstamo como completado
             await db.loans.update_one(
                 {"id": loan_id},
-                {"$set": {"status": LoanStatus.COMPLETED}}
+                {"$set": {"status": LoanStatus.COMPLETED, "closed_at": datetime.now(timezone.utc).isoformat()},
+                 "$inc": {"version": 1}}
             )
             completed_loans.append(loan_id)
+        if done % 100 == 0:
+            await report(done, total_steps)
+    
+    # Marcar cuotas con monto 0 como pagadas
+    schedule_ids = [schedule["id"] for schedule in schedules_with_zero]
+    for i in range(0, len(schedule_ids), BULK_CHUNK_SIZE):
+        await db.payment_schedules.update_many(
+            {"id": {"$in": schedule_ids[i:i + BULK_CHUNK_SIZE]}},
+            {"$set": {
+                "status": PaymentStatus.PAID,
+                "paid_date": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+        await report(len(loans_to_fix) + min(i + BULK_CHUNK_SIZE, len(schedule_ids)), total_steps)
+    
+    # Recalcular el saldo guardado de los préstamos cuyas cuotas cambiaron
+    for loan_id in {schedule["loan_id"] for schedule in schedules_with_zero}:
+        await db.loans.update_one(
+            {"id": loan_id},
+            {"$set": {"balance": await compute_loan_balance(loan_id)}, "$inc": {"version": 1}}
+        )
     
     return {
         "message": f"Corrección completada",
@@ -680,47 +1768,76 @@ async def fix_completed_loans(admin_id: str):
         "completed_loan_ids": completed_loans
     }
 
+@api_router.post("/admin/fix-completed-loans")
+async def fix_completed_loans(admin: AuthenticatedUser = Depends(require_admin)):
+    """Encola la corrección de préstamos completados; consultar con GET /admin/jobs/{job_id}"""
+    return await job_runner.enqueue("fix_completed_loans", {}, requested_by=admin.id)
+
 @api_router.get("/loans/{loan_id}/payment-status")
-async def get_loan_payment_status(loan_id: str):
-    """Obtiene el estado detallado de pagos de un préstamo"""
-    loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
+async def get_loan_payment_status(loan_id: str, user: AuthenticatedUser = Depends(current_user)):
+    """Obtiene el estado detallado de pagos de un préstamo (desde loan.balance)"""
+    loan, archived = await find_loan_with_archive(
+        loan_id, {"_id": 0, "total_amount": 1, "balance": 1, "version": 1, "client_id": 1, "lender_id": 1}
+    )
     if not loan:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
+    ensure_loan_access(user, loan)
     
-    # Obtener todos los pagos realizados
-    payments = await db.payments.find({"loan_id": loan_id}, {"_id": 0}).to_list(1000)
-    total_paid = sum(payment["amount"] for payment in payments)
-    
-    # Obtener cronograma actual
-    schedules = await db.payment_schedules.find({"loan_id": loan_id}, {"_id": 0}).sort("payment_number", 1).to_list(1000)
-    
-    # Calcular totales
-    original_total = loan["total_amount"]
-    pending_amount = sum(schedule["amount"] for schedule in schedules if schedule["status"] == PaymentStatus.PENDING)
-    paid_schedules = len([s for s in schedules if s["status"] == PaymentStatus.PAID])
-    total_schedules = len(schedules)
+    balance = loan.get("balance")
+    if balance is None:
+        # Préstamo anterior al saldo guardado: calcularlo una vez y guardarlo
+        balance = await compute_loan_balance(loan_id, archived=archived)
+        if not archived:
+            await db.loans.update_one(
+                {"id": loan_id, "version": loan.get("version"), "balance": None},
+                {"$set": {"balance": balance}, "$inc": {"version": 1}}
+            )
     
+    total_schedules = balance["schedule_count"]
+    paid_schedules = balance["paid_count"]
     return {
         "loan_id": loan_id,
-        "original_total": original_total,
-        "total_paid": total_paid,
-        "pending_amount": pending_amount,
+        "original_total": loan["total_amount"],
+        "total_paid": balance["total_paid"],
+        "pending_amount": balance["outstanding"],
         "paid_schedules": paid_schedules,
         "total_schedules": total_schedules,
         "completion_percentage": (paid_schedules / total_schedules * 100) if total_schedules > 0 else 0,
-        "is_completed": pending_amount == 0,
-        "payment_count": len(payments)
+        "is_completed": balance["outstanding"] == 0,
+        "payment_count": balance["payment_count"],
+        "next_payment_number": balance.get("next_payment_number"),
+        "next_due_date": balance.get("next_due_date"),
+        "next_due_amount": balance.get("next_due_amount")
     }
 
 @api_router.get("/payments", response_model=List[Payment])
-async def get_payments(loan_id: Optional[str] = None, client_id: Optional[str] = None):
+async def get_payments(
+    loan_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    include_archived: bool = False,
+    user: AuthenticatedUser = Depends(current_user)
+):
     query = {}
     if loan_id:
         query["loan_id"] = loan_id
     if client_id:
         query["client_id"] = client_id
+    # El cliente ve sus pagos; el prestamista los de sus préstamos
+    if user.role == UserRole.CLIENT:
+        query["client_id"] = user.id
+    elif user.role == UserRole.LENDER:
+        if loan_id:
+            loan, _ = await find_loan_with_archive(loan_id, {"_id": 0, "client_id": 1, "lender_id": 1})
+            if loan:
+                ensure_loan_access(user, loan)
+        else:
+            lender_loans = await find_loans(lender_id=user.id, include_archived=include_archived)
+            query["loan_id"] = {"$in": [loan["id"] for loan in lender_loans]}
     
-    payments = await db.payments.find(query, {"_id": 0}).to_list(1000)
+    payments = await payment_ledger().find(query, {"_id": 0}, 1000)
+    if include_archived or (loan_id and not payments):
+        # Los pagos de un préstamo archivado están solo en payments_archive
+        payments += await db.payments_archive.find(query, {"_id": 0, "archived_at": 0}).to_list(1000)
     for payment in payments:
         if isinstance(payment["payment_date"], str):
             payment["payment_date"] = datetime.fromisoformat(payment["payment_date"])
@@ -731,16 +1848,58 @@ async def get_payments(loan_id: Optional[str] = None, client_id: Optional[str] =
 
 # Payment Schedule Routes
 @api_router.get("/schedules", response_model=List[PaymentSchedule])
-async def get_schedules(loan_id: Optional[str] = None, client_id: Optional[str] = None, status: Optional[str] = None):
+async def get_schedules(
+    request: Request,
+    response: Response,
+    loan_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    status: Optional[str] = None,
+    format: Optional[str] = None,
+    user: AuthenticatedUser = Depends(current_user)
+):
+    response_format = check_response_format(format)
+    # El cliente ve sus cuotas y el prestamista las de sus préstamos
+    lender_id = None
+    if user.role == UserRole.CLIENT:
+        client_id = user.id
+    elif user.role == UserRole.LENDER:
+        lender_id = user.id
+    etag = None
+    schedules_collection = db.payment_schedules
+    if loan_id:
+        # Las cuotas de un préstamo cambian con la versión del préstamo (pagos,
+        # reprogramaciones, reasignación) o cuando el barrido cambia estados
+        (loan, archived), sweep_state = await asyncio.gather(
+            find_loan_with_archive(loan_id, {"_id": 0, "version": 1}),
+            db.system_state.find_one(
+                {"id": "schedule_sweeper"}, {"_id": 0, "late_until": 1, "overdue_until": 1, "changed_at": 1}
+            )
+        )
+        if archived:
+            schedules_collection = db.payment_schedules_archive
+        if loan is not None:
+            sweep_state = sweep_state or {}
+            etag = make_etag(
+                "schedules", loan_id, loan.get("version", 0), client_id, lender_id, status, response_format,
+                sweep_state.get("late_until"), sweep_state.get("overdue_until"), sweep_state.get("changed_at")
+            )
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+    
     query = {}
     if loan_id:
         query["loan_id"] = loan_id
     if client_id:
         query["client_id"] = client_id
+    if lender_id:
+        query["lender_id"] = lender_id
     if status:
-        query["status"] = status
+        # Permite varios estados separados por coma (ej. pending,late,overdue)
+        statuses = status.split(",")
+        query["status"] = statuses[0] if len(statuses) == 1 else {"$in": statuses}
     
-    schedules = await db.payment_schedules.find(query, {"_id": 0}).to_list(1000)
+    schedules = await schedules_collection.find(query, {"_id": 0, "archived_at": 0}).to_list(1000)
     for schedule in schedules:
         for field in ["due_date", "paid_date"]:
             if field in schedule and schedule[field] and isinstance(schedule[field], str):
@@ -748,14 +1907,28 @@ async def get_schedules(loan_id: Optional[str] = None, client_id: Optional[str]
         # Convert float amounts to integers for existing data
         if "amount" in schedule and isinstance(schedule["amount"], float):
             schedule["amount"] = round(schedule["amount"])
+    if etag:
+        set_cache_headers(response, etag)
+    if response_format == "columnar":
+        return JSONResponse(jsonable_encoder(to_columnar(schedules)), headers=dict(response.headers))
     return schedules
 
 @api_router.get("/schedules/today", response_model=List[PaymentSchedule])
-async def get_today_schedules():
+async def get_today_schedules(user: AuthenticatedUser = Depends(require_staff)):
     today = datetime.now(timezone.utc).date()
-    tomorrow = today + timedelta(days=1)
+    start_of_today = datetime(today.year, today.month, today.day, tzinfo=timezone.utc)
     
-    schedules = await db.payment_schedules.find({"status": PaymentStatus.PENDING}, {"_id": 0}).to_list(1000)
+    # Rango sobre el índice (status, due_date) en lugar de recorrer todas las pendientes
+    query = {
+        "status": PaymentStatus.PENDING,
+        "due_date": {
+            "$gte": start_of_today.isoformat(),
+            "$lt": (start_of_today + timedelta(days=1)).isoformat()
+        }
+    }
+    if user.role == UserRole.LENDER:
+        query["lender_id"] = user.id
+    schedules = await db.payment_schedules.find(query, {"_id": 0}).to_list(1000)
     
     result = []
     for schedule in schedules:
@@ -768,18 +1941,217 @@ async def get_today_schedules():
     
     return result
 
+@api_router.get("/lenders/{lender_id}/route-sheet")
+async def get_lender_route_sheet(
+    lender_id: str,
+    page: int = 1,
+    page_size: int = 50,
+    user: AuthenticatedUser = Depends(require_staff)
+):
+    """Hoja de ruta de cobro del prestamista: cuotas de hoy y vencidas de sus clientes
+    
+    Una sola agregación sobre el índice (lender_id, status, due_date), con dirección y
+    teléfono del cliente, ordenada por vencimiento y paginada. La respuesta es compacta
+    para cobradores en conexiones móviles lentas.
+    """
+    ensure_self_or_admin(user, lender_id)
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 200)
+    today = start_of_day(datetime.now(timezone.utc))
+    
+    pipeline = [
+        {"$match": {
+            "lender_id": lender_id,
+            "status": {"$in": UNPAID_STATUSES},
+            "due_date": {"$lt": (today + timedelta(days=1)).isoformat()}
+        }},
+        {"$sort": {"due_date": 1, "payment_number": 1}},
+        {"$facet": {
+            "summary": [
+                {"$group": {"_id": None, "total": {"$sum": 1}, "total_amount": {"$sum": "$amount"}}}
+            ],
+            "items": [
+                {"$skip": (page - 1) * page_size},
+                {"$limit": page_size},
+                {"$lookup": {
+                    "from": "users",
+                    "localField": "client_id",
+                    "foreignField": "id",
+                    "as": "client"
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "id": 1,
+                    "loan_id": 1,
+                    "client_id": 1,
+                    "client_name": 1,
+                    "payment_number": 1,
+                    "due_date": 1,
+                    "amount": 1,
+                    "status": 1,
+                    "phone": {"$arrayElemAt": ["$client.phone", 0]},
+                    "address": {"$arrayElemAt": ["$client.address", 0]}
+                }}
+            ]
+        }}
+    ]
+    result = (await db.payment_schedules.aggregate(pipeline).to_list(1))[0]
+    summary = result["summary"][0] if result["summary"] else {"total": 0, "total_amount": 0}
+    
+    return {
+        "lender_id": lender_id,
+        "date": today.date().isoformat(),
+        "page": page,
+        "page_size": page_size,
+        "total": summary["total"],
+        "total_amount": summary["total_amount"],
+        "items": result["items"]
+    }
+
 @api_router.put("/schedules/{schedule_id}/update-date")
-async def update_schedule_date(schedule_id: str, update: PaymentScheduleUpdate):
-    result = await db.payment_schedules.update_one(
+async def update_schedule_date(
+    schedule_id: str,
+    update: PaymentScheduleUpdate,
+    user: AuthenticatedUser = Depends(require_staff)
+):
+    schedule = await db.payment_schedules.find_one(
         {"id": schedule_id},
-        {"$set": {"due_date": update.due_date.isoformat()}}
+        {"_id": 0, "status": 1, "loan_id": 1, "lender_id": 1, "client_id": 1, "payment_number": 1}
     )
-    if result.matched_count == 0:
+    if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
+    ensure_loan_access(user, schedule)
+    
+    update_data = {"due_date": update.due_date.isoformat()}
+    # Una cuota reprogramada recalcula su estado de mora
+    if schedule["status"] != PaymentStatus.PAID:
+        update_data["status"] = schedule_status_for_due_date(update.due_date)
+    
+    await db.payment_schedules.update_one({"id": schedule_id}, {"$set": update_data})
+    await db.loans.update_one({"id": schedule["loan_id"]}, {"$inc": {"version": 1}})
+    # Si es la próxima cuota del saldo guardado, su fecha también cambia ahí
+    await db.loans.update_one(
+        {"id": schedule["loan_id"], "balance.next_payment_number": schedule.get("payment_number")},
+        {"$set": {"balance.next_due_date": update_data["due_date"]}}
+    )
+    event_bus.publish("schedule.updated", {
+        "schedule_id": schedule_id,
+        "loan_id": schedule["loan_id"],
+        **update_data
+    }, lender_id=schedule.get("lender_id"), client_id=schedule["client_id"])
     return {"message": "Schedule updated successfully"}
 
+async def sweep_schedule_transition(query: dict, status: PaymentStatus, lenders: dict, field: str) -> int:
+    """Pasa a status las cuotas de query por lotes y cuenta por prestamista las que cambió
+    
+    Cada lote se lee (solo id) y se actualiza por id con el mismo filtro, así una
+    cuota que se pagó entre la lectura y la escritura no cambia; los conteos por
+    prestamista salen de las cuotas del lote que quedaron en status. Las cuotas
+    actualizadas dejan de coincidir con query y el siguiente lote sigue donde quedó
+    el anterior.
+    """
+    modified = 0
+    while True:
+        batch = await db.payment_schedules.find(
+            query, {"_id": 0, "id": 1}
+        ).limit(SCHEDULE_SWEEP_BATCH_SIZE).to_list(SCHEDULE_SWEEP_BATCH_SIZE)
+        if not batch:
+            return modified
+        ids = [schedule["id"] for schedule in batch]
+        result = await db.payment_schedules.update_many(
+            {**query, "id": {"$in": ids}}, {"$set": {"status": status}}
+        )
+        modified += result.modified_count
+        # Solo las del lote que quedaron en status: una cuota pagada entre la lectura
+        # y la escritura no coincide con query y no se cuenta para su prestamista
+        rows = await db.payment_schedules.aggregate([
+            {"$match": {"id": {"$in": ids}, "status": status}},
+            {"$group": {"_id": "$lender_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        for row in rows:
+            lender = lenders.setdefault(row["_id"], {"lender_id": row["_id"], "marked_late": 0, "marked_overdue": 0})
+            lender[field] += row["count"]
+        if len(batch) < SCHEDULE_SWEEP_BATCH_SIZE:
+            return modified
+
+async def sweep_schedule_statuses(now: Optional[datetime] = None) -> dict:
+    """Marca como LATE / OVERDUE las cuotas vencidas que aún no tienen ese estado
+    
+    Los filtros no tienen cota inferior: una cuota ya barrida cambió de estado y deja
+    de coincidir, así que por el índice status + due_date cada ejecución solo recorre
+    las que faltan, incluidas las que quedaron atrás (un barrido interrumpido o una
+    cuota que volvió a PENDING con fecha pasada), en lotes acotados. system_state
+    guarda hasta qué fecha se barrió y cuándo cambió algo por última vez, para los
+    ETag de las cuotas. lenders detalla cuántas cuotas cambiaron por prestamista, para notificar a cada uno.
+    """
+    late_cutoff = start_of_day(now or datetime.now(timezone.utc))
+    overdue_cutoff = late_cutoff - timedelta(days=OVERDUE_AFTER_DAYS)
+    
+    state = await db.system_state.find_one({"id": "schedule_sweeper"}, {"_id": 0}) or {}
+    
+    late_filter = {"status": PaymentStatus.PENDING, "due_date": {"$lt": late_cutoff.isoformat()}}
+    overdue_filter = {
+        "status": {"$in": [PaymentStatus.PENDING, PaymentStatus.LATE]},
+        "due_date": {"$lt": overdue_cutoff.isoformat()}
+    }
+    
+    lenders = {}
+    marked_late = await sweep_schedule_transition(late_filter, PaymentStatus.LATE, lenders, "marked_late")
+    marked_overdue = await sweep_schedule_transition(overdue_filter, PaymentStatus.OVERDUE, lenders, "marked_overdue")
+    
+    last_run_at = datetime.now(timezone.utc).isoformat()
+    await db.system_state.update_one(
+        {"id": "schedule_sweeper"},
+        {"$set": {
+            "late_until": max(late_cutoff.isoformat(), state.get("late_until", "")),
+            "overdue_until": max(overdue_cutoff.isoformat(), state.get("overdue_until", "")),
+            "last_run_at": last_run_at,
+            **({"changed_at": last_run_at} if marked_late or marked_overdue else {})
+        }},
+        upsert=True
+    )
+    
+    return {
+        "marked_late": marked_late,
+        "marked_overdue": marked_overdue,
+        "late_until": late_cutoff.isoformat(),
+        "overdue_until": overdue_cutoff.isoformat(),
+        "lenders": list(lenders.values())
+    }
+
+def publish_sweep_events(result: dict):
+    """Un evento schedules.status_changed por prestamista: cada feed solo ve sus cuotas"""
+    for lender in result["lenders"]:
+        event_bus.publish("schedules.status_changed", {
+            **lender,
+            "late_until": result["late_until"],
+            "overdue_until": result["overdue_until"]
+        }, lender_id=lender["lender_id"])
+
+async def schedule_sweeper_loop():
+    while True:
+        try:
+            result = await sweep_schedule_statuses()
+            if result["marked_late"] or result["marked_overdue"]:
+                publish_sweep_events(result)
+                logger.info(f"Barrido de cuotas: {result['marked_late']} atrasadas, {result['marked_overdue']} en mora")
+        except Exception:
+            logger.exception("Error en el barrido de cuotas vencidas")
+        await asyncio.sleep(SCHEDULE_SWEEP_INTERVAL_SECONDS)
+
+@api_router.post("/admin/schedules/sweep")
+async def run_schedule_sweep(admin: AuthenticatedUser = Depends(require_admin)):
+    """Ejecuta el barrido de cuotas vencidas sin esperar al ciclo automático"""
+    result = await sweep_schedule_statuses()
+    publish_sweep_events(result)
+    return result
+
 @api_router.get("/admin/monthly-profit")
-async def get_monthly_profit(admin_id: str, year: int = None, month: int = None):
+async def get_monthly_profit(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
     """Calcula la utilidad (intereses) obtenida en un mes específico"""
     from datetime import datetime, timezone
     import calendar
@@ -797,13 +2169,13 @@ async def get_monthly_profit(admin_id: str, year: int = None, month: int = None)
     else:
         end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
     
-    # Obtener todos los pagos del mes
-    payments = await db.payments.find({
+    # Obtener todos los pagos del mes (también los de préstamos archivados)
+    payments = await find_payments_with_archive({
         "payment_date": {
             "$gte": start_date.isoformat(),
             "$lt": end_date.isoformat()
         }
-    }, {"_id": 0}).to_list(10000)
+    }, 10000, database=reporting_db)
     
     total_payments = 0
     total_interest = 0
@@ -817,7 +2189,7 @@ async def get_monthly_profit(admin_id: str, year: int = None, month: int = None)
         
         # Obtener información del préstamo si no la tenemos
         if loan_id not in loans_data:
-            loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
+            loan, _ = await find_loan_with_archive(loan_id, database=reporting_db)
             if loan:
                 loans_data[loan_id] = loan
         
@@ -847,13 +2219,13 @@ async def get_monthly_profit(admin_id: str, year: int = None, month: int = None)
     month_name = calendar.month_name[month]
     
     # Contar préstamos activos completados este mes
-    completed_this_month = await db.loans.count_documents({
+    completed_this_month = await count_loans_with_archive({
         "status": LoanStatus.COMPLETED,
         "approved_at": {
             "$gte": start_date.isoformat(),
             "$lt": end_date.isoformat()
         }
-    })
+    }, database=reporting_db)
     
     # Contar total de pagos en el mes
     payment_count = len(payments)
@@ -870,68 +2242,165 @@ async def get_monthly_profit(admin_id: str, year: int = None, month: int = None)
         "profit_margin": round((total_interest / total_payments * 100) if total_payments > 0 else 0, 1)
     }
 
+# Cache diario del reporte PAR en este proceso (el del día también se guarda en par_reports)
+par_report_cache = {}
+
+@api_router.get("/admin/portfolio-at-risk")
+async def get_portfolio_at_risk(refresh: bool = False, admin: AuthenticatedUser = Depends(require_admin)):
+    """Cartera en riesgo (PAR1/PAR7/PAR30/PAR90) global, por prestamista y por frecuencia de pago
+    
+    Se calcula una vez al día con una sola agregación por préstamo sobre las cuotas
+    impagas; refresh=true fuerza el recálculo.
+    """
+    now = datetime.now(timezone.utc)
+    day = now.date().isoformat()
+    
+    if not refresh:
+        if day in par_report_cache:
+            return par_report_cache[day]
+        stored = await db.par_reports.find_one({"as_of": day}, {"_id": 0})
+        if stored:
+            par_report_cache.clear()
+            par_report_cache[day] = stored
+            return stored
+    
+    rows = await reporting_db.payment_schedules.aggregate(
+        par_snapshot_pipeline(UNPAID_STATUSES, LoanStatus.ACTIVE),
+        allowDiskUse=True
+    ).to_list(None)
+    report = build_par_report(rows, now)
+    
+    await db.par_reports.replace_one({"as_of": day}, report, upsert=True)
+    par_report_cache.clear()
+    par_report_cache[day] = report
+    return report
+
+@api_router.get("/admin/cash-flow-projection")
+async def get_cash_flow_projection(
+    days: int = 90,
+    granularity: str = "day",
+    lender_id: Optional[str] = None,
+    apply_haircut: bool = False,
+    lookback_days: int = 90,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Proyección de recaudo de las cuotas impagas de los próximos `days` días
+    
+    Agrupa por periodo (day, week o month) y prestamista en el servidor usando el
+    índice (status, due_date). Con apply_haircut=true el monto esperado se ajusta
+    con la tasa de recaudo histórica de los últimos `lookback_days` días.
+    """
+    if granularity not in ("day", "week", "month"):
+        raise HTTPException(status_code=400, detail="granularity debe ser day, week o month")
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days debe estar entre 1 y 366")
+    
+    today = start_of_day(datetime.now(timezone.utc))
+    end = today + timedelta(days=days)
+    
+    pipelines = [reporting_db.payment_schedules.aggregate(
+        cash_flow_pipeline(UNPAID_STATUSES, today.isoformat(), end.isoformat(), granularity, lender_id),
+        allowDiskUse=True
+    ).to_list(None)]
+    if apply_haircut:
+        history_start = today - timedelta(days=lookback_days)
+        pipelines.append(reporting_db.payment_schedules.aggregate(
+            collection_rate_pipeline(PaymentStatus.PAID, UNPAID_STATUSES, history_start.isoformat(), today.isoformat()),
+            allowDiskUse=True
+        ).to_list(None))
+    results = await asyncio.gather(*pipelines)
+    
+    rates = collection_rates(results[1]) if apply_haircut else None
+    projection = build_cash_flow_projection(results[0], rates)
+    
+    return {
+        "from": today.date().isoformat(),
+        "to": end.date().isoformat(),
+        "granularity": granularity,
+        "haircut_applied": apply_haircut,
+        "collection_rate": rates,
+        **projection
+    }
+
 # Dashboard Stats
+def client_stats(loans: list, total_paid: int) -> dict:
+    """Estadísticas del cliente a partir de sus préstamos y el total pagado"""
+    active = [loan for loan in loans if loan["status"] == LoanStatus.ACTIVE]
+    total_debt = sum(loan["total_amount"] for loan in active)
+    return {
+        "active_loans": len(active),
+        "pending_loans": sum(1 for loan in loans if loan["status"] == LoanStatus.PENDING),
+        "completed_loans": sum(1 for loan in loans if loan["status"] == LoanStatus.COMPLETED),
+        "total_debt": round(total_debt, 2),
+        "total_paid": round(total_paid, 2),
+        "remaining": round(total_debt - total_paid, 2)
+    }
+
+def lender_stats(loans: list) -> dict:
+    """Estadísticas del prestamista a partir de sus préstamos asignados"""
+    return {
+        "active_loans": sum(1 for loan in loans if loan["status"] == LoanStatus.ACTIVE),
+        "completed_loans": sum(1 for loan in loans if loan["status"] == LoanStatus.COMPLETED),
+        "total_lent": round(sum(loan["amount"] for loan in loans), 2),
+        "total_expected": round(sum(
+            loan["total_amount"] for loan in loans
+            if loan["status"] in [LoanStatus.ACTIVE, LoanStatus.COMPLETED]
+        ), 2)
+    }
+
+async def client_total_paid(client_id: str) -> int:
+    pipeline = [
+        {"$match": {"client_id": client_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]
+    live, archived = await asyncio.gather(
+        payment_ledger().aggregate(pipeline),
+        db.payments_archive.aggregate(pipeline).to_list(None)
+    )
+    return sum(row["total"] for row in live + archived)
+
+async def admin_stats() -> dict:
+    """Conteos y volumen por estado en una sola agregación (sin traer los préstamos)"""
+    pipeline = [{"$group": {"_id": "$status", "count": {"$sum": 1}, "volume": {"$sum": "$amount"}}}]
+    live, archived, total_users = await asyncio.gather(
+        reporting_db.loans.aggregate(pipeline).to_list(None),
+        # Los préstamos archivados siguen contando en los totales
+        reporting_db.loans_archive.aggregate(pipeline).to_list(None),
+        reporting_db.users.count_documents({})
+    )
+    by_status = live + archived
+    counts = {}
+    for row in by_status:
+        counts[row["_id"]] = counts.get(row["_id"], 0) + row["count"]
+    return {
+        "total_loans": sum(counts.values()),
+        "pending_loans": counts.get(LoanStatus.PENDING, 0),
+        "active_loans": counts.get(LoanStatus.ACTIVE, 0),
+        "total_users": total_users,
+        "total_volume": round(sum(row["volume"] for row in by_status), 2)
+    }
+
 @api_router.get("/stats/dashboard")
-async def get_dashboard_stats(user_id: str, role: str):
-    stats = {}
-    
+async def get_dashboard_stats(user_id: str, role: str, user: AuthenticatedUser = Depends(current_user)):
+    # El rol sale del token: un cliente no puede pedir las estadísticas de admin
+    ensure_self_or_admin(user, user_id)
+    if user.role != UserRole.ADMIN:
+        role = user.role
     if role == UserRole.CLIENT:
-        # Client stats
-        active_loans = await db.loans.count_documents({"client_id": user_id, "status": LoanStatus.ACTIVE})
-        pending_loans = await db.loans.count_documents({"client_id": user_id, "status": LoanStatus.PENDING})
-        completed_loans = await db.loans.count_documents({"client_id": user_id, "status": LoanStatus.COMPLETED})
-        
-        # Total debt
-        loans = await db.loans.find({"client_id": user_id, "status": LoanStatus.ACTIVE}, {"_id": 0}).to_list(1000)
-        total_debt = sum(loan["total_amount"] for loan in loans)
-        
-        # Paid amount
-        payments = await db.payments.find({"client_id": user_id}, {"_id": 0}).to_list(1000)
-        total_paid = sum(payment["amount"] for payment in payments)
-        
-        stats = {
-            "active_loans": active_loans,
-            "pending_loans": pending_loans,
-            "completed_loans": completed_loans,
-            "total_debt": round(total_debt, 2),
-            "total_paid": round(total_paid, 2),
-            "remaining": round(total_debt - total_paid, 2)
-        }
-    
-    elif role == UserRole.LENDER:
-        # Lender stats
-        active_loans = await db.loans.count_documents({"lender_id": user_id, "status": LoanStatus.ACTIVE})
-        completed_loans = await db.loans.count_documents({"lender_id": user_id, "status": LoanStatus.COMPLETED})
-        
-        loans = await db.loans.find({"lender_id": user_id}, {"_id": 0}).to_list(1000)
-        total_lent = sum(loan["amount"] for loan in loans)
-        total_expected = sum(loan["total_amount"] for loan in loans if loan["status"] in [LoanStatus.ACTIVE, LoanStatus.COMPLETED])
-        
-        stats = {
-            "active_loans": active_loans,
-            "completed_loans": completed_loans,
-            "total_lent": round(total_lent, 2),
-            "total_expected": round(total_expected, 2)
-        }
+        loans, archived, total_paid = await asyncio.gather(
+            find_loans(client_id=user_id),
+            find_archived_loans_for_stats({"client_id": user_id}),
+            client_total_paid(user_id)
+        )
+        return client_stats(loans + archived, total_paid)
     
-    else:  # Admin
-        total_loans = await db.loans.count_documents({})
-        pending_loans = await db.loans.count_documents({"status": LoanStatus.PENDING})
-        active_loans = await db.loans.count_documents({"status": LoanStatus.ACTIVE})
-        total_users = await db.users.count_documents({})
-        
-        all_loans = await db.loans.find({}, {"_id": 0}).to_list(10000)
-        total_volume = sum(loan["amount"] for loan in all_loans)
-        
-        stats = {
-            "total_loans": total_loans,
-            "pending_loans": pending_loans,
-            "active_loans": active_loans,
-            "total_users": total_users,
-            "total_volume": round(total_volume, 2)
-        }
+    if role == UserRole.LENDER:
+        loans, archived = await asyncio.gather(
+            find_loans(lender_id=user_id), find_archived_loans_for_stats({"lender_id": user_id})
+        )
+        return lender_stats(loans + archived)
     
-    return stats
+    return await admin_stats()
 
 # ==================== ADMIN EXTENSIONS ====================
 # Importar modelos adicionales
@@ -941,8 +2410,8 @@ from admin_extensions import (
 )
 
 # System Configuration Routes
-@api_router.get("/config/system")
-async def get_system_config():
+async def load_system_config() -> dict:
+    """Configuración del sistema; la crea con los valores por defecto si no existe"""
     config = await db.system_config.find_one({}, {"_id": 0})
     if not config:
         # Crear configuración por defecto si no existe
@@ -963,7 +2432,7 @@ async def get_system_config():
             "updated_at": datetime.now(timezone.utc).isoformat(),
             "updated_by": "system"
         }
-        await db.system_config.insert_one(default_config)
+        await db.system_config.insert_one(dict(default_config))  # insert_one agrega _id al dict
         config = default_config
     
     # Asegurar que payment_frequencies existe
@@ -984,15 +2453,27 @@ async def get_system_config():
     
     return config
 
+@api_router.get("/config/system")
+async def get_system_config(request: Request, response: Response):
+    # La configuración cambia solo por PUT /config/system, que fija updated_at
+    current = await db.system_config.find_one({}, {"_id": 0, "id": 1, "updated_at": 1})
+    if current:
+        etag = make_etag("config", current["id"], current.get("updated_at"))
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        set_cache_headers(response, etag)
+    return await load_system_config()
+
 @api_router.put("/config/system")
-async def update_system_config(config_update: SystemConfigUpdate, admin_id: str):
+async def update_system_config(config_update: SystemConfigUpdate, admin: AuthenticatedUser = Depends(require_admin)):
     config = await db.system_config.find_one({}, {"_id": 0})
     
     update_data = {
         "default_interest_rate": config_update.default_interest_rate,
         "available_interest_rates": config_update.available_interest_rates,
         "updated_at": datetime.now(timezone.utc).isoformat(),
-        "updated_by": admin_id
+        "updated_by": admin.id
     }
     
     # Actualizar payment_frequencies si se proporcionan
@@ -1025,23 +2506,36 @@ async def update_system_config(config_update: SystemConfigUpdate, admin_id: str)
     
     return {"message": "Configuración actualizada exitosamente"}
 
-# User Management Routes (Admin only)
+# User Management Routes (Admin only, salvo los datos propios)
 @api_router.put("/users/{user_id}")
-async def update_user(user_id: str, user_update: UserUpdate):
+async def update_user(user_id: str, user_update: UserUpdate, user: AuthenticatedUser = Depends(current_user)):
+    ensure_self_or_admin(user, user_id)
     update_data = {k: v for k, v in user_update.model_dump().items() if v is not None}
     
     if not update_data:
         raise HTTPException(status_code=400, detail="No hay datos para actualizar")
+    # Cada usuario edita sus datos; rol y estado solo los cambia un administrador
+    if user.role != UserRole.ADMIN and ("role" in update_data or "active" in update_data):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede cambiar el rol o el estado")
+    if "role" in update_data and update_data["role"] not in [role.value for role in UserRole]:
+        raise HTTPException(status_code=400, detail=f"Rol inválido: {update_data['role']}")
     
     result = await db.users.update_one({"id": user_id}, {"$set": update_data})
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    await bump_revision("users")
+    user_cache.invalidate(user_id)
     
     return {"message": "Usuario actualizado exitosamente"}
 
 @api_router.put("/users/{user_id}/password")
-async def update_user_password(user_id: str, password_update: PasswordUpdate):
+async def update_user_password(
+    user_id: str,
+    password_update: PasswordUpdate,
+    user: AuthenticatedUser = Depends(current_user)
+):
+    ensure_self_or_admin(user, user_id)
     hashed_password = hash_password(password_update.new_password)
     
     result = await db.users.update_one(
@@ -1055,7 +2549,7 @@ async def update_user_password(user_id: str, password_update: PasswordUpdate):
     return {"message": "Contraseña actualizada exitosamente"}
 
 @api_router.get("/users/{user_id}/active-loans")
-async def check_user_active_loans(user_id: str):
+async def check_user_active_loans(user_id: str, admin: AuthenticatedUser = Depends(require_admin)):
     # Verificar si el usuario tiene préstamos activos
     active_loans_count = await db.loans.count_documents({
         "$or": [
@@ -1070,7 +2564,7 @@ async def check_user_active_loans(user_id: str):
     }
 
 @api_router.put("/users/{user_id}/toggle-active")
-async def toggle_user_active(user_id: str):
+async def toggle_user_active(user_id: str, admin: AuthenticatedUser = Depends(require_admin)):
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -1084,12 +2578,15 @@ async def toggle_user_active(user_id: str):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    await bump_revision("users")
+    # Un usuario desactivado deja de autenticarse en la siguiente solicitud
+    user_cache.invalidate(user_id)
     
     status_text = "activado" if new_status else "desactivado"
     return {"message": f"Usuario {status_text} exitosamente", "active": new_status}
 
 @api_router.delete("/users/{user_id}/permanent")
-async def delete_user_permanently(user_id: str):
+async def delete_user_permanently(user_id: str, admin: AuthenticatedUser = Depends(require_admin)):
     """Eliminar definitivamente un usuario SOLO si está inactivo"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
@@ -1122,12 +2619,15 @@ async def delete_user_permanently(user_id: str):
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    await bump_revision("users")
+    user_cache.invalidate(user_id)
     
     return {"message": f"Usuario eliminado definitivamente"}
 
 @api_router.get("/users/{lender_id}/assigned-loans")
-async def get_lender_assigned_loans(lender_id: str):
+async def get_lender_assigned_loans(lender_id: str, user: AuthenticatedUser = Depends(require_staff)):
     """Obtiene todos los préstamos asignados a un prestamista"""
+    ensure_self_or_admin(user, lender_id)
     loans = await db.loans.find({
         "lender_id": lender_id,
         "status": {"$in": [LoanStatus.ACTIVE, LoanStatus.PENDING]}
@@ -1158,9 +2658,69 @@ async def get_lender_assigned_loans(lender_id: str):
         "total_pending_loans": len([l for l in loans if l["status"] == LoanStatus.PENDING])
     }
 
+async def reassign_lender_clients_job(params: dict, report) -> dict:
+    """Mueve préstamos activos y pendientes (y sus cuotas) de un prestamista a otro"""
+    old_lender_id = params["old_lender_id"]
+    new_lender_id = params["new_lender_id"]
+    new_lender_name = params["new_lender_name"]
+    
+    # Obtener los préstamos activos y pendientes a reasignar
+    loan_ids = [
+        loan["id"] async for loan in db.loans.find(
+            {
+                "lender_id": old_lender_id,
+                "status": {"$in": [LoanStatus.ACTIVE, LoanStatus.PENDING]}
+            },
+            {"_id": 0, "id": 1}
+        )
+    ]
+    
+    # Actualizar cuotas y préstamos por lotes con el mismo conjunto de IDs. Las cuotas
+    # van primero: si el trabajo se retoma, los préstamos del lote siguen en el
+    # prestamista original y el lote se repite completo
+    modified_loans = 0
+    modified_schedules = 0
+    for i in range(0, len(loan_ids), BULK_CHUNK_SIZE):
+        chunk = loan_ids[i:i + BULK_CHUNK_SIZE]
+        result = await db.payment_schedules.update_many(
+            {"loan_id": {"$in": chunk}},
+            {"$set": {"lender_id": new_lender_id}}
+        )
+        modified_schedules += result.modified_count
+        result = await db.loans.update_many(
+            {"id": {"$in": chunk}},
+            {"$set": {
+                "lender_id": new_lender_id,
+                "lender_name": new_lender_name
+            }, "$inc": {"version": 1}}
+        )
+        modified_loans += result.modified_count
+        await report(i + len(chunk), len(loan_ids))
+    
+    for lender_id in (old_lender_id, new_lender_id):
+        event_bus.publish("loans.reassigned", {
+            "old_lender_id": old_lender_id,
+            "new_lender_id": new_lender_id,
+            "modified_loans": modified_loans
+        }, lender_id=lender_id)
+    
+    return {
+        "message": f"Se reasignaron {modified_loans} préstamos de {params['old_lender_name']} a {new_lender_name}",
+        "modified_loans": modified_loans,
+        "modified_schedules": modified_schedules
+    }
+
 @api_router.post("/users/{old_lender_id}/reassign-clients")
-async def reassign_lender_clients(old_lender_id: str, new_lender_id: str, admin_id: str):
-    """Reasigna todos los clientes de un prestamista a otro"""
+async def reassign_lender_clients(
+    old_lender_id: str,
+    new_lender_id: str,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Reasigna todos los clientes de un prestamista a otro (en segundo plano)
+    
+    Valida los prestamistas y devuelve el trabajo encolado; el resultado se consulta
+    con GET /admin/jobs/{job_id}
+    """
     # Verificar que ambos prestamistas existen
     old_lender = await db.users.find_one({"id": old_lender_id}, {"_id": 0})
     new_lender = await db.users.find_one({"id": new_lender_id}, {"_id": 0})
@@ -1172,32 +2732,63 @@ async def reassign_lender_clients(old_lender_id: str, new_lender_id: str, admin_
     if new_lender["role"] != "lender":
         raise HTTPException(status_code=400, detail="El usuario destino debe ser prestamista")
     
-    # Actualizar todos los préstamos activos y pendientes
-    result = await db.loans.update_many(
-        {
-            "lender_id": old_lender_id,
-            "status": {"$in": [LoanStatus.ACTIVE, LoanStatus.PENDING]}
-        },
-        {"$set": {
-            "lender_id": new_lender_id,
-            "lender_name": new_lender["name"]
-        }}
-    )
+    return await job_runner.enqueue("reassign_lender_clients", {
+        "old_lender_id": old_lender_id,
+        "old_lender_name": old_lender["name"],
+        "new_lender_id": new_lender_id,
+        "new_lender_name": new_lender["name"]
+    }, requested_by=admin.id)
+
+async def backfill_schedule_lenders_job(params: dict, report) -> dict:
+    """Migración: copia lender_id del préstamo a todas sus cuotas
     
-    # Actualizar schedules de pagos
-    await db.payment_schedules.update_many(
-        {"loan_id": {"$in": []}},  # Necesitaríamos obtener los loan_ids pero para simplificar...
-        {"$set": {"lender_id": new_lender_id}}
-    )
+    Necesaria para cuotas creadas antes de denormalizar el prestamista. Es idempotente
+    (solo modifica cuotas cuyo lender_id difiere del de su préstamo), así que si el
+    trabajo se interrumpe se puede repetir completo.
+    """
+    query = {"lender_id": {"$ne": None}}
+    total = await db.loans.count_documents(query)
+    operations = []
+    loans_scanned = 0
+    modified_schedules = 0
+    
+    async for loan in db.loans.find(query, {"_id": 0, "id": 1, "lender_id": 1}).batch_size(BULK_CHUNK_SIZE):
+        loans_scanned += 1
+        operations.append(UpdateMany(
+            {"loan_id": loan["id"], "lender_id": {"$ne": loan["lender_id"]}},
+            {"$set": {"lender_id": loan["lender_id"]}}
+        ))
+        if len(operations) >= BULK_CHUNK_SIZE:
+            result = await db.payment_schedules.bulk_write(operations, ordered=False)
+            modified_schedules += result.modified_count
+            operations = []
+            await report(loans_scanned, total)
+    
+    if operations:
+        result = await db.payment_schedules.bulk_write(operations, ordered=False)
+        modified_schedules += result.modified_count
+    await report(loans_scanned, total)
     
     return {
-        "message": f"Se reasignaron {result.modified_count} préstamos de {old_lender['name']} a {new_lender['name']}",
-        "modified_loans": result.modified_count
+        "loans_scanned": loans_scanned,
+        "modified_schedules": modified_schedules
     }
 
+@api_router.post("/admin/migrations/backfill-schedule-lenders")
+async def backfill_schedule_lenders(admin: AuthenticatedUser = Depends(require_admin)):
+    """Copia lender_id de los préstamos a sus cuotas (en segundo plano)
+    
+    Devuelve el trabajo encolado; el resultado se consulta con GET /admin/jobs/{job_id}
+    """
+    return await job_runner.enqueue("backfill_schedule_lenders", {}, requested_by=admin.id)
+
 # Loan Proposal Routes
 @api_router.post("/loans/{loan_id}/propose")
-async def create_loan_proposal(loan_id: str, proposal_data: LoanProposalCreate):
+async def create_loan_proposal(
+    loan_id: str,
+    proposal_data: LoanProposalCreate,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
     # Obtener el préstamo
     loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
     if not loan:
@@ -1207,15 +2798,21 @@ async def create_loan_proposal(loan_id: str, proposal_data: LoanProposalCreate):
         raise HTTPException(status_code=400, detail="Solo se pueden crear propuestas para préstamos pendientes")
     
     # Obtener prestamista
-    lender = await db.users.find_one({"id": proposal_data.lender_id}, {"_id": 0})
-    if not lender:
-        raise HTTPException(status_code=404, detail="Prestamista no encontrado")
+    lender = await find_assignable_lender(proposal_data.lender_id)
     
     # Calcular nuevo préstamo con tasa propuesta
     if isinstance(loan["created_at"], str):
         loan["created_at"] = datetime.fromisoformat(loan["created_at"])
     
-    new_calc = calculate_loan(loan["amount"], proposal_data.proposed_interest_rate, loan["term_months"])
+    # Misma frecuencia y cargos del préstamo: solo cambia la tasa
+    new_calc = calculate_loan(
+        loan["amount"],
+        proposal_data.proposed_interest_rate,
+        loan["term_months"],
+        loan.get("payment_frequency_days") or 30,
+        loan.get("system_fee_percentage", 0.5),
+        loan.get("insurance_fee_percentage", 1.0)
+    )
     
     # Crear propuesta
     proposal = LoanProposal(
@@ -1228,7 +2825,7 @@ async def create_loan_proposal(loan_id: str, proposal_data: LoanProposalCreate):
         original_interest_rate=loan["interest_rate"],
         proposed_interest_rate=proposal_data.proposed_interest_rate,
         original_monthly_payment=loan["monthly_payment"],
-        proposed_monthly_payment=new_calc["monthly_payment"],
+        proposed_monthly_payment=new_calc["payment_amount"],
         original_total_amount=loan["total_amount"],
         proposed_total_amount=new_calc["total_amount"],
         reason=proposal_data.reason,
@@ -1245,10 +2842,19 @@ async def create_loan_proposal(loan_id: str, proposal_data: LoanProposalCreate):
     return proposal
 
 @api_router.get("/proposals", response_model=List[LoanProposal])
-async def get_proposals(client_id: Optional[str] = None, status: Optional[str] = None):
+async def get_proposals(
+    client_id: Optional[str] = None,
+    status: Optional[str] = None,
+    user: AuthenticatedUser = Depends(current_user)
+):
     query = {}
     if client_id:
         query["client_id"] = client_id
+    # El cliente ve sus propuestas y el prestamista las que hizo
+    if user.role == UserRole.CLIENT:
+        query["client_id"] = user.id
+    elif user.role == UserRole.LENDER:
+        query["lender_id"] = user.id
     if status:
         query["status"] = status
     
@@ -1262,88 +2868,118 @@ async def get_proposals(client_id: Optional[str] = None, status: Optional[str] =
     return proposals
 
 @api_router.post("/proposals/{proposal_id}/respond")
-async def respond_to_proposal(proposal_id: str, response: LoanProposalResponse):
-    # Obtener propuesta
-    proposal = await db.loan_proposals.find_one({"id": proposal_id}, {"_id": 0})
-    if not proposal:
-        raise HTTPException(status_code=404, detail="Propuesta no encontrada")
-    
-    if proposal["status"] != ProposalStatus.PENDING:
-        raise HTTPException(status_code=400, detail="Esta propuesta ya fue respondida")
-    
-    # Actualizar estado de la propuesta
-    new_status = ProposalStatus.ACCEPTED if response.accepted else ProposalStatus.REJECTED
-    await db.loan_proposals.update_one(
-        {"id": proposal_id},
-        {"$set": {
-            "status": new_status,
-            "responded_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
-    
-    if response.accepted:
-        # Obtener la fecha de inicio de la propuesta
-        start_date_str = proposal.get("start_date")
-        if isinstance(start_date_str, str):
-            start_date = datetime.fromisoformat(start_date_str)
-        else:
-            start_date = start_date_str
+async def respond_to_proposal(
+    proposal_id: str,
+    response: LoanProposalResponse,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: AuthenticatedUser = Depends(require_roles(UserRole.CLIENT, UserRole.ADMIN))
+):
+    async def respond(session, idempotency):
+        # Obtener propuesta
+        proposal = await db.loan_proposals.find_one({"id": proposal_id}, {"_id": 0}, session=session)
+        if not proposal:
+            raise HTTPException(status_code=404, detail="Propuesta no encontrada")
+        # Responde el cliente del préstamo (o un admin en su nombre)
+        ensure_self_or_admin(user, proposal["client_id"])
         
-        # Actualizar el préstamo con la nueva tasa
-        await db.loans.update_one(
-            {"id": proposal["loan_id"]},
-            {"$set": {
+        if proposal["status"] != ProposalStatus.PENDING:
+            raise HTTPException(status_code=400, detail="Esta propuesta ya fue respondida")
+        
+        if response.accepted:
+            loan = await db.loans.find_one({"id": proposal["loan_id"]}, {"_id": 0}, session=session)
+            if not loan:
+                raise HTTPException(status_code=404, detail="Loan not found")
+            if loan["status"] != LoanStatus.PENDING:
+                raise HTTPException(status_code=400, detail="Solo se pueden aprobar préstamos pendientes")
+            
+            # Obtener la fecha de inicio de la propuesta
+            start_date_str = proposal.get("start_date")
+            if isinstance(start_date_str, str):
+                start_date = datetime.fromisoformat(start_date_str)
+            else:
+                start_date = start_date_str
+            
+            # Cronograma con la nueva tasa de la propuesta
+            terms = {
                 "interest_rate": proposal["proposed_interest_rate"],
                 "monthly_payment": proposal["proposed_monthly_payment"],
-                "total_amount": proposal["proposed_total_amount"],
+                "total_amount": proposal["proposed_total_amount"]
+            }
+            schedule_docs = build_schedule_docs({**loan, **terms}, start_date, proposal["lender_id"])
+            
+            # Activar el préstamo con su número en una sola escritura (falla si otra
+            # aprobación lo tomó primero; la transacción descarta el número reservado)
+            loan_number = (await reserve_loan_numbers(1, session=session))[0]
+            await claim_loan(loan, {"$set": {
+                **terms,
                 "status": LoanStatus.ACTIVE,
                 "lender_id": proposal["lender_id"],
                 "lender_name": proposal["lender_name"],
+                "loan_number": loan_number,
                 "approved_at": datetime.now(timezone.utc).isoformat(),
-                "start_date": start_date.isoformat()
-            }}
-        )
+                "start_date": start_date.isoformat(),
+                "balance": initial_balance(schedule_docs)
+            }}, session=session)
+            await db.payment_schedules.insert_many(schedule_docs, session=session)
         
-        # Obtener el préstamo actualizado
-        loan = await db.loans.find_one({"id": proposal["loan_id"]}, {"_id": 0})
+        # Actualizar estado de la propuesta (falla si otra respuesta llegó antes)
+        new_status = ProposalStatus.ACCEPTED if response.accepted else ProposalStatus.REJECTED
+        answered = await db.loan_proposals.update_one(
+            {"id": proposal_id, "status": ProposalStatus.PENDING},
+            {"$set": {
+                "status": new_status,
+                "responded_at": datetime.now(timezone.utc).isoformat()
+            }},
+            session=session
+        )
+        if answered.modified_count == 0:
+            raise HTTPException(status_code=400, detail="Esta propuesta ya fue respondida")
         
-        # Obtener días entre pagos según la forma de pago del préstamo
-        payment_frequency_days = loan.get("payment_frequency_days", 30)
+        if not response.accepted:
+            result = {"message": "Propuesta rechazada"}
+            await idempotency.complete(result, session=session)
+            return result
         
-        # Crear cronograma de pagos con la nueva tasa
-        for i in range(1, loan["term_months"] + 1):
-            # Calcular fecha de vencimiento según la frecuencia de pago
-            due_date = start_date + timedelta(days=payment_frequency_days * i)
-            schedule = PaymentSchedule(
-                loan_id=loan["id"],
-                client_id=loan["client_id"],
-                client_name=loan["client_name"],
-                payment_number=i,
-                due_date=due_date,
-                amount=loan["monthly_payment"],
-                status=PaymentStatus.PENDING
-            )
-            schedule_doc = schedule.model_dump()
-            schedule_doc["due_date"] = schedule_doc["due_date"].isoformat()
-            await db.payment_schedules.insert_one(schedule_doc)
-        
-        return {"message": "Propuesta aceptada y préstamo activado exitosamente"}
-    else:
-        return {"message": "Propuesta rechazada"}
+        result = {"message": "Propuesta aceptada y préstamo activado exitosamente"}
+        await idempotency.complete(result, session=session)
+        return result
+    
+    async def operation(idempotency):
+        # Préstamo, número, cronograma y propuesta se escriben juntos; se reintenta
+        # si el préstamo cambió entre la lectura y la escritura
+        result = await run_with_version_retry(partial(respond, idempotency=idempotency))
+        if response.accepted:
+            proposal = await db.loan_proposals.find_one({"id": proposal_id}, {"_id": 0})
+            event_bus.publish("loan.approved", {
+                "loan_id": proposal["loan_id"],
+                "lender_name": proposal["lender_name"],
+                "status": LoanStatus.ACTIVE
+            }, lender_id=proposal["lender_id"], client_id=proposal["client_id"])
+        return result
+    
+    return await run_idempotent(
+        f"proposal:{proposal_id}",
+        user,
+        idempotency_key,
+        response.model_dump(),
+        operation
+    )
 
-@api_router.get("/proposals/count")
-async def get_proposals_count(client_id: str):
-    count = await db.loan_proposals.count_documents({
+async def count_pending_proposals(client_id: str) -> int:
+    return await db.loan_proposals.count_documents({
         "client_id": client_id,
         "status": ProposalStatus.PENDING
     })
-    return {"count": count}
+
+@api_router.get("/proposals/count")
+async def get_proposals_count(client_id: str, user: AuthenticatedUser = Depends(current_user)):
+    ensure_self_or_admin(user, client_id)
+    return {"count": await count_pending_proposals(client_id)}
 
 # ============= Endpoints de Gestión Financiera =============
 
-@api_router.get("/admin/monthly-utility")
-async def get_monthly_utility(year: int = None, month: int = None):
-    """Obtiene la utilidad mensual (intereses cobrados) del mes actual o especificado
+async def compute_monthly_utility(year: int = None, month: int = None) -> dict:
+    """Utilidad mensual (intereses cobrados) del mes actual o especificado
     
     Calcula los intereses de forma precisa basándose en:
     - Solo las cuotas PAGADAS en el mes especificado
@@ -1366,13 +3002,13 @@ async def get_monthly_utility(year: int = None, month: int = None):
     else:
         end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
     
-    # Obtener todos los pagos del mes
-    payments = await db.payments.find({
+    # Obtener todos los pagos del mes (también los de préstamos archivados)
+    payments = await find_payments_with_archive({
         "payment_date": {
             "$gte": start_date.isoformat(),
             "$lt": end_date.isoformat()
         }
-    }, {"_id": 0}).to_list(10000)
+    }, 10000, database=reporting_db)
     
     total_payments = 0
     total_interest = 0
@@ -1387,46 +3023,32 @@ async def get_monthly_utility(year: int = None, month: int = None):
         
         # Obtener información del préstamo si no la tenemos
         if loan_id not in loans_data:
-            loan = await db.loans.find_one({"id": loan_id}, {"_id": 0})
+            loan, _ = await find_loan_with_archive(loan_id, database=reporting_db)
             if loan:
                 loans_data[loan_id] = loan
         
         if loan_id in loans_data:
             loan = loans_data[loan_id]
             
-            # Calcular schedule de amortización para obtener interés exacto
-            monthly_rate = loan["interest_rate"] / 100 / 12
-            monthly_payment = loan["monthly_payment"]
-            original_amount = loan["amount"]
-            
-            # Calcular el balance restante antes de este pago
-            balance = original_amount
-            for i in range(1, payment_number):
-                interest_for_period = balance * monthly_rate
-                principal_for_period = monthly_payment - interest_for_period
-                balance -= principal_for_period
-            
-            # El interés de esta cuota es el balance multiplicado por la tasa mensual
-            interest_for_this_payment = balance * monthly_rate
-            
-            # Si el pago es menor que la cuota completa (pago parcial), 
-            # calcular proporción del interés
-            if payment_amount < monthly_payment:
-                interest_portion = (payment_amount / monthly_payment) * interest_for_this_payment
-            else:
-                # Para pagos normales o mayores, tomar el interés calculado
-                interest_portion = interest_for_this_payment
+            # Calcular interés exacto según la amortización del préstamo
+            interest_portion = interest_for_payment(
+                loan["amount"],
+                loan["interest_rate"],
+                loan["monthly_payment"],
+                payment_number,
+                payment_amount
+            )
             
             total_interest += interest_portion
     
     # Contar préstamos activos y completados
-    active_loans = await db.loans.count_documents({
+    active_loans = await reporting_db.loans.count_documents({
         "status": {"$in": [LoanStatus.ACTIVE, LoanStatus.APPROVED]}
     })
     
-    completed_loans = await db.loans.count_documents({
+    completed_loans = await count_loans_with_archive({
         "status": LoanStatus.COMPLETED
-    })
+    }, database=reporting_db)
     
     return {
         "month": month,
@@ -1437,8 +3059,17 @@ async def get_monthly_utility(year: int = None, month: int = None):
         "completed_loans_count": completed_loans
     }
 
+@api_router.get("/admin/monthly-utility")
+async def get_monthly_utility(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Obtiene la utilidad mensual (intereses cobrados) del mes actual o especificado"""
+    return await compute_monthly_utility(year, month)
+
 @api_router.post("/admin/expenses")
-async def create_expense(expense: dict, admin_id: str):
+async def create_expense(expense: dict, admin: AuthenticatedUser = Depends(require_admin)):
     """Crear un nuevo gasto mensual (fijo o general)"""
     from datetime import datetime, timezone
     
@@ -1453,7 +3084,7 @@ async def create_expense(expense: dict, admin_id: str):
         "year": int(expense["year"]),
         "is_fixed": is_fixed,
         "created_at": datetime.now(timezone.utc).isoformat(),
-        "created_by": admin_id
+        "created_by": admin.id
     }
     
     # Si es gasto fijo, también agregarlo a la lista de gastos fijos
@@ -1463,7 +3094,7 @@ async def create_expense(expense: dict, admin_id: str):
             "description": expense_data["description"],
             "amount": expense_data["amount"],
             "created_at": expense_data["created_at"],
-            "created_by": admin_id,
+            "created_by": admin.id,
             "active": True
         }
         await db.fixed_expenses.insert_one({**fixed_expense, "_id": fixed_expense["id"]})
@@ -1471,9 +3102,8 @@ async def create_expense(expense: dict, admin_id: str):
     await db.expenses.insert_one({**expense_data, "_id": expense_data["id"]})
     return expense_data
 
-@api_router.get("/admin/expenses")
-async def get_expenses(year: int = None, month: int = None):
-    """Obtener gastos del mes actual o especificado
+async def month_expenses(year: int = None, month: int = None) -> List[dict]:
+    """Gastos del mes actual o especificado
     
     Incluye automáticamente:
     - Gastos fijos activos (si no están ya registrados para este mes)
@@ -1529,8 +3159,17 @@ async def get_expenses(year: int = None, month: int = None):
     
     return expenses
 
+@api_router.get("/admin/expenses")
+async def get_expenses(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Obtener gastos del mes actual o especificado (incluye los gastos fijos activos)"""
+    return await month_expenses(year, month)
+
 @api_router.delete("/admin/expenses/{expense_id}")
-async def delete_expense(expense_id: str):
+async def delete_expense(expense_id: str, admin: AuthenticatedUser = Depends(require_admin)):
     """Eliminar un gasto (solo generales, los fijos se gestionan desde fixed-expenses)"""
     # Verificar si es un gasto fijo
     expense = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
@@ -1546,7 +3185,7 @@ async def delete_expense(expense_id: str):
 # ============= Endpoints de Gastos Fijos =============
 
 @api_router.get("/admin/fixed-expenses")
-async def get_fixed_expenses():
+async def get_fixed_expenses(admin: AuthenticatedUser = Depends(require_admin)):
     """Obtener lista de gastos fijos/recurrentes"""
     fixed_expenses = await db.fixed_expenses.find({
         "active": True
@@ -1554,7 +3193,7 @@ async def get_fixed_expenses():
     return fixed_expenses
 
 @api_router.post("/admin/fixed-expenses")
-async def create_fixed_expense(expense: dict, admin_id: str):
+async def create_fixed_expense(expense: dict, admin: AuthenticatedUser = Depends(require_admin)):
     """Agregar un nuevo gasto fijo a la plantilla"""
     from datetime import datetime, timezone
     
@@ -1563,7 +3202,7 @@ async def create_fixed_expense(expense: dict, admin_id: str):
         "description": expense["description"],
         "amount": int(expense["amount"]),
         "created_at": datetime.now(timezone.utc).isoformat(),
-        "created_by": admin_id,
+        "created_by": admin.id,
         "active": True
     }
     
@@ -1571,7 +3210,7 @@ async def create_fixed_expense(expense: dict, admin_id: str):
     return fixed_expense
 
 @api_router.delete("/admin/fixed-expenses/{expense_id}")
-async def delete_fixed_expense(expense_id: str):
+async def delete_fixed_expense(expense_id: str, admin: AuthenticatedUser = Depends(require_admin)):
     """Eliminar un gasto fijo de la plantilla (marca como inactivo)"""
     result = await db.fixed_expenses.update_one(
         {"id": expense_id},
@@ -1582,7 +3221,11 @@ async def delete_fixed_expense(expense_id: str):
     return {"message": "Gasto fijo eliminado"}
 
 @api_router.put("/admin/fixed-expenses/{expense_id}")
-async def update_fixed_expense(expense_id: str, expense: dict):
+async def update_fixed_expense(
+    expense_id: str,
+    expense: dict,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
     """Actualizar un gasto fijo"""
     update_data = {
         "description": expense["description"],
@@ -1599,23 +3242,9 @@ async def update_fixed_expense(expense_id: str, expense: dict):
     
     return {"message": "Gasto fijo actualizado"}
 
-@api_router.get("/admin/financial-comparison")
-async def get_financial_comparison(year: int = None, month: int = None):
-    """Obtener comparación de gastos vs utilidad"""
-    from datetime import datetime, timezone
-    
-    # Si no se especifica año/mes, usar el mes actual
-    if not year or not month:
-        now = datetime.now(timezone.utc)
-        year = now.year
-        month = now.month
-    
-    # Obtener utilidad del mes
-    utility_data = await get_monthly_utility(year, month)
+def build_financial_comparison(year: int, month: int, utility_data: dict, expenses: list) -> dict:
+    """Comparación de gastos vs utilidad a partir de datos ya calculados"""
     total_utility = utility_data["total_interest_collected"]
-    
-    # Obtener gastos del mes
-    expenses = await get_expenses(year, month)
     total_expenses = sum(exp["amount"] for exp in expenses)
     
     # Agrupar gastos por categoría
@@ -1640,8 +3269,340 @@ async def get_financial_comparison(year: int = None, month: int = None):
         "expenses_breakdown": expenses_breakdown
     }
 
-# Include router
-app.include_router(api_router)
+@api_router.get("/admin/financial-comparison")
+async def get_financial_comparison(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Obtener comparación de gastos vs utilidad"""
+    # Si no se especifica año/mes, usar el mes actual
+    if not year or not month:
+        now = datetime.now(timezone.utc)
+        year = now.year
+        month = now.month
+    
+    # Utilidad y gastos del mes
+    utility_data = await compute_monthly_utility(year, month)
+    expenses = await month_expenses(year, month)
+    return build_financial_comparison(year, month, utility_data, expenses)
+
+async def monthly_report_job(params: dict, report) -> dict:
+    """Cierre de mes: utilidad, gastos y comparación en un solo resultado"""
+    year, month = params["year"], params["month"]
+    utility = await compute_monthly_utility(year, month)
+    await report(1, 2)
+    expenses = await month_expenses(year, month)
+    comparison = build_financial_comparison(year, month, utility, expenses)
+    return jsonable_encoder({
+        "year": year,
+        "month": month,
+        "utility": utility,
+        "expenses": expenses,
+        "comparison": comparison
+    })
+
+@api_router.post("/admin/reports/monthly")
+async def enqueue_monthly_report(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Encola el reporte de cierre de mes (por defecto el mes actual)"""
+    if not year or not month:
+        now = datetime.now(timezone.utc)
+        year, month = now.year, now.month
+    return await job_runner.enqueue("monthly_report", {"year": year, "month": month}, requested_by=admin.id)
+
+# ============= Datos agrupados por pantalla =============
+# Cada panel se carga con una sola solicitud; las consultas corren en paralelo y
+# los datos compartidos (préstamos, utilidad, gastos) se calculan una vez
+
+@api_router.get("/bundles/client-dashboard")
+async def get_client_dashboard_bundle(client_id: str, user: AuthenticatedUser = Depends(current_user)):
+    ensure_self_or_admin(user, client_id)
+    loans, archived, total_paid, proposals_count, config = await asyncio.gather(
+        find_loans(client_id=client_id),
+        find_archived_loans_for_stats({"client_id": client_id}),
+        client_total_paid(client_id),
+        count_pending_proposals(client_id),
+        load_system_config()
+    )
+    return {
+        "stats": client_stats(loans + archived, total_paid),
+        "loans": loans,
+        "proposals_count": proposals_count,
+        "config": config
+    }
+
+@api_router.get("/bundles/lender-dashboard")
+async def get_lender_dashboard_bundle(lender_id: str, user: AuthenticatedUser = Depends(current_user)):
+    ensure_self_or_admin(user, lender_id)
+    loans, archived = await asyncio.gather(
+        find_loans(lender_id=lender_id), find_archived_loans_for_stats({"lender_id": lender_id})
+    )
+    return {"stats": lender_stats(loans + archived), "loans": loans}
+
+@api_router.get("/bundles/admin-dashboard")
+async def get_admin_dashboard_bundle(
+    year: int = None,
+    month: int = None,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    if not year or not month:
+        now = datetime.now(timezone.utc)
+        year, month = now.year, now.month
+    
+    stats, loans, lenders, config, utility, expenses = await asyncio.gather(
+        admin_stats(),
+        find_loans(),
+        find_users(role=UserRole.LENDER),
+        load_system_config(),
+        compute_monthly_utility(year, month),
+        month_expenses(year, month)
+    )
+    return {
+        "stats": stats,
+        "loans": loans,
+        "lenders": lenders,
+        "config": config,
+        "monthly_utility": utility,
+        "expenses": expenses,
+        "financial_comparison": build_financial_comparison(year, month, utility, expenses)
+    }
+
+# ============= Eventos en vivo (SSE) =============
+
+@api_router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    lender_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    user: AuthenticatedUser = Depends(current_user)
+):
+    """Feed de Server-Sent Events con los cambios de préstamos, pagos y cuotas
+    
+    Clientes y prestamistas reciben solo sus eventos (el filtro sale del token); un
+    admin puede filtrar por prestamista o cliente y sin filtros recibe todo.
+    EventSource reenvía Last-Event-ID al reconectarse y se reenvían los eventos
+    perdidos; si ya no están en memoria se envía un evento resync para recargar.
+    """
+    if user.role == UserRole.CLIENT:
+        lender_id, client_id = None, user.id
+    elif user.role == UserRole.LENDER:
+        lender_id, client_id = user.id, None
+    subscription = event_bus.subscribe(lender_id, client_id, last_event_id)
+    
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============= Archivo de préstamos cerrados =============
+# Los préstamos completados o rechazados hace más de N meses se mueven con sus
+# cuotas y pagos a loans_archive, payment_schedules_archive y payments_archive.
+# Las lecturas por id (préstamo, cuotas, pagos, estado de pagos) buscan en el
+# archivo cuando el préstamo ya no está en las colecciones activas.
+
+ARCHIVED_STATUSES = [LoanStatus.COMPLETED, LoanStatus.REJECTED]
+
+async def copy_to_archive(docs: list, archive, archived_at: str) -> int:
+    """Copia las filas a la colección de archivo (upsert por id: repetir no duplica)"""
+    operations = [ReplaceOne({"id": doc["id"]}, {**doc, "archived_at": archived_at}, upsert=True) for doc in docs]
+    for i in range(0, len(operations), BULK_CHUNK_SIZE):
+        await archive.bulk_write(operations[i:i + BULK_CHUNK_SIZE], ordered=False)
+    return len(docs)
+
+async def archive_loans_job(params: dict, report) -> dict:
+    """Archiva por lotes los préstamos cerrados antes del corte
+    
+    Cada lote primero se copia completo y después se borra de las colecciones
+    activas dejando los préstamos para el final: una cuota o un pago nunca queda sin
+    su préstamo, y un préstamo que sigue en loans vuelve a entrar en el próximo lote.
+    Si el trabajo se interrumpe, al retomarlo el lote se copia de nuevo sin duplicar
+    (lo ya borrado sigue en el archivo) y termina de borrarse.
+    """
+    cutoff = (datetime.now(timezone.utc) - relativedelta(months=params["older_than_months"])).isoformat()
+    # Préstamos anteriores a closed_at se evalúan por su fecha de creación y último pago
+    query = {
+        "status": {"$in": ARCHIVED_STATUSES},
+        "$or": [
+            {"closed_at": {"$lt": cutoff}},
+            {"closed_at": None, "created_at": {"$lt": cutoff}}
+        ]
+    }
+    total = await db.loans.count_documents(query)
+    archived_at = datetime.now(timezone.utc).isoformat()
+    totals = {"loans": 0, "schedules": 0, "payments": 0, "skipped_recent": 0}
+    last_id = ""
+    done = 0
+    
+    while True:
+        batch = await db.loans.find(
+            {**query, "id": {"$gt": last_id}}, {"_id": 0, "id": 1, "closed_at": 1}
+        ).sort("id", 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            break
+        last_id = batch[-1]["id"]
+        done += len(batch)
+        
+        loan_ids = [loan["id"] for loan in batch]
+        legacy_ids = [loan["id"] for loan in batch if not loan.get("closed_at")]
+        if legacy_ids:
+            recent = await payment_ledger().aggregate([
+                {"$match": {"loan_id": {"$in": legacy_ids}, "payment_date": {"$gte": cutoff}}},
+                {"$group": {"_id": "$loan_id"}}
+            ])
+            recent_ids = {row["_id"] for row in recent}
+            totals["skipped_recent"] += len(recent_ids)
+            loan_ids = [loan_id for loan_id in loan_ids if loan_id not in recent_ids]
+        
+        if loan_ids:
+            by_loan = {"loan_id": {"$in": loan_ids}}
+            schedules = await db.payment_schedules.find(by_loan, {"_id": 0}).to_list(None)
+            payments = await payment_ledger().find(by_loan, {"_id": 0})
+            loans = await db.loans.find({"id": {"$in": loan_ids}}, {"_id": 0}).to_list(None)
+            totals["schedules"] += await copy_to_archive(schedules, db.payment_schedules_archive, archived_at)
+            totals["payments"] += await copy_to_archive(payments, db.payments_archive, archived_at)
+            totals["loans"] += await copy_to_archive(loans, db.loans_archive, archived_at)
+            
+            await db.payment_schedules.delete_many(by_loan)
+            await payment_ledger().delete_many(by_loan)
+            await db.loans.delete_many({"id": {"$in": loan_ids}})
+        await report(done, total)
+    
+    logger.info(f"Archivo: {totals['loans']} préstamos, {totals['schedules']} cuotas y {totals['payments']} pagos")
+    return {
+        "cutoff": cutoff,
+        "loans_archived": totals["loans"],
+        "schedules_archived": totals["schedules"],
+        "payments_archived": totals["payments"],
+        "skipped_recent": totals["skipped_recent"]
+    }
+
+@api_router.post("/admin/archive/loans")
+async def enqueue_loan_archive(
+    older_than_months: int = ARCHIVE_AFTER_MONTHS,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Encola el archivo de préstamos completados o rechazados hace más de older_than_months meses"""
+    if older_than_months < 1:
+        raise HTTPException(status_code=400, detail="older_than_months debe ser al menos 1")
+    return await job_runner.enqueue("archive_loans", {"older_than_months": older_than_months}, requested_by=admin.id)
+
+# ============= Exportación de datos =============
+
+@api_router.get("/admin/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    lender_id: Optional[str] = None,
+    include_archived: bool = False,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    """Exporta préstamos, cuotas o pagos completos (sin el límite de 1000 filas)
+    
+    start/end (YYYY-MM-DD) filtran por fecha de creación, vencimiento o pago según el
+    conjunto. La respuesta se genera por bloques mientras se lee el cursor.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail=f"Conjunto de datos desconocido: {dataset} (loans, schedules o payments)")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format} (csv o parquet)")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="La exportación Parquet requiere instalar pyarrow")
+    try:
+        query = await dataset_filter(reporting_db, dataset, start, end, lender_id, include_archived)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas: usar el formato YYYY-MM-DD")
+    
+    docs = iterate_dataset(
+        reporting_db, dataset, query,
+        include_archived=include_archived,
+        time_series=payments_time_series,
+        batch_size=EXPORT_BATCH_SIZE,
+        outbox_database=db
+    )
+    columns = EXPORT_DATASETS[dataset]["columns"]
+    filename = f"{dataset}_{datetime.now(timezone.utc).strftime('%Y%m%d')}.{format}"
+    if format == "parquet":
+        body = parquet_stream(docs, columns, EXPORT_ROW_GROUP_SIZE)
+        media_type = "application/vnd.apache.parquet"
+    else:
+        body = csv_stream(docs, columns, EXPORT_CSV_CHUNK_ROWS)
+        media_type = "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ============= Trabajos en segundo plano =============
+
+job_runner.register("fix_completed_loans", fix_completed_loans_job)
+job_runner.register("reassign_lender_clients", reassign_lender_clients_job)
+job_runner.register("monthly_report", monthly_report_job)
+job_runner.register("archive_loans", archive_loans_job)
+job_runner.register("backfill_schedule_lenders", backfill_schedule_lenders_job)
+
+@api_router.get("/admin/jobs")
+async def list_jobs(
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: int = 50,
+    admin: AuthenticatedUser = Depends(require_admin)
+):
+    query = {}
+    if status:
+        query["status"] = status
+    if type:
+        query["type"] = type
+    return await db.jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(min(limit, 200))
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str, admin: AuthenticatedUser = Depends(require_admin)):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@api_router.get("/admin/metrics/pool")
+async def get_pool_metrics(admin: AuthenticatedUser = Depends(require_admin)):
+    """Uso del pool de conexiones de este worker (cada worker tiene el suyo)
+    
+    saturation cerca de 1 con waiting > 0 indica que faltan conexiones: subir
+    MONGO_MAX_POOL_SIZE o agregar workers sin superar el límite del servidor.
+    """
+    if pool_metrics is None:
+        return {"pid": os.getpid(), "available": False}
+    return {"available": True, **pool_metrics.snapshot()}
+
+# Include router (todas las rutas /api pasan por la verificación del token)
+app.include_router(api_router, dependencies=[Depends(authenticate)])
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=GZIP_LEVEL,
+    brotli_quality=BROTLI_QUALITY
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1657,6 +3618,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_indexes():
+    # Barrido de mora y consultas por rango de vencimiento
+    await db.payment_schedules.create_index([("status", 1), ("due_date", 1)])
+    await db.payment_schedules.create_index([("loan_id", 1), ("payment_number", 1)])
+    # Pagos, importación y reprogramación escriben cuotas por id dentro de transacciones
+    await db.payment_schedules.create_index("id", unique=True)
+    # Las respuestas guardadas por Idempotency-Key expiran solas
+    await db.idempotency_keys.create_index("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+    # Hoja de ruta por prestamista
+    await db.payment_schedules.create_index([("lender_id", 1), ("status", 1), ("due_date", 1)])
+    # $lookup de cuotas a préstamos (reportes de cartera) y a clientes
+    await db.loans.create_index("id")
+    await db.users.create_index("id")
+    # Trabajos en segundo plano
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    # Archivo de préstamos cerrados y lecturas por id sobre el archivo
+    await db.loans.create_index([("status", 1), ("closed_at", 1)])
+    await db.loans_archive.create_index("id", unique=True)
+    await db.loans_archive.create_index("client_id")
+    await db.payment_schedules_archive.create_index("id", unique=True)
+    await db.payment_schedules_archive.create_index([("loan_id", 1), ("payment_number", 1)])
+    await db.payments_archive.create_index("id", unique=True)
+    await db.payments_archive.create_index("loan_id")
+    # Libro de pagos: en series de tiempo los filtros van sobre meta y payment_date
+    if payments_time_series:
+        await db.payments.create_index([("meta.loan_id", 1), ("payment_date", 1)])
+        await db.payments.create_index([("meta.client_id", 1), ("payment_date", 1)])
+        await db.payments_outbox.create_index("id", unique=True)
+    else:
+        await db.payments.create_index("loan_id")
+        await db.payments.create_index("client_id")
+        await db.payments.create_index("payment_date")
+
+async def configure_payments_storage():
+    """Detecta si payments es de series de tiempo; la crea así si se pidió y no existe"""
+    global payments_time_series
+    if PAYMENTS_STORAGE == "timeseries" and "payments" not in await db.list_collection_names():
+        await db.create_collection("payments", timeseries=TIME_SERIES_OPTIONS)
+    payments_time_series = await is_time_series(db)
+    if PAYMENTS_STORAGE == "timeseries" and not payments_time_series:
+        logger.warning("payments es una colección normal: ejecutar migrate_payments.py para convertirla")
+    if payments_time_series:
+        # Pagos confirmados que quedaron en el outbox por una caída
+        await payment_ledger().flush()
+
+def connect_mongo():
+    """Crea el cliente de este worker; con varios workers cada proceso tiene su propio pool"""
+    global client, db, reporting_db, pool_metrics
+    if client is None:
+        client, pool_metrics = create_client(mongo_url)
+    db = client[os.environ['DB_NAME']]
+    # Las lecturas transaccionales (pagos, préstamos, cuotas) siguen en el primario
+    reporting_db = client.get_database(os.environ['DB_NAME'], read_preference=reporting_read_preference())
+
+async def start_leader_tasks():
+    """El barrido de cuotas y la cola de trabajos corren en un solo worker"""
+    app.state.sweeper_task = asyncio.create_task(schedule_sweeper_loop())
+    await job_runner.start(db)
+
+async def stop_leader_tasks():
+    app.state.sweeper_task.cancel()
+    await asyncio.gather(app.state.sweeper_task, return_exceptions=True)
+    await job_runner.stop()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    connect_mongo()
+    await configure_payments_storage()
+    await ensure_indexes()
+    if EVENT_FANOUT == "mongo":
+        await event_bus.attach(db, EVENTS_CAPPED_BYTES)
+    # Todos los workers encolan trabajos; los ejecuta el que tiene el lease
+    job_runner.attach(db)
+    background_lease.start(db, start_leader_tasks, stop_leader_tasks)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    global client
+    await background_lease.stop(db, stop_leader_tasks)
+    await event_bus.detach()
     client.close()
+    client = None
@@ -0,0 +1,168 @@
+"""
+Minimal pytest-benchmark style fixture for the CPU-bound loan math.
+
+Each benchmark reports operations per second (median of several rounds, timed
+in process CPU time so a busy or throttled host does not count) and is
+compared against the baseline of the machine it runs on,
+benchmarks/baselines/<machine>.json. A result slower than that baseline by more
+than the tolerance fails the test. Absolute throughput is only comparable on the
+same machine, so a machine without a baseline file just reports its numbers.
+
+    python -m pytest benchmarks/                      # compare with this machine's baseline
+    python -m pytest benchmarks/ --bench-save         # write this machine's baseline
+    python -m pytest benchmarks/ --bench-tolerance=0.3
+
+<machine> defaults to the host name and Python version. A CI runner whose host
+name changes between jobs should set BENCH_MACHINE to a stable name (e.g.
+ci-x86_64) and commit or cache benchmarks/baselines/<name>.json.
+
+BENCH_SAVE=1 and BENCH_TOLERANCE=0.3 work as well (useful when pytest is run
+from the repository root and these options are not registered).
+"""
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+# Medians of consecutive runs on a dedicated runner agree within about 5%; 20%
+# also absorbs slower drift between sessions without hiding a real regression
+DEFAULT_TOLERANCE = 0.2
+MIN_ROUND_TIME = 0.05
+ROUNDS = 9
+
+_results = {}
+
+# Scripts that match pytest's *_test.py pattern but are CLIs, not tests
+collect_ignore = ["load_test.py"]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench")
+    group.addoption("--bench-save", action="store_true", default=False,
+                    help="Write the measured throughput as this machine's baseline")
+    group.addoption("--bench-tolerance", type=float, default=None,
+                    help=f"Allowed throughput regression as a fraction (default {DEFAULT_TOLERANCE})")
+
+
+def _save_requested(config):
+    return config.getoption("--bench-save", default=False) or os.environ.get("BENCH_SAVE") == "1"
+
+
+def _tolerance(config):
+    value = config.getoption("--bench-tolerance", default=None)
+    if value is None:
+        value = float(os.environ.get("BENCH_TOLERANCE", DEFAULT_TOLERANCE))
+    return value
+
+
+def machine_name():
+    name = os.environ.get("BENCH_MACHINE") or (
+        f"{platform.node()}-{platform.python_implementation()}{platform.python_version()}"
+    )
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def baseline_path():
+    return BASELINES_DIR / f"{machine_name()}.json"
+
+
+def _load_baseline():
+    path = baseline_path()
+    if path.exists():
+        return json.loads(path.read_text()).get("benchmarks", {})
+    return {}
+
+
+class Benchmark:
+    def __init__(self, name, config, baseline):
+        self.name = name
+        self.config = config
+        self.baseline = baseline
+
+    def __call__(self, func, ops=1):
+        """Time func() and check ops/s against this machine's baseline. `ops`
+        is the number of logical operations one call performs (e.g. batch size)."""
+        func()  # warm-up
+
+        # Calibrate the number of calls per round so each round is measurable
+        calls = 1
+        while True:
+            start = time.process_time()
+            for _ in range(calls):
+                func()
+            elapsed = time.process_time() - start
+            if elapsed >= MIN_ROUND_TIME or calls >= 1_000_000:
+                break
+            calls *= 10 if elapsed < MIN_ROUND_TIME / 10 else 2
+
+        rounds = [elapsed]
+        for _ in range(ROUNDS - 1):
+            start = time.process_time()
+            for _ in range(calls):
+                func()
+            rounds.append(time.process_time() - start)
+
+        median = statistics.median(rounds)
+        ops_per_s = calls * ops / median
+        _results[self.name] = {"ops_per_s": round(ops_per_s, 1), "mean_call_s": median / calls}
+
+        reference = self.baseline.get(self.name)
+        if reference and not _save_requested(self.config):
+            tolerance = _tolerance(self.config)
+            floor = reference["ops_per_s"] * (1 - tolerance)
+            assert ops_per_s >= floor, (
+                f"{self.name}: {ops_per_s:,.0f} ops/s is more than {tolerance:.0%} below "
+                f"the {machine_name()} baseline of {reference['ops_per_s']:,.0f} ops/s"
+            )
+        return ops_per_s
+
+
+@pytest.fixture(scope="session")
+def bench_baseline():
+    return _load_baseline()
+
+
+@pytest.fixture
+def bench(request, bench_baseline):
+    return Benchmark(request.node.name, request.config, bench_baseline)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results or not _save_requested(session.config):
+        return
+    baseline = _load_baseline()
+    baseline.update({name: {"ops_per_s": result["ops_per_s"]} for name, result in _results.items()})
+    BASELINES_DIR.mkdir(exist_ok=True)
+    baseline_path().write_text(json.dumps({
+        "machine": {
+            "name": machine_name(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "processor": platform.machine(),
+        },
+        "benchmarks": dict(sorted(baseline.items())),
+    }, indent=2) + "\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    baseline = _load_baseline()
+    terminalreporter.section("loan math benchmarks")
+    if not baseline:
+        terminalreporter.write_line(
+            f"No baseline for {machine_name()}: nothing compared (run with --bench-save to record one)"
+        )
+    for name, result in sorted(_results.items()):
+        reference = baseline.get(name, {}).get("ops_per_s")
+        delta = f"{(result['ops_per_s'] / reference - 1) * 100:+6.1f}%" if reference else "   new"
+        terminalreporter.write_line(f"{name:<60} {result['ops_per_s']:>14,.0f} ops/s {delta}")
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Synthetic portfolio generator for scale testing.
+
+Writes consistent `users`, `loans`, `payment_schedules`, `payments`,
+`loan_proposals` and `expenses` documents straight into MongoDB with bulk
+inserts. Documents use the same shape as backend/server.py (ISO date
+strings, integer amounts) and amounts come from `calculate_loan`, so the
+API can serve the generated data as if it had been created through it.
+
+The output is fully determined by --seed: ids are drawn from the seeded RNG
+and every writer process owns a disjoint shard of clients. Loan numbers use the
+app's YYYYMMNN format; shards interleave the monthly sequence so they never
+collide, and the `loan_number:YYYYMM` counters are raised past the generated
+numbers so loans approved through the API keep counting from there.
+
+    python benchmarks/generate_portfolio.py --db-name microcreditos_bench \
+        --target-rows 10000000 --writers 8 --seed 7 --drop
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import bcrypt
+from pymongo import MongoClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from loan_math import balance_snapshot, calculate_loan  # noqa: E402
+
+PASSWORD = "BenchPass123!"
+
+# Mirrors the defaults created by GET /api/config/system
+PAYMENT_FREQUENCIES = [
+    {"id": "daily", "name": "Diario", "days": 1, "active": True},
+    {"id": "every_other_day", "name": "Día de por medio", "days": 2, "active": True},
+    {"id": "weekly", "name": "Semanal", "days": 7, "active": True},
+    {"id": "monthly", "name": "Mensual", "days": 30, "active": True},
+]
+TERMS_BY_FREQUENCY = {
+    "daily": [20, 30, 45, 60, 90, 120],
+    "every_other_day": [15, 30, 45, 60],
+    "weekly": [8, 12, 16, 24, 52],
+    "monthly": [3, 6, 12, 18, 24, 36],
+}
+AMOUNTS = [100000, 200000, 300000, 500000, 1000000, 2000000, 5000000]
+INTEREST_RATES = [8.0, 10.0, 12.0, 15.0, 18.0, 20.0]
+SYSTEM_FEE = 0.5
+INSURANCE_FEE = 1.0
+
+# Loan status distribution (cumulative thresholds)
+STATUS_WEIGHTS = [("active", 0.60), ("completed", 0.20), ("pending", 0.12), ("rejected", 0.08)]
+COLLECTIONS = ("users", "loans", "payment_schedules", "payments", "loan_proposals")
+
+# Rough document count per client, used to turn --target-rows into clients
+ROWS_PER_CLIENT_ESTIMATE = {1: 45, 2: 90, 3: 138}
+
+
+def seeded_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def iso(value):
+    return value.isoformat()
+
+
+class ShardWriter:
+    """Buffers documents per collection and flushes them with insert_many"""
+
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.buffers = {name: [] for name in COLLECTIONS}
+        self.counts = {name: 0 for name in COLLECTIONS}
+
+    def add(self, collection, doc):
+        buffer = self.buffers[collection]
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection=None):
+        for name in [collection] if collection else COLLECTIONS:
+            buffer = self.buffers[name]
+            if buffer:
+                self.db[name].insert_many(buffer, ordered=False)
+                self.counts[name] += len(buffer)
+                self.buffers[name] = []
+
+
+class PortfolioGenerator:
+    def __init__(self, rng, as_of, lenders, password_hash, shard=0, writers=1):
+        self.rng = rng
+        self.as_of = as_of
+        self.lenders = lenders
+        self.password_hash = password_hash
+        self.shard = shard
+        self.writers = writers
+        # Last loan number handed out per YYYYMM by this shard
+        self.loan_numbers = {}
+
+    def user_doc(self, role, index):
+        user_id = seeded_id(self.rng)
+        return {
+            "id": user_id,
+            "email": f"{role}_{index}@bench.test",
+            "name": f"{role.title()} {index}",
+            "role": role,
+            "cedula": str(10000000 + index),
+            "phone": f"3{self.rng.randint(100000000, 999999999)}",
+            "address": f"Calle {self.rng.randint(1, 200)} # {self.rng.randint(1, 99)}-{self.rng.randint(1, 99)}",
+            "active": True,
+            "created_at": iso(self.as_of - timedelta(days=self.rng.randint(30, 1500))),
+            "password": self.password_hash,
+        }
+
+    def pick_status(self):
+        roll = self.rng.random()
+        for status, weight in STATUS_WEIGHTS:
+            if roll < weight:
+                return status
+            roll -= weight
+        return STATUS_WEIGHTS[-1][0]
+
+    def client_portfolio(self, writer, client, loans_per_client):
+        for _ in range(self.rng.randint(1, loans_per_client * 2 - 1)):
+            self.loan_docs(writer, client)
+
+    def next_loan_number(self, approved_at):
+        """YYYYMMNN like reserve_loan_numbers; shard k of n takes k+1, k+1+n, ..."""
+        year_month = f"{approved_at:%Y%m}"
+        last = self.loan_numbers.get(year_month, self.shard + 1 - self.writers)
+        self.loan_numbers[year_month] = last + self.writers
+        return f"{year_month}{last + self.writers:02d}"
+
+    def loan_docs(self, writer, client):
+        rng = self.rng
+        frequency = rng.choice(PAYMENT_FREQUENCIES)
+        term = rng.choice(TERMS_BY_FREQUENCY[frequency["id"]])
+        amount = rng.choice(AMOUNTS)
+        rate = rng.choice(INTEREST_RATES)
+        calc = calculate_loan(amount, rate, term, frequency["days"], SYSTEM_FEE, INSURANCE_FEE)
+        status = self.pick_status()
+
+        span_days = frequency["days"] * term
+        if status == "completed":
+            start_date = self.as_of - timedelta(days=span_days + rng.randint(1, 365))
+        elif status == "active":
+            start_date = self.as_of - timedelta(days=rng.randint(0, span_days))
+        else:
+            start_date = None
+        created_at = (start_date or self.as_of) - timedelta(days=rng.randint(0, 10))
+
+        loan = {
+            "id": seeded_id(rng),
+            "loan_number": None,
+            "client_id": client["id"],
+            "client_name": client["name"],
+            "lender_id": None,
+            "lender_name": None,
+            "amount": amount,
+            "interest_rate": rate,
+            "system_fee_percentage": SYSTEM_FEE,
+            "system_fee_amount": calc["system_fee_amount"],
+            "insurance_fee_percentage": INSURANCE_FEE,
+            "insurance_fee_amount": calc["insurance_fee_amount"],
+            "term_months": term,
+            "monthly_payment": calc["payment_amount"],
+            "total_amount": calc["total_amount"],
+            "status": status,
+            "purpose": rng.choice(["Capital de trabajo", "Inventario", "Mejoras locativas", None]),
+            "payment_frequency": frequency["id"],
+            "payment_frequency_name": frequency["name"],
+            "payment_frequency_days": frequency["days"],
+            "created_at": iso(created_at),
+            "approved_at": None,
+            "start_date": None,
+            "closed_at": None,
+            "balance": None,
+            "version": 0,
+        }
+
+        if start_date is not None:
+            lender = rng.choice(self.lenders)
+            loan.update({
+                "lender_id": lender["id"],
+                "lender_name": lender["name"],
+                "loan_number": self.next_loan_number(start_date),
+                "approved_at": iso(start_date),
+                "start_date": iso(start_date),
+            })
+            self.schedule_docs(writer, loan, start_date, frequency["days"], term)
+        elif status == "pending" and rng.random() < 0.3:
+            self.proposal_doc(writer, loan)
+        elif status == "rejected":
+            loan["closed_at"] = iso(min(created_at + timedelta(days=rng.randint(0, 5)), self.as_of))
+
+        writer.add("loans", loan)
+
+    def schedule_docs(self, writer, loan, start_date, frequency_days, term):
+        rng = self.rng
+        payment_amount = loan["monthly_payment"]
+        if loan["status"] == "completed":
+            paid_count = term
+        else:
+            elapsed = (self.as_of - start_date).days // frequency_days
+            # Some clients are behind on their installments
+            paid_count = max(0, min(term - 1, elapsed - rng.choice([0, 0, 0, 1, 2, 5])))
+        partial = 0
+        if loan["status"] == "active" and rng.random() < 0.25:
+            partial = rng.randint(1, payment_amount - 1) if payment_amount > 1 else 0
+        unpaid, total_paid, payment_count, last_paid = [], 0, 0, None
+
+        for number in range(1, term + 1):
+            due_date = start_date + timedelta(days=frequency_days * number)
+            schedule = {
+                "id": seeded_id(rng),
+                "loan_id": loan["id"],
+                "client_id": loan["client_id"],
+                "client_name": loan["client_name"],
+                "lender_id": loan["lender_id"],
+                "payment_number": number,
+                "due_date": iso(due_date),
+                "amount": payment_amount,
+                "installment_amount": payment_amount,
+                "status": "pending",
+                "paid_date": None,
+            }
+            if number <= paid_count:
+                paid_date = due_date - timedelta(days=rng.choice([0, 0, 0, 1, 2]))
+                schedule["status"] = "paid"
+                schedule["paid_date"] = iso(paid_date)
+                self.payment_doc(writer, loan, number, payment_amount, paid_date)
+                total_paid, payment_count, last_paid = total_paid + payment_amount, payment_count + 1, paid_date
+            else:
+                if number == paid_count + 1 and partial:
+                    schedule["amount"] = payment_amount - partial
+                    self.payment_doc(writer, loan, number, partial, min(due_date, self.as_of))
+                    total_paid, payment_count = total_paid + partial, payment_count + 1
+                unpaid.append(schedule)
+            writer.add("payment_schedules", schedule)
+
+        loan["balance"] = balance_snapshot(unpaid, term, paid_count, total_paid, payment_count)
+        if loan["status"] == "completed":
+            loan["closed_at"] = iso(last_paid)
+
+    def payment_doc(self, writer, loan, number, amount, payment_date):
+        writer.add("payments", {
+            "id": seeded_id(self.rng),
+            "loan_id": loan["id"],
+            "client_id": loan["client_id"],
+            "amount": amount,
+            "payment_date": iso(payment_date),
+            "payment_number": number,
+            "notes": "Pago generado",
+        })
+
+    def proposal_doc(self, writer, loan):
+        rng = self.rng
+        lender = rng.choice(self.lenders)
+        rate = max(0.0, loan["interest_rate"] - rng.choice([2.0, 3.0, 5.0]))
+        calc = calculate_loan(loan["amount"], rate, loan["term_months"], loan["payment_frequency_days"],
+                              SYSTEM_FEE, INSURANCE_FEE)
+        writer.add("loan_proposals", {
+            "id": seeded_id(rng),
+            "loan_id": loan["id"],
+            "client_id": loan["client_id"],
+            "client_name": loan["client_name"],
+            "lender_id": lender["id"],
+            "lender_name": lender["name"],
+            "original_interest_rate": loan["interest_rate"],
+            "proposed_interest_rate": rate,
+            "original_monthly_payment": loan["monthly_payment"],
+            "proposed_monthly_payment": calc["payment_amount"],
+            "original_total_amount": loan["total_amount"],
+            "proposed_total_amount": calc["total_amount"],
+            "reason": "Propuesta generada",
+            "status": "pending",
+            "created_at": loan["created_at"],
+            "responded_at": None,
+            "start_date": iso(self.as_of + timedelta(days=rng.randint(1, 15))),
+        })
+
+
+def write_shard(args):
+    (shard, shard_clients, first_index, options) = args
+    rng = random.Random(options["seed"] * 1_000_003 + shard)
+    client = MongoClient(options["mongo_url"])
+    db = client[options["db_name"]]
+    writer = ShardWriter(db, options["batch_size"])
+    generator = PortfolioGenerator(rng, options["as_of"], options["lenders"], options["password_hash"],
+                                   shard, options["writers"])
+
+    for index in range(first_index, first_index + shard_clients):
+        user = generator.user_doc("client", index)
+        writer.add("users", user)
+        generator.client_portfolio(writer, user, options["loans_per_client"])
+    writer.flush()
+    client.close()
+    return writer.counts, generator.loan_numbers
+
+
+def seed_reference_data(db, rng, as_of, lenders_count, password_hash):
+    """Admin, lenders, system config and a year of expenses (single process)"""
+    generator = PortfolioGenerator(rng, as_of, [], password_hash)
+    admin = generator.user_doc("admin", 0)
+    lenders = [generator.user_doc("lender", i) for i in range(lenders_count)]
+    db.users.insert_many([admin] + lenders)
+
+    if not db.system_config.find_one({}):
+        db.system_config.insert_one({
+            "id": seeded_id(rng),
+            "default_interest_rate": 12.0,
+            "available_interest_rates": INTEREST_RATES,
+            "payment_frequencies": PAYMENT_FREQUENCIES,
+            "default_system_fee": SYSTEM_FEE,
+            "available_system_fees": [0.0, 0.5, 1.0, 1.5, 2.0],
+            "default_insurance_fee": INSURANCE_FEE,
+            "available_insurance_fees": [0.0, 0.5, 1.0, 1.5, 2.0, 3.0],
+            "updated_at": iso(as_of),
+            "updated_by": "system",
+        })
+
+    expenses = []
+    for months_back in range(12):
+        month_index = as_of.year * 12 + as_of.month - 1 - months_back
+        year, month = divmod(month_index, 12)
+        for description in ("Arriendo oficina", "Nómina cobradores", "Transporte", "Papelería"):
+            expense_id = seeded_id(rng)
+            expenses.append({
+                "_id": expense_id,
+                "id": expense_id,
+                "description": description,
+                "amount": rng.randint(200, 5000) * 1000,
+                "category": None,
+                "month": month + 1,
+                "year": year,
+                "is_fixed": False,
+                "created_at": iso(as_of),
+                "created_by": admin["id"],
+            })
+    db.expenses.insert_many(expenses)
+    return [{"id": lender["id"], "name": lender["name"]} for lender in lenders]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME", "microcreditos_bench"))
+    parser.add_argument("--seed", type=int, default=1)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--clients", type=int, help="Number of client users to generate")
+    size.add_argument("--target-rows", type=int, help="Approximate total documents to write")
+    parser.add_argument("--lenders", type=int, default=50)
+    parser.add_argument("--loans-per-client", type=int, choices=(1, 2, 3), default=2,
+                        help="Average loans per client")
+    parser.add_argument("--writers", type=int, default=1, help="Parallel writer processes")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--as-of", type=lambda s: datetime.fromisoformat(s).replace(tzinfo=timezone.utc),
+                        default=datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0),
+                        help="Reference date for the portfolio (YYYY-MM-DD)")
+    parser.add_argument("--drop", action="store_true", help="Drop the generated collections first")
+    args = parser.parse_args()
+
+    if args.target_rows:
+        clients = max(1, args.target_rows // ROWS_PER_CLIENT_ESTIMATE[args.loans_per_client])
+    else:
+        clients = args.clients or 1000
+    writers = max(1, min(args.writers, clients))
+
+    client = MongoClient(args.mongo_url)
+    db = client[args.db_name]
+    if args.drop:
+        for name in COLLECTIONS + ("expenses", "system_config"):
+            db.drop_collection(name)
+        db.counters.delete_many({"_id": {"$regex": "^loan_number:"}})
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    lenders = seed_reference_data(db, rng, args.as_of, args.lenders, password_hash)
+    client.close()
+
+    options = {
+        "mongo_url": args.mongo_url,
+        "db_name": args.db_name,
+        "seed": args.seed,
+        "batch_size": args.batch_size,
+        "as_of": args.as_of,
+        "lenders": lenders,
+        "password_hash": password_hash,
+        "loans_per_client": args.loans_per_client,
+        "writers": writers,
+    }
+    per_shard, remainder = divmod(clients, writers)
+    shards, first_index = [], 1
+    for shard in range(writers):
+        shard_clients = per_shard + (1 if shard < remainder else 0)
+        shards.append((shard, shard_clients, first_index, options))
+        first_index += shard_clients
+
+    if writers == 1:
+        results = [write_shard(shards[0])]
+    else:
+        with multiprocessing.Pool(writers) as pool:
+            results = pool.map(write_shard, shards)
+
+    # Same counters reserve_loan_numbers increments
+    client = MongoClient(args.mongo_url)
+    db = client[args.db_name]
+    loan_numbers = {}
+    for _, shard_numbers in results:
+        for year_month, last in shard_numbers.items():
+            loan_numbers[year_month] = max(loan_numbers.get(year_month, 0), last)
+    for year_month, last in loan_numbers.items():
+        db.counters.update_one({"_id": f"loan_number:{year_month}"}, {"$max": {"seq": last}}, upsert=True)
+    client.close()
+
+    totals = {name: sum(counts[name] for counts, _ in results) for name in COLLECTIONS}
+    elapsed = time.perf_counter() - started
+    total_rows = sum(totals.values())
+    for name, count in totals.items():
+        print(f"{name:<20} {count:>12,}")
+    print(f"{'total':<20} {total_rows:>12,}  in {elapsed:.1f}s ({total_rows / elapsed:,.0f} docs/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
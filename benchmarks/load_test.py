@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Reproducible load test for the loan API.
+
+Starts the FastAPI app (backend/server.py) with uvicorn against a local
+MongoDB, seeds a synthetic portfolio through the public API and then drives
+a weighted mix of realistic operations (quote, create, approve, pay,
+dashboard, month-close) at a fixed concurrency.
+
+Results are written as JSON (p50/p95/p99 latency and throughput per
+operation) so runs can be compared between commits:
+
+    python benchmarks/load_test.py --start-mongod --clients 200 \
+        --concurrency 16 --requests 5000 --output bench_output.txt
+    python benchmarks/load_test.py --compare old.json new.json
+
+Against a running API (--base-url) whose database already has an admin, the
+admin cannot self-register; pass that admin's credentials with --admin-email
+and --admin-password (or BENCH_ADMIN_EMAIL / BENCH_ADMIN_PASSWORD).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+import requests
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+DEFAULT_MIX = "quote=30,create=10,approve=10,pay=25,dashboard=20,month_close=5"
+PASSWORD = "BenchPass123!"
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout, what):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile over an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+class LocalStack:
+    """Owns the mongod (optional) and uvicorn processes used by a run"""
+
+    def __init__(self, mongo_url, db_name, start_mongod=False, workers=1):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.start_mongod = start_mongod
+        self.workers = workers
+        self.processes = []
+        self.tmp_dir = None
+        self.base_url = None
+
+    def __enter__(self):
+        if self.start_mongod:
+            self._start_mongod()
+        self._start_api()
+        return self
+
+    def __exit__(self, *exc):
+        for proc in reversed(self.processes):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self.tmp_dir:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _start_mongod(self):
+        mongod = shutil.which("mongod")
+        if not mongod:
+            raise RuntimeError("--start-mongod requires a mongod binary on PATH")
+        self.tmp_dir = tempfile.mkdtemp(prefix="microcreditos-bench-")
+        port = free_port()
+        self.processes.append(subprocess.Popen(
+            [mongod, "--dbpath", self.tmp_dir, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        self.mongo_url = f"mongodb://127.0.0.1:{port}"
+
+        def mongod_ready():
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        wait_for(mongod_ready, 30, "mongod")
+
+    def _start_api(self):
+        port = free_port()
+        env = dict(os.environ, MONGO_URL=self.mongo_url, DB_NAME=self.db_name)
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        ))
+        self.base_url = f"http://127.0.0.1:{port}"
+        wait_for(
+            lambda: requests.get(f"{self.base_url}/api/config/system", timeout=2).status_code == 200,
+            60, "API server",
+        )
+
+
+class Portfolio:
+    """Thread-safe pools of ids the operations pick from"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.admin = None
+        self.lenders = []
+        self.clients = []
+        self.clients_by_id = {}
+        self.pending_loans = []
+        self.active_loans = []
+
+    def add_pending(self, loan):
+        with self.lock:
+            self.pending_loans.append(loan)
+
+    def take_pending(self, rng):
+        with self.lock:
+            if not self.pending_loans:
+                return None
+            index = rng.randrange(len(self.pending_loans))
+            self.pending_loans[index], self.pending_loans[-1] = self.pending_loans[-1], self.pending_loans[index]
+            return self.pending_loans.pop()
+
+    def add_active(self, loan):
+        with self.lock:
+            self.active_loans.append(loan)
+
+    def pick_active(self, rng):
+        with self.lock:
+            if not self.active_loans:
+                return None
+            return rng.choice(self.active_loans)
+
+    def drop_active(self, loan):
+        with self.lock:
+            if loan in self.active_loans:
+                self.active_loans.remove(loan)
+
+
+class LoadTester:
+    def __init__(self, base_url, seed, admin_email=None, admin_password=None):
+        self.api_url = f"{base_url}/api"
+        self.admin_email = admin_email
+        self.admin_password = admin_password
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.portfolio = Portfolio(self.rng)
+        self.local = threading.local()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.stats_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def call(self, method, endpoint, data=None, params=None, token=None):
+        headers = {}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.session.request(
+            method, f"{self.api_url}/{endpoint}", json=data, params=params, headers=headers, timeout=60
+        )
+
+    def timed(self, name, method, endpoint, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.call(method, endpoint, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        with self.stats_lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+        return response if ok else None
+
+    # ---- seeding ----
+
+    def register(self, role, index):
+        data = {
+            "email": f"{role}_{index}_{uuid.uuid4().hex[:8]}@bench.test",
+            "password": PASSWORD,
+            "name": f"Bench {role.title()} {index}",
+            "role": role,
+            "phone": f"300{index:07d}",
+            "address": f"Calle {index} # {index % 90}-{index % 70}",
+        }
+        response = self.call("POST", "auth/register", data)
+        response.raise_for_status()
+        result = response.json()
+        return {"token": result["access_token"], **result["user"]}
+
+    def admin_user(self):
+        """Register the first admin, or log in to the existing one"""
+        try:
+            return self.register("admin", 0)
+        except requests.HTTPError as e:
+            if e.response.status_code != 403:
+                raise
+        # Only the first admin may self-register
+        if not self.admin_email or not self.admin_password:
+            raise SystemExit("The database already has an admin: pass --admin-email and --admin-password")
+        response = self.call("POST", "auth/login", {"email": self.admin_email, "password": self.admin_password})
+        response.raise_for_status()
+        result = response.json()
+        return {"token": result["access_token"], **result["user"]}
+
+    def loan_payload(self, rng):
+        return {
+            "amount": rng.choice([200000, 500000, 1000000, 2000000, 5000000]),
+            "interest_rate": rng.choice([8.0, 10.0, 12.0, 15.0, 18.0, 20.0]),
+            "term_months": rng.choice([6, 12, 24, 30, 60]),
+            "payment_frequency": rng.choice(["daily", "every_other_day", "weekly", "monthly"]),
+            "purpose": "Capital de trabajo",
+        }
+
+    def create_loan(self, client, rng, name=None):
+        # The API takes the client from the token
+        data = self.loan_payload(rng)
+        if name:
+            response = self.timed(name, "POST", "loans", data=data, token=client["token"])
+        else:
+            response = self.call("POST", "loans", data, token=client["token"])
+            response = response if response.status_code < 400 else None
+        return response.json() if response is not None else None
+
+    def approve_loan(self, loan, rng, name=None):
+        lender = rng.choice(self.portfolio.lenders)
+        start_date = datetime.now(timezone.utc) - timedelta(days=rng.randint(0, 60))
+        data = {"loan_id": loan["id"], "lender_id": lender["id"], "start_date": start_date.isoformat()}
+        endpoint = f"loans/{loan['id']}/approve"
+        if name:
+            response = self.timed(name, "POST", endpoint, data=data, token=self.portfolio.admin["token"])
+        else:
+            response = self.call("POST", endpoint, data, token=self.portfolio.admin["token"])
+            response = response if response.status_code < 400 else None
+        return response is not None
+
+    def seed_portfolio(self, clients, lenders, loans_per_client, active_ratio):
+        self.portfolio.admin = self.admin_user()
+        self.portfolio.lenders = [self.register("lender", i) for i in range(lenders)]
+        self.portfolio.clients = [self.register("client", i) for i in range(clients)]
+        self.portfolio.clients_by_id = {client["id"]: client for client in self.portfolio.clients}
+        for client in self.portfolio.clients:
+            for _ in range(loans_per_client):
+                loan = self.create_loan(client, self.rng)
+                if not loan:
+                    continue
+                if self.rng.random() < active_ratio and self.approve_loan(loan, self.rng):
+                    self.portfolio.add_active(loan)
+                else:
+                    self.portfolio.add_pending(loan)
+        print(f"Seeded {clients} clients, {lenders} lenders, "
+              f"{len(self.portfolio.active_loans)} active / {len(self.portfolio.pending_loans)} pending loans")
+
+    # ---- operations ----
+
+    def op_quote(self, rng):
+        data = self.loan_payload(rng)
+        data["payment_frequency_days"] = rng.choice([1, 2, 7, 30])
+        data.pop("payment_frequency")
+        data.pop("purpose")
+        self.timed("quote", "POST", "loans/calculate", data=data)
+
+    def op_create(self, rng):
+        loan = self.create_loan(rng.choice(self.portfolio.clients), rng, name="create")
+        if loan:
+            self.portfolio.add_pending(loan)
+
+    def op_approve(self, rng):
+        loan = self.portfolio.take_pending(rng)
+        if loan is None:
+            return self.op_create(rng)
+        if self.approve_loan(loan, rng, name="approve"):
+            self.portfolio.add_active(loan)
+
+    def op_pay(self, rng):
+        loan = self.portfolio.pick_active(rng)
+        if loan is None:
+            return self.op_quote(rng)
+        amount = max(1, int(loan["monthly_payment"] * rng.choice([0.5, 1, 1, 1, 2])))
+        data = {"loan_id": loan["id"], "amount": amount}
+        client = self.portfolio.clients_by_id[loan["client_id"]]
+        response = self.timed("pay", "POST", "payments", data=data, token=client["token"])
+        if response is not None and "completado" in (response.json().get("notes") or ""):
+            self.portfolio.drop_active(loan)
+
+    def op_dashboard(self, rng):
+        # The same bundle requests the dashboards make on load
+        role = rng.choice(["client", "lender", "admin"])
+        if role == "client":
+            user = rng.choice(self.portfolio.clients)
+            endpoint, params = "bundles/client-dashboard", {"client_id": user["id"]}
+        elif role == "lender":
+            user = rng.choice(self.portfolio.lenders)
+            endpoint, params = "bundles/lender-dashboard", {"lender_id": user["id"]}
+        else:
+            user = self.portfolio.admin
+            endpoint, params = "bundles/admin-dashboard", None
+        self.timed("dashboard", "GET", endpoint, params=params, token=user["token"])
+
+    def op_month_close(self, rng):
+        token = self.portfolio.admin["token"]
+        self.timed("month_close", "GET", "admin/financial-comparison", token=token)
+
+    # ---- driver ----
+
+    def run(self, mix, concurrency, total_requests, duration):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        counter = {"issued": 0}
+        counter_lock = threading.Lock()
+        deadline = time.monotonic() + duration if duration else None
+
+        def next_ticket():
+            with counter_lock:
+                if total_requests and counter["issued"] >= total_requests:
+                    return False
+                counter["issued"] += 1
+            return deadline is None or time.monotonic() < deadline
+
+        def worker(worker_id):
+            rng = random.Random(self.seed * 1000 + worker_id)
+            while next_ticket():
+                name = rng.choices(names, weights)[0]
+                getattr(self, f"op_{name}")(rng)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        total = sum(item["count"] for item in endpoints.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "endpoints": endpoints,
+        }
+
+
+OPERATIONS = ("quote", "create", "approve", "pay", "dashboard", "month_close")
+
+
+def compare(old_path, new_path):
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'operation':<12} {'metric':<15} {'old':>10} {'new':>10} {'delta':>8}")
+    for name in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        before = old["endpoints"].get(name, {})
+        after = new["endpoints"].get(name, {})
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            a, b = before.get(metric), after.get(metric)
+            delta = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "n/a"
+            print(f"{name:<12} {metric:<15} {a if a is not None else '-':>10} {b if b is not None else '-':>10} {delta:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Target an already running API instead of starting one")
+    parser.add_argument("--admin-email", default=os.environ.get("BENCH_ADMIN_EMAIL"),
+                        help="Existing admin to log in as when the first-admin registration is refused")
+    parser.add_argument("--admin-password", default=os.environ.get("BENCH_ADMIN_PASSWORD"))
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=f"microcreditos_bench_{int(time.time())}")
+    parser.add_argument("--start-mongod", action="store_true", help="Launch a throwaway mongod on a temp dbpath")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--lenders", type=int, default=5)
+    parser.add_argument("--loans-per-client", type=int, default=2)
+    parser.add_argument("--active-ratio", type=float, default=0.7)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="Total operations (0 = unlimited)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after N seconds (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if not args.requests and not args.duration:
+        parser.error("--requests or --duration must bound the run")
+
+    def execute(base_url):
+        tester = LoadTester(base_url, args.seed, args.admin_email, args.admin_password)
+        tester.seed_portfolio(args.clients, args.lenders, args.loans_per_client, args.active_ratio)
+        elapsed = tester.run(args.mix, args.concurrency, args.requests, args.duration)
+        return tester.report(elapsed)
+
+    if args.base_url:
+        result = execute(args.base_url)
+    else:
+        with LocalStack(args.mongo_url, args.db_name, args.start_mongod, args.workers) as stack:
+            result = execute(stack.base_url)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "seed": args.seed,
+            "mix": args.mix,
+            "portfolio": {
+                "clients": args.clients,
+                "lenders": args.lenders,
+                "loans_per_client": args.loans_per_client,
+                "active_ratio": args.active_ratio,
+            },
+        },
+        **result,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Throughput benchmarks for calculate_loan and the amortization replay used by
+get_monthly_utility. See conftest.py for how baselines are compared.
+"""
+import random
+
+import pytest
+
+from loan_math import calculate_loan, interest_for_payment
+
+TERMS = [1, 12, 60, 120, 360, 720]
+FREQUENCY_DAYS = {"daily": 1, "every_other_day": 2, "weekly": 7, "monthly": 30}
+# Batch sizes for quoting many loans in one go (e.g. imports, generators).
+# Term is kept short on the largest batches so a round stays under a second.
+BATCHES = [(1, 60), (100, 60), (10_000, 12), (100_000, 12)]
+
+
+def loan_inputs(count, term, seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.choice([200000, 500000, 1000000, 5000000]), rng.choice([8.0, 12.0, 20.0]), term,
+         rng.choice(list(FREQUENCY_DAYS.values())))
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize("frequency", list(FREQUENCY_DAYS))
+@pytest.mark.parametrize("term", TERMS)
+def test_calculate_loan(bench, term, frequency):
+    days = FREQUENCY_DAYS[frequency]
+    result = calculate_loan(1000000, 12.0, term, days)
+    assert len(result["schedule"]) == term
+
+    bench(lambda: calculate_loan(1000000, 12.0, term, days))
+
+
+@pytest.mark.parametrize("batch,term", BATCHES)
+def test_calculate_loan_batch(bench, batch, term):
+    inputs = loan_inputs(batch, term)
+
+    def run():
+        for amount, rate, n, days in inputs:
+            calculate_loan(amount, rate, n, days)
+
+    bench(run, ops=batch)
+
+
+@pytest.mark.parametrize("payment_number", [1, 12, 120, 360, 720])
+def test_interest_for_payment(bench, payment_number):
+    monthly_payment = calculate_loan(1000000, 12.0, 720)["payment_amount"]
+    assert isinstance(interest_for_payment(1000000, 12.0, monthly_payment, payment_number, monthly_payment), float)
+
+    bench(lambda: interest_for_payment(1000000, 12.0, monthly_payment, payment_number, monthly_payment))
+
+
+@pytest.mark.parametrize("batch", [1, 100, 10_000, 100_000])
+def test_monthly_utility_replay_batch(bench, batch):
+    """Interest for a month's worth of payments, as get_monthly_utility does"""
+    rng = random.Random(batch)
+    payments = []
+    for amount, rate, term, days in loan_inputs(min(batch, 1000), 36, seed=batch):
+        monthly_payment = calculate_loan(amount, rate, term, days)["payment_amount"]
+        payments.append((amount, rate, monthly_payment))
+    rows = [
+        (*rng.choice(payments), rng.randint(1, 36), rng.choice([1.0, 1.0, 0.5]))
+        for _ in range(batch)
+    ]
+
+    def run():
+        total = 0
+        for amount, rate, monthly_payment, number, share in rows:
+            total += interest_for_payment(amount, rate, monthly_payment, number, monthly_payment * share)
+        return total
+
+    bench(run, ops=batch)
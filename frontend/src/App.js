@@ -25,6 +25,15 @@ const API = `${BACKEND_URL}/api`;
 
 export { API };
 
+// Todas las llamadas al backend llevan el token de la sesión
+axios.interceptors.request.use((config) => {
+  const token = localStorage.getItem("token");
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
 function App() {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -36,6 +45,21 @@ function App() {
       setUser(JSON.parse(userData));
     }
     setLoading(false);
+
+    // Token expirado o usuario desactivado: cerrar la sesión local
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      (error) => {
+        if (error.response?.status === 401 && localStorage.getItem("token")) {
+          localStorage.removeItem("token");
+          localStorage.removeItem("user");
+          setUser(null);
+          toast.error("Su sesión expiró, inicie sesión de nuevo");
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
   }, []);
 
   const handleLogin = (token, userData) => {
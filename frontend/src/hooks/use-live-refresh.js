@@ -0,0 +1,46 @@
+import { useEffect, useRef } from "react";
+import { API } from "@/App";
+
+const EVENT_TYPES = [
+  "loan.created",
+  "loan.approved",
+  "loan.rejected",
+  "payment.created",
+  "schedule.updated",
+  "schedules.status_changed",
+  "loans.reassigned",
+  "resync"
+];
+
+// Escucha el feed SSE del backend y llama a refresh cuando llega alguno de los
+// eventos indicados. Varios eventos seguidos (ej. una carga masiva) se agrupan
+// en una sola recarga.
+export function useLiveRefresh({ params = {}, events = EVENT_TYPES, refresh, delay = 1000 }) {
+  const refreshRef = useRef(refresh);
+  refreshRef.current = refresh;
+
+  // EventSource no permite encabezados: el token va en la query
+  const query = new URLSearchParams(
+    Object.entries({ ...params, token: localStorage.getItem("token") }).filter(([, value]) => value)
+  ).toString();
+  const eventsKey = events.join(",");
+
+  useEffect(() => {
+    const source = new EventSource(`${API}/events/stream${query ? `?${query}` : ""}`);
+    let timer = null;
+
+    const handleEvent = (message) => {
+      const event = JSON.parse(message.data);
+      clearTimeout(timer);
+      timer = setTimeout(() => refreshRef.current(event), delay);
+    };
+
+    const types = new Set([...eventsKey.split(","), "resync"]);
+    types.forEach((type) => source.addEventListener(type, handleEvent));
+
+    return () => {
+      clearTimeout(timer);
+      source.close();
+    };
+  }, [query, eventsKey, delay]);
+}
@@ -11,6 +11,7 @@ import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 import { Textarea } from "@/components/ui/textarea";
+import { useLiveRefresh } from "@/hooks/use-live-refresh";
 
 export default function AdminDashboard({ user, onLogout }) {
   const navigate = useNavigate();
@@ -38,43 +39,28 @@ export default function AdminDashboard({ user, onLogout }) {
 
   useEffect(() => {
     fetchData();
-    fetchFinancialData();
   }, []);
 
+  // Mantener el panel actualizado con los eventos del servidor en lugar de recargar
+  useLiveRefresh({ refresh: () => fetchData() });
+
   const fetchData = async () => {
     try {
-      const [statsRes, loansRes, lendersRes, configRes] = await Promise.all([
-        axios.get(`${API}/stats/dashboard?user_id=${user.id}&role=${user.role}`),
-        axios.get(`${API}/loans`),
-        axios.get(`${API}/users?role=lender`),
-        axios.get(`${API}/config/system`)
-      ]);
-      setStats(statsRes.data);
-      setLoans(loansRes.data);
-      setLenders(lendersRes.data);
-      setSystemConfig(configRes.data);
+      // Estadísticas, préstamos, configuración y finanzas del mes en una sola solicitud
+      const { data } = await axios.get(`${API}/bundles/admin-dashboard`);
+      setStats(data.stats);
+      setLoans(data.loans);
+      setLenders(data.lenders);
+      setSystemConfig(data.config);
+      setMonthlyUtility(data.monthly_utility);
+      setExpenses(data.expenses);
+      setFinancialComparison(data.financial_comparison);
     } catch (error) {
       toast.error("Error al cargar datos");
     } finally {
       setLoading(false);
     }
   };
-  
-  const fetchFinancialData = async () => {
-    try {
-      const now = new Date();
-      const [utilityRes, expensesRes, comparisonRes] = await Promise.all([
-        axios.get(`${API}/admin/monthly-utility`),
-        axios.get(`${API}/admin/expenses`),
-        axios.get(`${API}/admin/financial-comparison`)
-      ]);
-      setMonthlyUtility(utilityRes.data);
-      setExpenses(expensesRes.data);
-      setFinancialComparison(comparisonRes.data);
-    } catch (error) {
-      console.error("Error al cargar datos financieros:", error);
-    }
-  };
 
   const handleOpenProposal = (loan) => {
     setSelectedLoan(loan);
@@ -40,23 +40,19 @@ export default function ClientDashboard({ user, onLogout }) {
 
   const fetchData = async () => {
     try {
-      const [statsRes, loansRes, proposalsRes, configRes] = await Promise.all([
-        axios.get(`${API}/stats/dashboard?user_id=${user.id}&role=${user.role}`),
-        axios.get(`${API}/loans?client_id=${user.id}`),
-        axios.get(`${API}/proposals/count?client_id=${user.id}`),
-        axios.get(`${API}/config/system`)
-      ]);
-      setStats(statsRes.data);
+      // Todo el panel en una sola solicitud
+      const { data } = await axios.get(`${API}/bundles/client-dashboard?client_id=${user.id}`);
+      setStats(data.stats);
       
       // Ordenar préstamos: activos primero, luego pendientes, completados al final
-      const sortedLoans = loansRes.data.sort((a, b) => {
+      const sortedLoans = data.loans.sort((a, b) => {
         const statusOrder = { 'active': 1, 'approved': 2, 'pending': 3, 'completed': 4, 'rejected': 5 };
         return (statusOrder[a.status] || 99) - (statusOrder[b.status] || 99);
       });
       
       setLoans(sortedLoans);
-      setProposalsCount(proposalsRes.data.count);
-      setSystemConfig(configRes.data);
+      setProposalsCount(data.proposals_count);
+      setSystemConfig(data.config);
     } catch (error) {
       toast.error("Error al cargar datos");
     } finally {
@@ -7,30 +7,60 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/com
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } from "@/components/ui/dialog";
 import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 import { toast } from "sonner";
-import { ArrowLeft, Calendar, DollarSign, User, Phone } from "lucide-react";
+import { ArrowLeft, Calendar, MapPin, Phone } from "lucide-react";
+import { useLiveRefresh } from "@/hooks/use-live-refresh";
+
+const PAGE_SIZE = 50;
 
 export default function CollectionModule({ user, onLogout }) {
   const navigate = useNavigate();
-  const [todaySchedules, setTodaySchedules] = useState([]);
-  const [allSchedules, setAllSchedules] = useState([]);
+  // Un prestamista ve su propia hoja de ruta; un admin elige el prestamista
+  const [lenderId, setLenderId] = useState(user.role === "lender" ? user.id : "");
+  const [lenders, setLenders] = useState([]);
+  const [sheet, setSheet] = useState({ items: [], total: 0, total_amount: 0 });
+  const [page, setPage] = useState(1);
   const [loading, setLoading] = useState(true);
   const [editDialog, setEditDialog] = useState(false);
   const [selectedSchedule, setSelectedSchedule] = useState(null);
   const [newDate, setNewDate] = useState("");
 
   useEffect(() => {
-    fetchData();
-  }, []);
+    if (user.role !== "admin") return;
+    axios.get(`${API}/users?role=lender`)
+      .then(({ data }) => {
+        setLenders(data);
+        if (data.length > 0) {
+          setLenderId((current) => current || data[0].id);
+        } else {
+          setLoading(false);
+        }
+      })
+      .catch(() => {
+        toast.error("Error al cargar prestamistas");
+        setLoading(false);
+      });
+  }, [user.role]);
+
+  useEffect(() => {
+    if (lenderId) fetchData();
+  }, [lenderId, page]);
+
+  useLiveRefresh({
+    params: { lender_id: lenderId },
+    events: ["loan.approved", "payment.created", "schedule.updated", "schedules.status_changed"],
+    refresh: () => lenderId && fetchData()
+  });
 
+  // Cuotas de hoy y vencidas del prestamista, ordenadas por vencimiento y paginadas
+  // en el servidor
   const fetchData = async () => {
     try {
-      const [todayRes, allRes] = await Promise.all([
-        axios.get(`${API}/schedules/today`),
-        axios.get(`${API}/schedules?status=pending`)
-      ]);
-      setTodaySchedules(todayRes.data);
-      setAllSchedules(allRes.data);
+      const { data } = await axios.get(`${API}/lenders/${lenderId}/route-sheet`, {
+        params: { page, page_size: PAGE_SIZE }
+      });
+      setSheet(data);
     } catch (error) {
       toast.error("Error al cargar programación de cobros");
     } finally {
@@ -38,6 +68,8 @@ export default function CollectionModule({ user, onLogout }) {
     }
   };
 
+  const totalPages = Math.max(1, Math.ceil(sheet.total / PAGE_SIZE));
+
   const handleUpdateDate = async () => {
     if (!newDate) {
       toast.error("Selecciona una fecha");
@@ -90,104 +122,58 @@ export default function CollectionModule({ user, onLogout }) {
       </header>
 
       <main className="container mx-auto px-4 py-8 max-w-6xl">
-        {/* Today's Collections */}
-        <Card className="glass-card mb-8" data-testid="today-collections-card">
+        {user.role === "admin" && (
+          <div className="mb-6 max-w-sm space-y-2">
+            <Label>Prestamista</Label>
+            <Select
+              value={lenderId}
+              onValueChange={(value) => {
+                setLenderId(value);
+                setPage(1);
+              }}
+            >
+              <SelectTrigger data-testid="route-sheet-lender-select">
+                <SelectValue placeholder="Selecciona un prestamista" />
+              </SelectTrigger>
+              <SelectContent>
+                {lenders.map((lender) => (
+                  <SelectItem key={lender.id} value={lender.id} data-testid={`route-sheet-lender-${lender.id}`}>
+                    {lender.name}
+                  </SelectItem>
+                ))}
+              </SelectContent>
+            </Select>
+          </div>
+        )}
+
+        <Card data-testid="route-sheet-card">
           <CardHeader>
             <CardTitle className="flex items-center space-x-2">
               <Calendar className="w-6 h-6" />
-              <span>Cobros de Hoy</span>
+              <span>Hoja de Ruta</span>
             </CardTitle>
             <CardDescription>
               {new Date().toLocaleDateString('es-ES', { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric' })}
+              {" · "}Total: {sheet.total} cobros de hoy y vencidos por ${sheet.total_amount}
             </CardDescription>
           </CardHeader>
           <CardContent>
-            {todaySchedules.length === 0 ? (
+            {sheet.items.length === 0 ? (
               <div className="py-8 text-center text-gray-500">
                 <Calendar className="w-12 h-12 mx-auto mb-3 text-gray-300" />
-                <p>No hay cobros programados para hoy</p>
-              </div>
-            ) : (
-              <div className="space-y-4">
-                {todaySchedules.map((schedule) => (
-                  <div
-                    key={schedule.id}
-                    className="p-4 bg-amber-50 border-2 border-amber-200 rounded-lg"
-                    data-testid={`today-schedule-${schedule.id}`}
-                  >
-                    <div className="flex justify-between items-start mb-3">
-                      <div className="flex items-center space-x-3">
-                        <div className="w-10 h-10 bg-amber-100 rounded-full flex items-center justify-center">
-                          <User className="w-5 h-5 text-amber-600" />
-                        </div>
-                        <div>
-                          <p className="font-semibold text-lg" data-testid={`client-name-${schedule.id}`}>{schedule.client_name}</p>
-                          <p className="text-sm text-gray-600">Cuota #{schedule.payment_number}</p>
-                        </div>
-                      </div>
-                      <div className="text-right">
-                        <p className="text-2xl font-bold text-amber-600">${schedule.amount}</p>
-                      </div>
-                    </div>
-                    <div className="flex justify-between items-center pt-3 border-t border-amber-200">
-                      <Button
-                        size="sm"
-                        variant="outline"
-                        onClick={() => navigate(`/loan/${schedule.loan_id}`)}
-                        data-testid={`view-loan-${schedule.id}`}
-                      >
-                        Ver Préstamo
-                      </Button>
-                      <Button
-                        size="sm"
-                        onClick={() => {
-                          setSelectedSchedule(schedule);
-                          setNewDate(new Date(schedule.due_date).toISOString().split('T')[0]);
-                          setEditDialog(true);
-                        }}
-                        data-testid={`edit-date-${schedule.id}`}
-                      >
-                        <Calendar className="w-4 h-4 mr-1" />
-                        Cambiar Fecha
-                      </Button>
-                    </div>
-                  </div>
-                ))}
-              </div>
-            )}
-          </CardContent>
-        </Card>
-
-        {/* All Pending Collections */}
-        <Card data-testid="all-collections-card">
-          <CardHeader>
-            <CardTitle>Todos los Cobros Pendientes</CardTitle>
-            <CardDescription>
-              Total: {allSchedules.length} cobros pendientes
-            </CardDescription>
-          </CardHeader>
-          <CardContent>
-            {allSchedules.length === 0 ? (
-              <div className="py-8 text-center text-gray-500">
-                <p>No hay cobros pendientes</p>
+                <p>No hay cobros para hoy ni vencidos</p>
               </div>
             ) : (
               <div className="space-y-3">
-                {allSchedules.map((schedule) => {
+                {sheet.items.map((schedule) => {
                   const dueDate = new Date(schedule.due_date);
-                  const today = new Date();
-                  const isToday = dueDate.toDateString() === today.toDateString();
-                  const isPast = dueDate < today && !isToday;
+                  const isToday = dueDate.toDateString() === new Date().toDateString();
 
                   return (
                     <div
                       key={schedule.id}
                       className={`p-4 rounded-lg border flex justify-between items-center ${
-                        isToday
-                          ? "bg-amber-50 border-amber-200"
-                          : isPast
-                          ? "bg-red-50 border-red-200"
-                          : "bg-white border-gray-200"
+                        isToday ? "bg-amber-50 border-amber-200" : "bg-red-50 border-red-200"
                       }`}
                       data-testid={`schedule-${schedule.id}`}
                     >
@@ -196,9 +182,24 @@ export default function CollectionModule({ user, onLogout }) {
                         <p className="text-sm text-gray-600">Cuota #{schedule.payment_number}</p>
                         <p className="text-sm text-gray-600">
                           Vence: {dueDate.toLocaleDateString('es-ES')}
-                          {isPast && <span className="text-red-600 font-semibold ml-2">(Vencido)</span>}
-                          {isToday && <span className="text-amber-600 font-semibold ml-2">(Hoy)</span>}
+                          {isToday ? (
+                            <span className="text-amber-600 font-semibold ml-2">(Hoy)</span>
+                          ) : (
+                            <span className="text-red-600 font-semibold ml-2">(Vencido)</span>
+                          )}
                         </p>
+                        {schedule.address && (
+                          <p className="text-sm text-gray-600 flex items-center">
+                            <MapPin className="w-3 h-3 mr-1" />
+                            {schedule.address}
+                          </p>
+                        )}
+                        {schedule.phone && (
+                          <p className="text-sm text-gray-600 flex items-center">
+                            <Phone className="w-3 h-3 mr-1" />
+                            {schedule.phone}
+                          </p>
+                        )}
                       </div>
                       <div className="flex items-center space-x-4">
                         <p className="text-xl font-bold">${schedule.amount}</p>
@@ -229,6 +230,29 @@ export default function CollectionModule({ user, onLogout }) {
                 })}
               </div>
             )}
+            {totalPages > 1 && (
+              <div className="flex justify-between items-center pt-4">
+                <Button
+                  size="sm"
+                  variant="outline"
+                  disabled={page <= 1}
+                  onClick={() => setPage(page - 1)}
+                  data-testid="route-sheet-prev"
+                >
+                  Anterior
+                </Button>
+                <span className="text-sm text-gray-600">Página {page} de {totalPages}</span>
+                <Button
+                  size="sm"
+                  variant="outline"
+                  disabled={page >= totalPages}
+                  onClick={() => setPage(page + 1)}
+                  data-testid="route-sheet-next"
+                >
+                  Siguiente
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
       </main>
@@ -10,6 +10,21 @@ import { Label } from "@/components/ui/label";
 import { toast } from "sonner";
 import { ArrowLeft, Users, RefreshCw, AlertTriangle, User } from "lucide-react";
 
+const JOB_POLL_INTERVAL_MS = 1000;
+// Tope de consultas (~5 minutos); el trabajo sigue en el servidor si se agota
+const JOB_MAX_POLLS = 300;
+
+const waitForJob = async (jobId) => {
+  for (let poll = 0; poll < JOB_MAX_POLLS; poll++) {
+    const { data } = await axios.get(`${API}/admin/jobs/${jobId}`);
+    if (data.status === "completed" || data.status === "failed") {
+      return data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+  throw new Error("La reasignación sigue en proceso; actualice la página en unos minutos");
+};
+
 export default function LenderClientsPage({ user, onLogout }) {
   const { lenderId } = useParams();
   const navigate = useNavigate();
@@ -55,12 +70,17 @@ export default function LenderClientsPage({ user, onLogout }) {
       const response = await axios.post(
         `${API}/users/${lenderId}/reassign-clients?new_lender_id=${selectedNewLender}&admin_id=${user.id}`
       );
-      toast.success(response.data.message);
+      // La reasignación corre en segundo plano: esperar a que el trabajo termine
+      const job = await waitForJob(response.data.id);
+      if (job.status === "failed") {
+        throw new Error(job.error);
+      }
+      toast.success(job.result.message);
       setReassignDialog(false);
       setSelectedNewLender("");
       fetchData(); // Actualizar datos
     } catch (error) {
-      toast.error(error.response?.data?.detail || "Error al reasignar clientes");
+      toast.error(error.response?.data?.detail || error.message || "Error al reasignar clientes");
     } finally {
       setReassigning(false);
     }
@@ -7,6 +7,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/com
 import { Input } from "@/components/ui/input";
 import { toast } from "sonner";
 import { DollarSign, TrendingUp, CheckCircle, LogOut, Calendar, Search } from "lucide-react";
+import { useLiveRefresh } from "@/hooks/use-live-refresh";
 
 export default function LenderDashboard({ user, onLogout }) {
   const navigate = useNavigate();
@@ -20,19 +21,22 @@ export default function LenderDashboard({ user, onLogout }) {
     fetchData();
   }, []);
 
+  useLiveRefresh({
+    params: { lender_id: user.id },
+    events: ["loan.approved", "loan.rejected", "payment.created", "loans.reassigned"],
+    refresh: () => fetchData()
+  });
+
   useEffect(() => {
     filterLoans();
   }, [searchTerm, loans]);
 
   const fetchData = async () => {
     try {
-      const [statsRes, loansRes] = await Promise.all([
-        axios.get(`${API}/stats/dashboard?user_id=${user.id}&role=${user.role}`),
-        axios.get(`${API}/loans?lender_id=${user.id}`)
-      ]);
-      setStats(statsRes.data);
-      setLoans(loansRes.data);
-      setFilteredLoans(loansRes.data);
+      const { data } = await axios.get(`${API}/bundles/lender-dashboard?lender_id=${user.id}`);
+      setStats(data.stats);
+      setLoans(data.loans);
+      setFilteredLoans(data.loans);
     } catch (error) {
       toast.error("Error al cargar datos");
     } finally {
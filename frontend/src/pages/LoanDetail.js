@@ -19,6 +19,8 @@ export default function LoanDetail({ user, onLogout }) {
   const [payments, setPayments] = useState([]);
   const [loading, setLoading] = useState(true);
   const [paymentDialog, setPaymentDialog] = useState(false);
+  // Misma clave en los reintentos de un mismo pago para que no se aplique dos veces
+  const [paymentKey, setPaymentKey] = useState(() => crypto.randomUUID());
   const [paymentData, setPaymentData] = useState({
     amount: "",
     notes: ""
@@ -41,7 +43,7 @@ export default function LoanDetail({ user, onLogout }) {
       setPayments(paymentsRes.data);
       
       // Set default payment amount to next pending payment or remaining amount
-      const nextPending = schedulesRes.data.find(s => s.status === "pending");
+      const nextPending = schedulesRes.data.find(s => s.status !== "paid");
       if (nextPending) {
         setPaymentData({ ...paymentData, amount: nextPending.amount.toString() });
       } else if (paymentStatusRes.data.pending_amount > 0) {
@@ -59,8 +61,10 @@ export default function LoanDetail({ user, onLogout }) {
     try {
       await axios.post(
         `${API}/payments?client_id=${loan.client_id}`,
-        { loan_id: loanId, amount: parseFloat(paymentData.amount), notes: paymentData.notes }
+        { loan_id: loanId, amount: parseFloat(paymentData.amount), notes: paymentData.notes },
+        { headers: { "Idempotency-Key": paymentKey } }
       );
+      setPaymentKey(crypto.randomUUID());
       toast.success("Pago registrado exitosamente");
       setPaymentDialog(false);
       setPaymentData({ amount: "", notes: "" });
@@ -87,7 +91,7 @@ export default function LoanDetail({ user, onLogout }) {
   }
 
   const paidSchedules = schedules.filter(s => s.status === "paid");
-  const pendingSchedules = schedules.filter(s => s.status === "pending");
+  const pendingSchedules = schedules.filter(s => s.status !== "paid");
   const totalPaid = payments.reduce((sum, p) => sum + p.amount, 0);
   const remaining = loan.total_amount - totalPaid;
 
@@ -323,7 +327,10 @@ export default function LoanDetail({ user, onLogout }) {
                   <div className="text-right">
                     <p className="text-xl font-bold">${schedule.amount}</p>
                     <span className={`status-badge status-${schedule.status} text-xs`}>
-                      {schedule.status === "paid" ? "Pagado" : "Pendiente"}
+                      {schedule.status === "paid" && "Pagado"}
+                      {schedule.status === "pending" && "Pendiente"}
+                      {schedule.status === "late" && "Atrasado"}
+                      {schedule.status === "overdue" && "En mora"}
                     </span>
                   </div>
                 </div>
@@ -0,0 +1,86 @@
+"""
+Shared fixtures for the backend tests.
+
+Pure modules (loan_math, payment_ledger, portfolio_analytics) are imported
+directly. Tests that go through server.py use the `api` fixture, which swaps
+the Motor client for mongomock_motor (standalone mode, no transactions).
+mongomock and mongomock-motor are pinned in backend/requirements.txt; the
+fixture only skips in an environment installed without them.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "loans_test")
+os.environ.setdefault("MONGO_TRANSACTIONS", "off")
+
+
+class Api:
+    """TestClient plus the admin, lender and client registered by the fixture"""
+
+    def __init__(self, client, server):
+        self.client = client
+        self.server = server
+        self.users = {}
+
+    def register(self, role, name):
+        response = self.client.post("/api/auth/register", json={
+            "email": f"{name}@example.com", "password": "secret", "name": name,
+            "role": role, "phone": "1", "address": "a"
+        })
+        assert response.status_code == 200, response.text
+        body = response.json()
+        self.users[name] = body
+        return body
+
+    def headers(self, name):
+        return {"Authorization": f"Bearer {self.users[name]['access_token']}"}
+
+    def user_id(self, name):
+        return self.users[name]["user"]["id"]
+
+    def create_loan(self, client="client", amount=100000):
+        response = self.client.post("/api/loans", json={
+            "amount": amount, "interest_rate": 12, "term_months": 6, "payment_frequency": "weekly"
+        }, headers=self.headers(client))
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    def approve(self, loan_id, lender="lender", start_date="2026-10-01T00:00:00+00:00"):
+        response = self.client.post(f"/api/loans/{loan_id}/approve", json={
+            "loan_id": loan_id, "lender_id": self.user_id(lender), "start_date": start_date
+        }, headers=self.headers("admin"))
+        assert response.status_code == 200, response.text
+
+    def run(self, coroutine_function, *args):
+        """Run a server coroutine on the TestClient event loop"""
+        return self.client.portal.call(coroutine_function, *args)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+    import server
+
+    mock = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(server, "client", mock)
+    monkeypatch.setattr(server, "db", mock[os.environ["DB_NAME"]])
+
+    async def no_storage_check():
+        pass
+
+    # mongomock has no time-series collections (or list_collections options)
+    monkeypatch.setattr(server, "configure_payments_storage", no_storage_check)
+    with TestClient(server.app) as client:
+        api = Api(client, server)
+        # The first admin may self-register
+        api.register("admin", "admin")
+        api.register("lender", "lender")
+        api.register("client", "client")
+        yield api
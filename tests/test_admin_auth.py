@@ -0,0 +1,55 @@
+"""Admin routes: 401 without a valid token, 403 for other roles, checked per handler."""
+from datetime import datetime, timezone, timedelta
+
+import jwt
+import pytest
+
+ADMIN_ROUTES = [
+    ("GET", "/api/admin/portfolio-at-risk"),
+    ("GET", "/api/admin/cash-flow-projection"),
+    ("GET", "/api/admin/monthly-utility"),
+    ("GET", "/api/admin/expenses"),
+    ("DELETE", "/api/admin/expenses/e1"),
+    ("GET", "/api/admin/fixed-expenses"),
+    ("PUT", "/api/admin/fixed-expenses/e1"),
+    ("DELETE", "/api/admin/fixed-expenses/e1"),
+    ("GET", "/api/admin/financial-comparison"),
+    ("GET", "/api/bundles/admin-dashboard"),
+    ("GET", "/api/admin/export/loans"),
+    ("GET", "/api/admin/jobs"),
+    ("GET", "/api/admin/jobs/j1"),
+    ("GET", "/api/admin/metrics/pool"),
+]
+
+
+def call(api, method, path, headers=None):
+    body = {"description": "x", "amount": 1} if method == "PUT" else None
+    return api.client.request(method, path, json=body, headers=headers or {})
+
+
+@pytest.mark.parametrize("method,path", ADMIN_ROUTES)
+def test_missing_or_expired_token_gets_401(api, method, path):
+    expired = jwt.encode(
+        {"sub": api.user_id("admin"), "exp": datetime.now(timezone.utc) - timedelta(minutes=1)},
+        api.server.SECRET_KEY, algorithm=api.server.ALGORITHM
+    )
+
+    assert call(api, method, path).status_code == 401
+    assert call(api, method, path, {"Authorization": f"Bearer {expired}"}).status_code == 401
+
+
+@pytest.mark.parametrize("method,path", ADMIN_ROUTES)
+def test_lender_gets_403_even_without_the_path_prefix_check(api, monkeypatch, method, path):
+    assert call(api, method, path, api.headers("lender")).status_code == 403
+
+    # The handler's own require_admin does not rely on ADMIN_PATH_PREFIXES
+    monkeypatch.setattr(api.server, "ADMIN_PATH_PREFIXES", ())
+    assert call(api, method, path, api.headers("lender")).status_code == 403
+    assert call(api, method, path, api.headers("client")).status_code == 403
+
+
+def test_admin_reaches_the_handlers(api):
+    for method, path in [("GET", "/api/admin/jobs"), ("GET", "/api/bundles/admin-dashboard"),
+                         ("GET", "/api/admin/metrics/pool")]:
+        response = call(api, method, path, api.headers("admin"))
+        assert response.status_code == 200, (path, response.text)
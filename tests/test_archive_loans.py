@@ -0,0 +1,89 @@
+"""archive_loans_job: an interrupted run never leaves schedules or payments without their loan."""
+import pytest
+
+
+def test_interrupted_archive_is_finished_by_the_next_run(api, monkeypatch):
+    server = api.server
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    response = api.client.post("/api/payments", json={"loan_id": loan_id, "amount": 5000},
+                               headers=api.headers("admin"))
+    assert response.status_code == 200, response.text
+    api.run(server.db.loans.update_one, {"id": loan_id}, {"$set": {
+        "status": server.LoanStatus.COMPLETED, "closed_at": "2020-01-01T00:00:00+00:00"
+    }})
+
+    async def report(done, total):
+        pass
+
+    ledger_class = type(server.payment_ledger())
+    delete_many = ledger_class.delete_many
+
+    async def crash(self, query):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(ledger_class, "delete_many", crash)
+    with pytest.raises(RuntimeError):
+        api.run(server.archive_loans_job, {"older_than_months": 12}, report)
+
+    # The loan is still active, so its payments were not orphaned
+    assert api.run(server.db.loans.count_documents, {"id": loan_id}) == 1
+    assert api.run(server.db.payments.count_documents, {"loan_id": loan_id}) == 1
+
+    monkeypatch.setattr(ledger_class, "delete_many", delete_many)
+    result = api.run(server.archive_loans_job, {"older_than_months": 12}, report)
+
+    assert result["loans_archived"] == 1
+    assert result["payments_archived"] == 1
+    for collection in ("loans", "payment_schedules", "payments"):
+        field = "id" if collection == "loans" else "loan_id"
+        assert api.run(server.db[collection].count_documents, {field: loan_id}) == 0
+    assert api.run(server.db.payment_schedules_archive.count_documents, {"loan_id": loan_id}) > 0
+
+
+def test_reports_and_dashboards_keep_archived_loans(api):
+    server = api.server
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    response = api.client.post("/api/payments", json={"loan_id": loan_id, "amount": 5000},
+                               headers=api.headers("admin"))
+    assert response.status_code == 200, response.text
+    api.run(server.db.loans.update_one, {"id": loan_id}, {"$set": {
+        "status": server.LoanStatus.COMPLETED, "closed_at": "2020-01-01T00:00:00+00:00"
+    }})
+    admin, lender, client = api.user_id("admin"), api.user_id("lender"), api.user_id("client")
+
+    def snapshot():
+        responses = {
+            "admin": api.client.get("/api/stats/dashboard", params={"user_id": admin, "role": "admin"},
+                                    headers=api.headers("admin")),
+            "lender": api.client.get("/api/stats/dashboard", params={"user_id": lender, "role": "lender"},
+                                     headers=api.headers("lender")),
+            "client": api.client.get("/api/stats/dashboard", params={"user_id": client, "role": "client"},
+                                     headers=api.headers("client")),
+            "lender_bundle": api.client.get("/api/bundles/lender-dashboard", params={"lender_id": lender},
+                                            headers=api.headers("lender")),
+            "client_bundle": api.client.get("/api/bundles/client-dashboard", params={"client_id": client},
+                                            headers=api.headers("client")),
+            "profit": api.client.get("/api/admin/monthly-profit", headers=api.headers("admin")),
+            "utility": api.client.get("/api/admin/monthly-utility", headers=api.headers("admin")),
+            "client_user": api.client.get(f"/api/users/{client}", headers=api.headers("lender")),
+        }
+        for name, response in responses.items():
+            assert response.status_code == 200, (name, response.text)
+        bodies = {name: response.json() for name, response in responses.items()}
+        for name in ("lender_bundle", "client_bundle"):
+            bodies[name] = bodies[name]["stats"]
+        return bodies
+
+    before = snapshot()
+    assert before["client"]["total_paid"] == 5000
+    assert before["utility"]["total_payments"] == 5000
+
+    async def report(done, total):
+        pass
+
+    result = api.run(server.archive_loans_job, {"older_than_months": 12}, report)
+    assert result["loans_archived"] == 1
+
+    assert snapshot() == before
@@ -0,0 +1,25 @@
+"""backfill_schedule_lenders job: copies each loan's lender_id to its schedules."""
+
+
+def test_backfill_updates_only_schedules_with_a_different_lender(api, monkeypatch):
+    server = api.server
+    monkeypatch.setattr(server, "BULK_CHUNK_SIZE", 1)
+    loans = [{"id": "a", "lender_id": "l1"}, {"id": "b", "lender_id": "l2"}, {"id": "c", "lender_id": None}]
+    api.run(server.db.loans.insert_many, loans)
+    api.run(server.db.payment_schedules.insert_many, [
+        {"id": "a1", "loan_id": "a"},
+        {"id": "a2", "loan_id": "a", "lender_id": "l1"},
+        {"id": "b1", "loan_id": "b", "lender_id": "old"},
+        {"id": "c1", "loan_id": "c"},
+    ])
+    progress = []
+
+    async def report(done, total=None):
+        progress.append((done, total))
+
+    result = api.run(server.backfill_schedule_lenders_job, {}, report)
+
+    assert result == {"loans_scanned": 2, "modified_schedules": 2}
+    assert progress[-1] == (2, 2)
+    schedules = api.run(lambda: server.db.payment_schedules.find({}, {"_id": 0}).to_list(None))
+    assert {doc["id"]: doc.get("lender_id") for doc in schedules} == {"a1": "l1", "a2": "l1", "b1": "l2", "c1": None}
@@ -0,0 +1,65 @@
+"""POST /api/loans/bulk-approve: batched claims and per-loan results."""
+
+
+def bulk_approve(api, loan_ids):
+    response = api.client.post("/api/loans/bulk-approve", json={
+        "lender_id": api.user_id("lender"),
+        "loans": [{"loan_id": loan_id, "start_date": "2026-10-01T00:00:00+00:00"} for loan_id in loan_ids]
+    }, headers=api.headers("admin"))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def find_loans(api):
+    return {loan["id"]: loan for loan in api.run(lambda: api.server.db.loans.find({}, {"_id": 0}).to_list(None))}
+
+
+def count_schedules(api, loan_id):
+    return api.run(api.server.db.payment_schedules.count_documents, {"loan_id": loan_id})
+
+
+def test_approves_pending_loans_and_reports_the_rest(api):
+    pending = [api.create_loan()["id"] for _ in range(3)]
+    already_active = api.create_loan()["id"]
+    api.approve(already_active)
+
+    summary = bulk_approve(api, pending + [already_active, "missing"])
+
+    assert (summary["approved"], summary["failed"]) == (3, 2)
+    loans = find_loans(api)
+    numbers = [result["loan_number"] for result in summary["results"][:3]]
+    assert numbers == [loans[loan_id]["loan_number"] for loan_id in pending]
+    assert len(set(numbers)) == 3
+    for loan_id in pending:
+        assert loans[loan_id]["status"] == "active"
+        assert count_schedules(api, loan_id) == loans[loan_id]["term_months"]
+
+
+def test_loan_changed_since_the_read_gets_no_number_or_schedules(api, monkeypatch):
+    server = api.server
+    first, stale = api.create_loan()["id"], api.create_loan()["id"]
+    build = server.build_schedule_docs_many
+
+    def build_then_go_stale(items, now=None):
+        docs = build(items, now)
+        # Pretend the loan was read before another write bumped its version
+        for loan, _, _ in items:
+            if loan["id"] == stale:
+                loan["version"] = 41
+        return docs
+
+    monkeypatch.setattr(server, "build_schedule_docs_many", build_then_go_stale)
+
+    summary = bulk_approve(api, [first, stale])
+
+    assert [result["status"] for result in summary["results"]] == ["approved", "error"]
+    loans = find_loans(api)
+    assert loans[stale]["status"] == "pending"
+    assert loans[stale]["loan_number"] is None
+    assert count_schedules(api, stale) == 0
+    assert count_schedules(api, first) == loans[first]["term_months"]
+    # Numbers are assigned in the claim itself, so the stale loan's number stays unused
+    counter = api.run(server.db.counters.find_one, {"_id": {"$regex": "^loan_number:"}})
+    assert counter["seq"] == 2
+    assert loans[first]["loan_number"] == summary["results"][0]["loan_number"]
+    assert loans[first]["version"] == 1
@@ -0,0 +1,177 @@
+"""POST /api/payments/bulk: each chunk of loans commits (and retries) on its own."""
+from datetime import timedelta
+
+import pytest
+
+
+def patch_loan_claims(api, monkeypatch, on_claim):
+    """Call on_claim(loan_ids) before every version claim of the bulk import"""
+    collection_class = type(api.server.db.loans)
+    bulk_write = collection_class.bulk_write
+
+    async def bulk_write_with_hook(self, requests, *args, **kwargs):
+        if self.name == "loans" and "$inc" in requests[0]._doc:
+            await on_claim([request._filter["id"] for request in requests])
+        return await bulk_write(self, requests, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "bulk_write", bulk_write_with_hook)
+
+
+def assert_paid_once(api, loan_id, amount):
+    loan = api.run(api.server.db.loans.find_one, {"id": loan_id})
+    assert loan["balance"]["total_paid"] == amount
+    assert loan["balance"]["payment_count"] == 1
+    assert loan["balance"] == api.run(api.server.compute_loan_balance, loan_id)
+
+
+def test_version_conflict_retries_only_its_chunk(api, monkeypatch):
+    server = api.server
+    first, second = api.create_loan()["id"], api.create_loan()["id"]
+    api.approve(first)
+    api.approve(second)
+    monkeypatch.setattr(server, "BULK_CHUNK_SIZE", 1)
+    claims = []
+
+    async def concurrent_payment(loan_ids):
+        claims.append(loan_ids)
+        if loan_ids == [second] and claims.count([second]) == 1:
+            # Another payment lands on the second loan between read and claim
+            await server.db.loans.update_one({"id": second}, {"$inc": {"version": 1}})
+
+    patch_loan_claims(api, monkeypatch, concurrent_payment)
+    response = api.client.post("/api/payments/bulk", json={"payments": [
+        {"loan_id": first, "amount": 5000}, {"loan_id": second, "amount": 7000}
+    ]}, headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    assert response.json()["applied"] == 2
+    assert claims == [[first], [second], [second]]
+    assert_paid_once(api, first, 5000)
+    assert_paid_once(api, second, 7000)
+
+
+def test_loan_that_keeps_conflicting_fails_only_its_rows(api, monkeypatch):
+    server = api.server
+    first, second = api.create_loan()["id"], api.create_loan()["id"]
+    api.approve(first)
+    api.approve(second)
+    monkeypatch.setattr(server, "OCC_MAX_RETRIES", 2)
+
+    async def always_modified(loan_ids):
+        if second in loan_ids:
+            await server.db.loans.update_one({"id": second}, {"$inc": {"version": 1}})
+
+    patch_loan_claims(api, monkeypatch, always_modified)
+    response = api.client.post("/api/payments/bulk", json={"payments": [
+        {"loan_id": first, "amount": 5000}, {"loan_id": second, "amount": 7000}, {"loan_id": second, "amount": 1000}
+    ]}, headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["applied"], body["failed"], body["amount_applied"]) == (1, 2, 5000)
+    assert [result["status"] for result in body["results"]] == ["applied", "error", "error"]
+    assert body["results"][1]["detail"] == server.VERSION_CONFLICT_DETAIL
+    assert_paid_once(api, first, 5000)
+    assert api.run(server.db.payments.count_documents, {"loan_id": second}) == 0
+
+
+def test_retry_after_an_interrupted_import_skips_committed_chunks(api, monkeypatch):
+    server = api.server
+    first, second = api.create_loan()["id"], api.create_loan()["id"]
+    api.approve(first)
+    api.approve(second)
+    monkeypatch.setattr(server, "BULK_CHUNK_SIZE", 1)
+    crash = {"armed": True}
+
+    async def crash_on_second(loan_ids):
+        if loan_ids == [second] and crash["armed"]:
+            raise RuntimeError("connection lost")
+
+    patch_loan_claims(api, monkeypatch, crash_on_second)
+    payments = {"payments": [{"loan_id": first, "amount": 5000}, {"loan_id": second, "amount": 7000}]}
+    headers = {**api.headers("admin"), "Idempotency-Key": "cash-close-1"}
+    with pytest.raises(RuntimeError):
+        api.client.post("/api/payments/bulk", json=payments, headers=headers)
+
+    # The first chunk is recorded, so the key stays reserved until the lock expires
+    record = api.run(server.db.idempotency_keys.find_one, {})
+    assert [result["loan_id"] for result in record["progress"]] == [first]
+    assert api.client.post("/api/payments/bulk", json=payments, headers=headers).status_code == 409
+    api.run(server.db.idempotency_keys.update_one, {"_id": record["_id"]}, {
+        "$set": {"created_at": record["created_at"] - timedelta(seconds=server.IDEMPOTENCY_LOCK_SECONDS + 1)}
+    })
+
+    crash["armed"] = False
+    response = api.client.post("/api/payments/bulk", json=payments, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["applied"] == 2
+    assert response.json()["amount_applied"] == 12000
+    assert_paid_once(api, first, 5000)
+    assert_paid_once(api, second, 7000)
+
+
+def test_rows_are_checked_against_the_balance_snapshot(api):
+    server = api.server
+    snapshot_loan, legacy_loan = api.create_loan()["id"], api.create_loan()["id"]
+    api.approve(snapshot_loan)
+    api.approve(legacy_loan)
+    outstanding = api.run(server.db.loans.find_one, {"id": snapshot_loan})["balance"]["outstanding"]
+    # A loan from before the snapshot existed falls back to compute_loan_balance
+    api.run(server.db.loans.update_one, {"id": legacy_loan}, {"$unset": {"balance": ""}})
+
+    response = api.client.post("/api/payments/bulk", json={"payments": [
+        {"loan_id": snapshot_loan, "amount": 7000},
+        # Would fit in the loan alone, not after the row above
+        {"loan_id": snapshot_loan, "amount": outstanding - 6999},
+        {"loan_id": legacy_loan, "amount": outstanding + 1},
+        {"loan_id": legacy_loan, "amount": 4000},
+    ]}, headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["applied", "error", "error", "applied"]
+    assert f"(${outstanding - 7000:,})" in results[1]["detail"]
+    assert f"(${outstanding:,})" in results[2]["detail"]
+    assert_paid_once(api, snapshot_loan, 7000)
+    assert_paid_once(api, legacy_loan, 4000)
+    # The snapshot moves the same way a single create_payment would move it
+    loan = api.run(server.db.loans.find_one, {"id": snapshot_loan})
+    assert loan["balance"]["outstanding"] == outstanding - 7000
+
+
+def test_paying_off_in_bulk_closes_the_loan_and_its_snapshot(api):
+    server = api.server
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    outstanding = api.run(server.db.loans.find_one, {"id": loan_id})["balance"]["outstanding"]
+
+    response = api.client.post("/api/payments/bulk", json={"payments": [
+        {"loan_id": loan_id, "amount": outstanding}, {"loan_id": loan_id, "amount": 1}
+    ]}, headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert results[0]["loan_completed"] is True
+    assert results[1]["detail"] == "Solo se pueden hacer pagos en préstamos activos"
+    loan = api.run(server.db.loans.find_one, {"id": loan_id})
+    assert loan["status"] == "completed"
+    assert loan["balance"] == api.run(server.compute_loan_balance, loan_id)
+    assert loan["balance"]["outstanding"] == 0
+
+
+def test_snapshot_decides_the_limit_not_the_schedule_sum(api):
+    server = api.server
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    # The stored balance is the source of truth for validation, as in create_payment
+    api.run(server.db.loans.update_one, {"id": loan_id}, {"$set": {"balance.outstanding": 5000}})
+
+    response = api.client.post("/api/payments/bulk", json={"payments": [
+        {"loan_id": loan_id, "amount": 6000}
+    ]}, headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    assert response.json()["results"][0]["detail"] == (
+        "El monto a pagar ($6,000) es mayor al saldo pendiente ($5,000)"
+    )
+    assert api.run(server.db.payments.count_documents, {"loan_id": loan_id}) == 0
@@ -0,0 +1,97 @@
+"""GET /api/admin/cash-flow-projection over seeded schedules, late and overdue included."""
+from datetime import datetime, timezone, timedelta
+
+
+def seed_schedules(api):
+    """Lender A collected half of what fell due lately, lender B all of it, C has no history"""
+    server = api.server
+    lender_a = api.user_id("lender")
+    lender_b = api.register("lender", "lender-b")["user"]["id"]
+    lender_c = api.register("lender", "lender-c")["user"]["id"]
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = []
+
+    def schedule(lender, days, amount, status="pending", installment=None):
+        doc = {
+            "id": f"s{len(rows)}", "loan_id": f"loan-{lender}", "client_id": api.user_id("client"),
+            "lender_id": lender, "payment_number": len(rows) + 1,
+            "due_date": (today + timedelta(days=days, hours=12)).isoformat(),
+            "amount": amount, "status": status, "paid_date": None
+        }
+        if installment is not None:
+            doc["installment_amount"] = installment
+        rows.append(doc)
+
+    # History: A has 1000 paid, 1000 late and an overdue 2000 with 1000 still owed
+    schedule(lender_a, -5, 1000, "paid", 1000)
+    schedule(lender_a, -3, 1000, "late", 1000)
+    schedule(lender_a, -40, 1000, "overdue", 2000)
+    schedule(lender_b, -10, 1000, "paid", 1000)
+    # Ahead: only unpaid schedules inside the window are projected
+    schedule(lender_a, 1, 2000)
+    schedule(lender_a, 1, 500)
+    schedule(lender_a, 10, 1000)
+    schedule(lender_b, 2, 3000)
+    schedule(lender_c, 2, 500)
+    schedule(lender_a, 3, 700, "paid")
+    schedule(lender_b, 120, 9000)
+    api.run(server.db.payment_schedules.insert_many, rows)
+    return today, lender_a, lender_b, lender_c
+
+
+def day(today, days):
+    return (today + timedelta(days=days)).date().isoformat()
+
+
+def test_projection_sums_unpaid_schedules_in_the_window_by_day(api):
+    today, lender_a, lender_b, lender_c = seed_schedules(api)
+
+    response = api.client.get("/api/admin/cash-flow-projection?days=90", headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["from"], body["to"]) == (day(today, 0), day(today, 90))
+    # Past-due late/overdue schedules are not future cash; paid and out-of-window rows neither
+    assert body["total_amount"] == body["total_expected"] == 7000
+    assert [(bucket["period"], bucket["amount"], bucket["installments"]) for bucket in body["buckets"]] == [
+        (day(today, 1), 2500, 2), (day(today, 2), 3500, 2), (day(today, 10), 1000, 1)
+    ]
+    assert [(row["lender_id"], row["lender_name"], row["amount"]) for row in body["by_lender"]] == [
+        (lender_a, "lender", 3500), (lender_b, "lender-b", 3000), (lender_c, "lender-c", 500)
+    ]
+    assert body["collection_rate"] is None
+
+
+def test_haircut_uses_the_late_and_overdue_history(api):
+    today, lender_a, lender_b, lender_c = seed_schedules(api)
+
+    response = api.client.get("/api/admin/cash-flow-projection?apply_haircut=true&lookback_days=90",
+                              headers=api.headers("admin"))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    # A: 2000 of 4000 (the partial payment on the overdue one counts); B: 1000 of 1000
+    assert body["collection_rate"] == {"overall": 0.6, "by_lender": {lender_a: 0.5, lender_b: 1.0}}
+    expected = {row["lender_id"]: row["expected"] for row in body["by_lender"]}
+    # C has no history and falls back to the overall rate
+    assert expected == {lender_a: 1750, lender_b: 3000, lender_c: 300}
+    assert body["total_expected"] == 5050
+    assert body["total_amount"] == 7000
+
+
+def test_lender_filter_and_granularity(api):
+    today, lender_a, _, _ = seed_schedules(api)
+
+    response = api.client.get(
+        f"/api/admin/cash-flow-projection?lender_id={lender_a}&granularity=month&days=30",
+        headers=api.headers("admin")
+    )
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [row["lender_id"] for row in body["by_lender"]] == [lender_a]
+    assert body["total_amount"] == 3500
+    months = sorted({day(today, 1)[:7], day(today, 10)[:7]})
+    assert [bucket["period"] for bucket in body["buckets"]] == months
+    assert api.client.get("/api/admin/cash-flow-projection?granularity=year",
+                          headers=api.headers("admin")).status_code == 400
@@ -0,0 +1,44 @@
+"""CompressionMiddleware: Vary: Accept-Encoding on every response it could compress."""
+import pytest
+
+from compression import CompressionMiddleware
+
+starlette = pytest.importorskip("starlette")
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import PlainTextResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+
+def make_client():
+    async def small(request):
+        return PlainTextResponse("ok", headers={"Vary": "Origin"})
+
+    async def large(request):
+        return PlainTextResponse("x" * 4096, headers={"Vary": "Origin"})
+
+    async def events(request):
+        return StreamingResponse(iter([b"data: 1\n\n"]), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/small", small), Route("/large", large), Route("/events", events)])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path, accept_encoding, content_encoding", [
+    ("/small", "gzip", None),
+    ("/large", "identity", None),
+    ("/large", "gzip", "gzip"),
+])
+def test_vary_is_set_whether_or_not_the_body_is_compressed(path, accept_encoding, content_encoding):
+    response = make_client().get(path, headers={"Accept-Encoding": accept_encoding})
+
+    assert response.headers.get("content-encoding") == content_encoding
+    assert response.headers.get_list("vary") == ["Origin, Accept-Encoding"]
+
+
+def test_event_stream_is_left_alone():
+    response = make_client().get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
@@ -0,0 +1,109 @@
+"""Conditional GETs: If-None-Match answers 304 until the version behind the ETag moves."""
+
+
+def get(api, path, user="admin", etag=None):
+    headers = api.headers(user) if user else {}
+    if etag:
+        headers["If-None-Match"] = etag
+    return api.client.get(path, headers=headers)
+
+
+def assert_revalidates(api, path, user="admin"):
+    """First GET returns the ETag; replaying it gets a bodiless 304"""
+    first = get(api, path, user)
+    assert first.status_code == 200, first.text
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == api.server.CONDITIONAL_CACHE_CONTROL
+
+    cached = get(api, path, user, etag)
+    assert cached.status_code == 304
+    assert cached.content == b""
+    # Compressed bodies carry the weak form W/"..." of the same tag
+    assert cached.headers["ETag"] == etag.removeprefix("W/")
+    # Weak comparison and lists of candidates match as well
+    assert get(api, path, user, f'"other", W/{etag.removeprefix("W/")}').status_code == 304
+    return etag
+
+
+def test_schedules_answer_304_until_a_payment_bumps_the_loan_version(api):
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    path = f"/api/schedules?loan_id={loan_id}"
+    etag = assert_revalidates(api, path)
+    assert assert_revalidates(api, path, user="lender") != etag
+
+    first_due = get(api, path).json()[0]["amount"]
+    response = api.client.post("/api/payments", json={"loan_id": loan_id, "amount": first_due},
+                               headers=api.headers("admin"))
+    assert response.status_code == 200, response.text
+
+    changed = get(api, path, etag=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert any(schedule["status"] == "paid" for schedule in changed.json())
+
+
+def test_schedules_etag_follows_the_sweep_state(api):
+    loan_id = api.create_loan()["id"]
+    api.approve(loan_id)
+    path = f"/api/schedules?loan_id={loan_id}"
+    etag = assert_revalidates(api, path)
+
+    # The sweeper records when it changed statuses; the loan version stays the same
+    api.run(api.server.db.system_state.update_one, {"id": "schedule_sweeper"},
+            {"$set": {"changed_at": "2026-10-19T00:00:00+00:00"}}, True)
+
+    changed = get(api, path, etag=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_loan_answers_304_until_its_version_changes(api):
+    loan_id = api.create_loan()["id"]
+    path = f"/api/loans/{loan_id}"
+    etag = assert_revalidates(api, path, user="client")
+
+    api.approve(loan_id)
+
+    changed = get(api, path, user="client", etag=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["status"] == "active"
+
+
+def test_users_etag_changes_when_the_revision_counter_is_bumped(api):
+    path = "/api/users"
+    etag = assert_revalidates(api, path)
+    assert assert_revalidates(api, f"{path}?role=lender") != etag
+
+    api.run(api.server.bump_revision, "users")
+    changed = get(api, path, etag=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+    # Registering a user bumps the same counter
+    etag = changed.headers["ETag"]
+    api.register("client", "another-client")
+    changed = get(api, path, etag=etag)
+    assert changed.status_code == 200
+    assert "another-client" in [user["name"] for user in changed.json()]
+
+
+def test_system_config_etag_follows_updated_at(api):
+    path = "/api/config/system"
+    get(api, path)  # creates the default configuration
+    etag = assert_revalidates(api, path, user=None)
+
+    api.run(api.server.db.system_config.update_one, {},
+            {"$set": {"updated_at": "2026-10-19T00:00:00+00:00"}})
+
+    changed = get(api, path, user=None, etag=etag)
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_stale_or_missing_if_none_match_returns_the_body(api):
+    loan_id = api.create_loan()["id"]
+    path = f"/api/loans/{loan_id}"
+    assert get(api, path, user="client", etag='"stale"').status_code == 200
+    assert get(api, path, user="client").json()["id"] == loan_id
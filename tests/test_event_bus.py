@@ -0,0 +1,34 @@
+"""Last-Event-ID replay follows delivery order, which is not id order across workers."""
+import asyncio
+
+from event_bus import EventBus
+
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def test_replay_sends_what_was_delivered_after_the_last_event_even_with_lower_ids():
+    async def scenario():
+        bus = EventBus()
+        # Two workers took ids 6 and 5 but inserted 6 first
+        for event_id in [4, 6, 5, 7]:
+            bus._deliver({"id": event_id, "type": "payment.created", "data": {}})
+
+        return drain(bus.subscribe(last_event_id=6))
+
+    assert [event["id"] for event in asyncio.run(scenario())] == [5, 7]
+
+
+def test_unknown_last_event_id_asks_the_client_to_resync():
+    async def scenario():
+        bus = EventBus()
+        for event_id in [4, 6, 5]:
+            bus._deliver({"id": event_id, "type": "payment.created", "data": {}})
+
+        return drain(bus.subscribe(last_event_id=2))
+
+    assert asyncio.run(scenario()) == [{"id": 5, "type": "resync", "data": {}}]
@@ -0,0 +1,93 @@
+"""Idempotency-Key handling on POST /api/payments (run_idempotent)."""
+from datetime import datetime, timezone
+
+import pytest
+
+
+def pay(api, loan_id, amount, key, user="client"):
+    headers = {**api.headers(user), "Idempotency-Key": key}
+    return api.client.post("/api/payments", json={"loan_id": loan_id, "amount": amount}, headers=headers)
+
+
+def payment_count(api, loan_id):
+    return len(api.client.get("/api/payments", params={"loan_id": loan_id}, headers=api.headers("admin")).json())
+
+
+def test_retry_with_same_key_replays_the_first_response(api):
+    loan = api.create_loan()
+    api.approve(loan["id"])
+
+    first = pay(api, loan["id"], 5000, "key-1")
+    second = pay(api, loan["id"], 5000, "key-1")
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.headers["Idempotency-Replayed"] == "true"
+    assert second.json()["id"] == first.json()["id"]
+    assert payment_count(api, loan["id"]) == 1
+
+
+def test_completed_record_is_written_with_the_payment(api):
+    loan = api.create_loan()
+    api.approve(loan["id"])
+
+    payment = pay(api, loan["id"], 5000, "key-1").json()
+
+    record = api.run(api.server.db.idempotency_keys.find_one,
+                     {"_id": f"payment:{api.user_id('client')}:key-1"})
+    assert record["state"] == "completed"
+    assert record["response"]["id"] == payment["id"]
+
+
+def test_same_key_with_different_body_is_rejected(api):
+    loan = api.create_loan()
+    api.approve(loan["id"])
+
+    assert pay(api, loan["id"], 5000, "key-1").status_code == 200
+    conflict = pay(api, loan["id"], 6000, "key-1")
+
+    assert conflict.status_code == 422
+    assert payment_count(api, loan["id"]) == 1
+
+
+def test_keys_are_scoped_to_the_caller(api):
+    loan = api.create_loan()
+    api.approve(loan["id"])
+
+    by_client = pay(api, loan["id"], 5000, "shared", user="client")
+    by_lender = pay(api, loan["id"], 5000, "shared", user="lender")
+
+    assert by_lender.status_code == 200
+    assert "Idempotency-Replayed" not in by_lender.headers
+    assert by_lender.json()["id"] != by_client.json()["id"]
+    assert payment_count(api, loan["id"]) == 2
+
+
+def test_failed_operation_releases_the_key(api):
+    loan = api.create_loan()
+    api.approve(loan["id"])
+
+    overpaid = pay(api, loan["id"], 10_000_000, "key-1")
+    assert overpaid.status_code == 400
+
+    # The failure left no record, so the retry runs again instead of replaying
+    retried = pay(api, loan["id"], 10_000_000, "key-1")
+    assert retried.status_code == 400
+    assert "Idempotency-Replayed" not in retried.headers
+    assert payment_count(api, loan["id"]) == 0
+
+
+def test_taken_over_key_aborts_the_original_request(api):
+    server = api.server
+
+    async def complete_after_takeover():
+        record = server.IdempotencyRecord("payment:someone:key", datetime(2026, 1, 1, tzinfo=timezone.utc))
+        await server.db.idempotency_keys.insert_one({
+            "_id": record.record_id, "state": "processing", "request_hash": "x",
+            "created_at": datetime(2026, 1, 2, tzinfo=timezone.utc)
+        })
+        await record.complete({"ok": True})
+
+    with pytest.raises(server.HTTPException) as raised:
+        api.run(complete_after_takeover)
+    assert raised.value.status_code == 409
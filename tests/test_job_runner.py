@@ -0,0 +1,203 @@
+"""JobRunner: heartbeats while a job runs, requeuing orphaned jobs and the failed status."""
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import job_runner  # noqa: E402
+from job_runner import JobRunner, JobStatus  # noqa: E402
+
+
+def new_db():
+    return mongomock_motor.AsyncMongoMockClient().loans_test
+
+
+async def wait_for_status(db, job_id, statuses, timeout=2):
+    async def poll():
+        while True:
+            job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+            if job and job["status"] in statuses:
+                return job
+            await asyncio.sleep(0.01)
+    return await asyncio.wait_for(poll(), timeout=timeout)
+
+
+def running_job(job_id, heartbeat_at, attempts=1):
+    """A job as left by a process that took it and then stopped"""
+    return {
+        "id": job_id, "type": "echo", "params": {"value": job_id}, "requested_by": None,
+        "status": JobStatus.RUNNING, "progress": {"done": 0, "total": None, "percentage": 0.0},
+        "result": None, "error": None, "attempts": attempts,
+        "created_at": heartbeat_at, "started_at": heartbeat_at, "finished_at": None,
+        "heartbeat_at": heartbeat_at
+    }
+
+
+def test_heartbeat_advances_while_a_silent_handler_runs(monkeypatch):
+    monkeypatch.setattr(job_runner, "HEARTBEAT_SECONDS", 0.02)
+
+    async def scenario():
+        db = new_db()
+        release = asyncio.Event()
+
+        async def handler(params, report):
+            # Never calls report: only the heartbeat task touches heartbeat_at
+            await release.wait()
+            return {}
+
+        runner = JobRunner()
+        runner.register("slow", handler)
+        await runner.start(db)
+        job = await runner.enqueue("slow", {})
+        started = await wait_for_status(db, job["id"], {JobStatus.RUNNING})
+        await asyncio.sleep(0.1)
+        beating = await db.jobs.find_one({"id": job["id"]})
+
+        release.set()
+        finished = await wait_for_status(db, job["id"], {JobStatus.COMPLETED})
+        await asyncio.sleep(0.1)
+        after = await db.jobs.find_one({"id": job["id"]})
+        await runner.stop()
+        return started, beating, finished, after
+
+    started, beating, finished, after = asyncio.run(scenario())
+    assert beating["heartbeat_at"] > started["heartbeat_at"]
+    # The heartbeat stops with the job
+    assert after["heartbeat_at"] == finished["heartbeat_at"]
+
+
+def test_report_updates_progress_and_heartbeat():
+    async def scenario():
+        db = new_db()
+        checked = asyncio.Event()
+        seen = {}
+
+        async def handler(params, report):
+            await report(1, 4)
+            seen["job"] = await db.jobs.find_one({"status": JobStatus.RUNNING})
+            checked.set()
+            return {"ok": True}
+
+        runner = JobRunner()
+        runner.register("count", handler)
+        await runner.start(db)
+        job = await runner.enqueue("count", {})
+        await asyncio.wait_for(checked.wait(), timeout=2)
+        stored = await wait_for_status(db, job["id"], {JobStatus.COMPLETED})
+        await runner.stop()
+        return seen["job"], stored
+
+    during, stored = asyncio.run(scenario())
+    assert during["progress"] == {"done": 1, "total": 4, "percentage": 25.0}
+    assert during["heartbeat_at"] >= during["started_at"]
+    assert stored["progress"]["percentage"] == 100.0
+    assert stored["result"] == {"ok": True}
+
+
+def test_stale_running_jobs_are_requeued_and_fresh_ones_are_left_alone():
+    async def scenario():
+        db = new_db()
+        now = datetime.now(timezone.utc)
+        stale = (now - timedelta(seconds=job_runner.STALE_AFTER_SECONDS + 5)).isoformat()
+        fresh = (now - timedelta(seconds=1)).isoformat()
+        # One process crashed mid-job; another is still working on its job
+        await db.jobs.insert_many([running_job("orphan", stale), running_job("alive", fresh)])
+        ran = []
+
+        async def handler(params, report):
+            ran.append(params["value"])
+            return {"echo": params["value"]}
+
+        runner = JobRunner()
+        runner.register("echo", handler)
+        await runner.start(db)
+        orphan = await wait_for_status(db, "orphan", {JobStatus.COMPLETED})
+        await asyncio.sleep(0.05)
+        alive = await db.jobs.find_one({"id": "alive"})
+        await runner.stop()
+        return ran, orphan, alive
+
+    ran, orphan, alive = asyncio.run(scenario())
+    assert ran == ["orphan"]
+    assert orphan["attempts"] == 2
+    assert orphan["result"] == {"echo": "orphan"}
+    assert alive["status"] == JobStatus.RUNNING
+    assert alive["attempts"] == 1
+
+
+def test_poll_picks_up_jobs_that_go_stale_after_start(monkeypatch):
+    monkeypatch.setattr(job_runner, "POLL_SECONDS", 0.01)
+
+    async def scenario():
+        db = new_db()
+        fresh = datetime.now(timezone.utc).isoformat()
+        await db.jobs.insert_one(running_job("orphan", fresh))
+
+        async def handler(params, report):
+            return {"echo": params["value"]}
+
+        runner = JobRunner()
+        runner.register("echo", handler)
+        await runner.start(db)
+        await asyncio.sleep(0.05)
+        still_running = await db.jobs.find_one({"id": "orphan"})
+
+        # Its process stops beating: the next poll requeues it
+        stale = (datetime.now(timezone.utc) - timedelta(seconds=job_runner.STALE_AFTER_SECONDS + 1)).isoformat()
+        await db.jobs.update_one({"id": "orphan"}, {"$set": {"heartbeat_at": stale}})
+        done = await wait_for_status(db, "orphan", {JobStatus.COMPLETED})
+        await runner.stop()
+        return still_running, done
+
+    still_running, done = asyncio.run(scenario())
+    assert still_running["status"] == JobStatus.RUNNING
+    assert done["attempts"] == 2
+
+
+def test_handler_errors_and_unknown_types_end_as_failed():
+    async def scenario():
+        db = new_db()
+
+        async def broken(params, report):
+            await report(1, 2)
+            raise RuntimeError("sin conexión con el banco")
+
+        runner = JobRunner()
+        runner.register("broken", broken)
+        await runner.start(db)
+        job = await runner.enqueue("broken", {})
+        failed = await wait_for_status(db, job["id"], {JobStatus.FAILED, JobStatus.COMPLETED})
+
+        # A job stored by a process that knows a type this one does not
+        await db.jobs.insert_one({**running_job("legacy", None), "type": "retired", "status": JobStatus.QUEUED})
+        runner._put("legacy")
+        unknown = await wait_for_status(db, "legacy", {JobStatus.FAILED, JobStatus.COMPLETED})
+
+        # The worker survives both and keeps running jobs
+        runner.register("ok", lambda params, report: asyncio.sleep(0, result="ok"))
+        later = await runner.enqueue("ok", {})
+        completed = await wait_for_status(db, later["id"], {JobStatus.COMPLETED})
+        await runner.stop()
+        return failed, unknown, completed
+
+    failed, unknown, completed = asyncio.run(scenario())
+    assert failed["status"] == JobStatus.FAILED
+    assert failed["error"] == "sin conexión con el banco"
+    assert failed["result"] is None
+    assert failed["finished_at"] is not None
+    assert failed["progress"]["percentage"] == 50.0
+    assert unknown["status"] == JobStatus.FAILED
+    assert unknown["error"] == "Tipo de trabajo desconocido: retired"
+    assert completed["result"] == "ok"
+
+
+def test_enqueue_rejects_unregistered_types():
+    async def scenario():
+        runner = JobRunner()
+        runner.attach(new_db())
+        with pytest.raises(ValueError):
+            await runner.enqueue("missing", {})
+
+    asyncio.run(scenario())
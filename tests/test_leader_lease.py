@@ -0,0 +1,57 @@
+"""Background tasks run in one process: LeaderLease and JobRunner across workers."""
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import job_runner  # noqa: E402
+from job_runner import JobRunner, JobStatus  # noqa: E402
+from leader_lease import LeaderLease  # noqa: E402
+
+
+def test_only_one_holder_until_the_lease_expires():
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().loans_test
+        first, second = LeaderLease("background_tasks", 30), LeaderLease("background_tasks", 30)
+
+        assert await first.acquire(db)
+        assert not await second.acquire(db)
+        assert await first.acquire(db)  # renewing keeps it
+
+        # The holder stopped renewing (crashed or lost its connection)
+        await db.leases.update_one({"_id": "background_tasks"},
+                                   {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        assert await second.acquire(db)
+        assert not await first.acquire(db)
+
+    asyncio.run(scenario())
+
+
+def test_jobs_enqueued_by_another_worker_run_on_the_leader(monkeypatch):
+    monkeypatch.setattr(job_runner, "POLL_SECONDS", 0.01)
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().loans_test
+        done = asyncio.Event()
+
+        async def handler(params, report):
+            done.set()
+            return {"echo": params["value"]}
+
+        leader, follower = JobRunner(), JobRunner()
+        for runner in (leader, follower):
+            runner.register("echo", handler)
+        follower.attach(db)
+        await leader.start(db)
+
+        job = await follower.enqueue("echo", {"value": 7})
+        await asyncio.wait_for(done.wait(), timeout=2)
+        await asyncio.sleep(0.05)
+        await leader.stop()
+        return await db.jobs.find_one({"id": job["id"]})
+
+    stored = asyncio.run(scenario())
+    assert stored["status"] == JobStatus.COMPLETED
+    assert stored["result"] == {"echo": 7}
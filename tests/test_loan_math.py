@@ -0,0 +1,61 @@
+"""Payment allocation and the stored loan balance (loan_math)."""
+from loan_math import allocate_payment, balance_snapshot, remaining_after_allocation
+
+
+def schedules(*amounts):
+    return [
+        {"id": f"s{number}", "payment_number": number, "amount": amount, "due_date": f"2026-1{number - 1}-01"}
+        for number, amount in enumerate(amounts, start=1)
+    ]
+
+
+def test_allocation_pays_schedules_in_order_and_leaves_a_partial():
+    allocation = allocate_payment(schedules(100, 100, 100), 250)
+
+    assert allocation == {"paid_ids": ["s1", "s2"], "partial": {"id": "s3", "amount": 50}, "completes_loan": False}
+
+
+def test_exact_payment_leaves_no_partial():
+    allocation = allocate_payment(schedules(100, 100), 100)
+
+    assert allocation == {"paid_ids": ["s1"], "partial": None, "completes_loan": False}
+
+
+def test_paying_the_rest_completes_the_loan_even_with_zero_amount_schedules():
+    allocation = allocate_payment(schedules(100, 0, 100, 0), 200)
+
+    assert allocation["completes_loan"]
+    assert remaining_after_allocation(schedules(100, 0, 100, 0), allocation) == []
+
+
+def test_remaining_after_allocation_carries_the_partial_amount():
+    pending = schedules(100, 100, 100)
+
+    remaining = remaining_after_allocation(pending, allocate_payment(pending, 150))
+
+    assert [(schedule["id"], schedule["amount"]) for schedule in remaining] == [("s2", 50), ("s3", 100)]
+    assert pending[1]["amount"] == 100  # the input is not modified
+
+
+def test_balance_snapshot_points_at_the_next_schedule_with_an_amount():
+    snapshot = balance_snapshot(schedules(0, 80, 100), 5, 2, 220, 3)
+
+    assert snapshot == {
+        "outstanding": 180,
+        "total_paid": 220,
+        "paid_count": 2,
+        "schedule_count": 5,
+        "payment_count": 3,
+        "next_payment_number": 2,
+        "next_due_date": "2026-11-01",
+        "next_due_amount": 80,
+    }
+
+
+def test_balance_snapshot_of_a_settled_loan_has_no_next_schedule():
+    snapshot = balance_snapshot([], 3, 3, 300, 2)
+
+    assert snapshot["outstanding"] == 0
+    assert snapshot["next_payment_number"] is None
+    assert snapshot["next_due_date"] is None
+    assert snapshot["next_due_amount"] is None
@@ -0,0 +1,85 @@
+"""migrate_payments never loses payments recorded after the migration."""
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import migrate_payments  # noqa: E402
+from payment_ledger import to_storage  # noqa: E402
+
+
+def payment(payment_id, day):
+    return {"id": payment_id, "loan_id": "l1", "client_id": "c1", "amount": 100,
+            "payment_date": f"2026-10-{day:02d}T00:00:00+00:00"}
+
+
+@pytest.fixture
+def types():
+    return {"payments": "timeseries", migrate_payments.LEGACY: "collection"}
+
+
+@pytest.fixture
+def db(monkeypatch, types):
+    db = mongomock.MongoClient().loans_test
+    # mongomock has no list_collections and no time-series collections
+    monkeypatch.setattr(migrate_payments, "collection_type", lambda db, name: types.get(name))
+    return db
+
+
+def stored_payments(db):
+    return sorted(db.payments.find({}, {"_id": 0}), key=lambda doc: doc["id"])
+
+
+def test_rollback_copies_newer_and_outbox_payments_back(db):
+    db[migrate_payments.LEGACY].insert_many([payment("old", 1)])
+    db.payments.insert_many([to_storage(payment("old", 1)), to_storage(payment("new", 2))])
+    db.payments_outbox.insert_one(payment("pending", 3))
+
+    assert migrate_payments.rollback(db, batch_size=1) == 0
+
+    assert stored_payments(db) == [payment("new", 2), payment("old", 1), payment("pending", 3)]
+    assert db.payments_outbox.count_documents({}) == 0
+
+
+def test_rollback_rebuilds_a_dropped_legacy_collection(db, monkeypatch):
+    monkeypatch.setattr(migrate_payments, "collection_type",
+                        lambda db, name: "timeseries" if name == "payments" else None)
+    db.payments.insert_many([to_storage(payment("a", 1)), to_storage(payment("b", 2))])
+
+    assert migrate_payments.rollback(db, batch_size=10) == 0
+
+    assert stored_payments(db) == [payment("a", 1), payment("b", 2)]
+
+
+def test_rerunning_a_finished_migration_keeps_newer_payments(db, types, monkeypatch):
+    types.update({"payments": "collection", migrate_payments.LEGACY: None})
+    monkeypatch.setattr(db, "create_collection", lambda name, **options: None)
+    db.payments.insert_many([payment("old", 1)])
+
+    assert migrate_payments.migrate(db, batch_size=10, drop_legacy=False) == 0
+    types.update({"payments": "timeseries", migrate_payments.LEGACY: "collection"})
+    # The API is back up on the time-series collection
+    db.payments.insert_one(to_storage(payment("new", 2)))
+
+    assert migrate_payments.migrate(db, batch_size=10, drop_legacy=False) == 0
+
+    assert [doc["id"] for doc in stored_payments(db)] == ["new", "old"]
+
+
+def test_rerun_without_the_marker_copies_again(db, monkeypatch):
+    monkeypatch.setattr(db, "create_collection", lambda name, **options: None)
+    db[migrate_payments.LEGACY].insert_many([payment("a", 1), payment("b", 2)])
+    # An interrupted copy left only part of the payments
+    db.payments.insert_one(to_storage(payment("a", 1)))
+
+    assert migrate_payments.migrate(db, batch_size=1, drop_legacy=False) == 0
+
+    assert [doc["id"] for doc in stored_payments(db)] == ["a", "b"]
+    assert db.system_state.find_one(migrate_payments.MARKER) is not None
+
+
+def test_rollback_clears_the_marker(db):
+    db.system_state.insert_one({**migrate_payments.MARKER, "copied": 0})
+
+    assert migrate_payments.rollback(db, batch_size=10) == 0
+
+    assert db.system_state.find_one(migrate_payments.MARKER) is None
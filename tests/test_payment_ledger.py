@@ -0,0 +1,89 @@
+"""Filter and pipeline translation for the time-series payments collection."""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from payment_ledger import PaymentLedger, from_storage, to_storage, translate_filter, translate_pipeline
+
+
+def test_translate_filter_moves_meta_fields_and_parses_dates():
+    query = {
+        "loan_id": {"$in": ["l1", "l2"]},
+        "amount": {"$gt": 0},
+        "payment_date": {"$gte": "2026-10-01T00:00:00", "$lt": "2026-11-01T00:00:00+00:00"},
+    }
+
+    assert translate_filter(query) == {
+        "meta.loan_id": {"$in": ["l1", "l2"]},
+        "amount": {"$gt": 0},
+        "payment_date": {
+            "$gte": datetime(2026, 10, 1, tzinfo=timezone.utc),
+            "$lt": datetime(2026, 11, 1, tzinfo=timezone.utc),
+        },
+    }
+
+
+def test_translate_filter_recurses_into_logical_operators():
+    query = {"$or": [{"client_id": "c1"}, {"payment_date": "2026-10-01T00:00:00+00:00"}]}
+
+    assert translate_filter(query) == {
+        "$or": [{"meta.client_id": "c1"}, {"payment_date": datetime(2026, 10, 1, tzinfo=timezone.utc)}]
+    }
+
+
+def test_translate_pipeline_rewrites_matches_and_field_references():
+    pipeline = [
+        {"$match": {"loan_id": "l1"}},
+        {"$group": {"_id": "$loan_id", "total": {"$sum": "$amount"}, "clients": {"$addToSet": ["$client_id"]}}},
+        {"$sort": {"total": -1}},
+    ]
+
+    assert translate_pipeline(pipeline) == [
+        {"$match": {"meta.loan_id": "l1"}},
+        {"$group": {"_id": "$meta.loan_id", "total": {"$sum": "$amount"}, "clients": {"$addToSet": ["$meta.client_id"]}}},
+        {"$sort": {"total": -1}},
+    ]
+
+
+def test_storage_round_trip_keeps_the_api_format():
+    payment = {"id": "p1", "loan_id": "l1", "client_id": "c1", "amount": 500,
+               "payment_date": "2026-10-01T12:30:00+00:00"}
+
+    stored = to_storage(payment)
+
+    assert stored["meta"] == {"loan_id": "l1", "client_id": "c1"}
+    assert stored["payment_date"] == datetime(2026, 10, 1, 12, 30, tzinfo=timezone.utc)
+    assert from_storage(stored) == payment
+
+
+def test_aggregate_includes_payments_still_in_the_outbox():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient().loans_test
+        ledger = PaymentLedger(db, time_series=True)
+        await db.payments.insert_many([
+            to_storage({"id": "p1", "loan_id": "l1", "client_id": "c1", "amount": 500,
+                        "payment_date": "2026-10-01T00:00:00+00:00"}),
+            to_storage({"id": "p2", "loan_id": "l2", "client_id": "c1", "amount": 300,
+                        "payment_date": "2026-10-02T00:00:00+00:00"}),
+        ])
+        # Committed but not flushed yet
+        await ledger.insert_one({"id": "p3", "loan_id": "l1", "client_id": "c1", "amount": 200,
+                                 "payment_date": "2026-10-03T00:00:00+00:00"})
+
+        totals = await ledger.aggregate([
+            {"$match": {"client_id": "c1"}},
+            {"$group": {"_id": "$loan_id", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+        ])
+        recent = await ledger.aggregate([
+            {"$match": {"payment_date": {"$gte": "2026-10-03T00:00:00+00:00"}}},
+            {"$group": {"_id": "$loan_id"}}
+        ])
+        return sorted(totals, key=lambda row: row["_id"]), recent
+
+    totals, recent = asyncio.run(scenario())
+
+    assert [(row["_id"], row["total"], row["count"]) for row in totals] == [("l1", 700, 2), ("l2", 300, 1)]
+    assert recent == [{"_id": "l1"}]
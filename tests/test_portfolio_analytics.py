@@ -0,0 +1,77 @@
+"""Days past due, portfolio-at-risk buckets and collection rates (portfolio_analytics)."""
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from portfolio_analytics import build_par_report, collection_rate_pipeline, collection_rates  # noqa: E402
+
+AS_OF = datetime(2026, 10, 19, 15, tzinfo=timezone.utc)
+
+
+def row(loan_id, outstanding, oldest_due, lender_id, frequency="weekly"):
+    return {"loan_id": loan_id, "outstanding": outstanding, "oldest_due": oldest_due,
+            "lender_id": lender_id, "lender_name": lender_id.upper(), "payment_frequency": frequency}
+
+
+ROWS = [
+    row("current", 100, "2026-10-25T00:00:00+00:00", "l1"),
+    row("dpd1", 200, "2026-10-18T23:00:00+00:00", "l1"),  # late evening still counts as one day
+    row("dpd5", 300, "2026-10-14T00:00:00+00:00", "l1", "monthly"),
+    row("dpd30", 400, "2026-09-19T00:00:00+00:00", "l2"),
+    row("dpd31", 500, "2026-09-18T00:00:00+00:00", "l2", "monthly"),
+    row("dpd120", 600, "2026-06-21T00:00:00+00:00", "l2"),
+]
+
+
+def test_overall_buckets_count_loans_strictly_past_each_threshold():
+    overall = build_par_report(ROWS, AS_OF)["overall"]
+
+    assert overall["loans_count"] == 6
+    assert overall["outstanding"] == 2100
+    assert overall["loans_in_arrears"] == 5
+    assert [overall[f"par{t}_amount"] for t in (1, 7, 30, 90)] == [1800, 1500, 1100, 600]
+    assert overall["par30"] == 52.38
+    assert overall["par90"] == 28.57
+
+
+def test_groups_by_lender_and_frequency_sorted_by_outstanding():
+    report = build_par_report(ROWS, AS_OF)
+
+    lenders = [(group["lender_id"], group["outstanding"], group["par30_amount"], group["par1"])
+               for group in report["by_lender"]]
+    assert lenders == [("l2", 1500, 1100, 100.0), ("l1", 600, 0, 50.0)]
+    frequencies = {group["payment_frequency"]: group["par7_amount"] for group in report["by_frequency"]}
+    assert frequencies == {"weekly": 1000, "monthly": 500}
+
+
+def test_empty_portfolio_reports_zero_without_dividing_by_zero():
+    overall = build_par_report([], AS_OF)["overall"]
+
+    assert overall["outstanding"] == 0
+    assert overall["par30"] == 0.0
+
+
+def test_collection_rate_counts_what_was_collected_on_partially_paid_schedules():
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient().loans_test
+
+    def schedule(status, amount, installment_amount=1000):
+        doc = {"lender_id": "l1", "due_date": "2026-10-05T00:00:00+00:00", "status": status, "amount": amount}
+        if installment_amount is not None:
+            doc["installment_amount"] = installment_amount
+        return doc
+
+    db.payment_schedules.insert_many([
+        schedule("paid", 400),  # partially paid first, then settled
+        schedule("late", 250),  # 750 of 1000 already collected
+        schedule("overdue", 1000),
+        schedule("late", 500, installment_amount=None),  # created before installment_amount
+    ])
+
+    rows = list(db.payment_schedules.aggregate(collection_rate_pipeline(
+        "paid", ["pending", "late", "overdue"], "2026-10-01T00:00:00+00:00", "2026-10-19T00:00:00+00:00")))
+
+    assert rows == [{"lender_id": "l1", "due": 3500, "paid": 1750}]
+    assert collection_rates(rows)["by_lender"] == {"l1": 0.5}
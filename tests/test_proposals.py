@@ -0,0 +1,60 @@
+"""Accepting loan proposals (POST /api/proposals/{id}/respond)."""
+
+
+def propose(api, loan_id, rate=10):
+    response = api.client.post(f"/api/loans/{loan_id}/propose", json={
+        "loan_id": loan_id, "lender_id": api.user_id("lender"),
+        "proposed_interest_rate": rate, "start_date": "2026-10-01T00:00:00+00:00"
+    }, headers=api.headers("admin"))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def respond(api, proposal_id, accepted=True):
+    return api.client.post(f"/api/proposals/{proposal_id}/respond", json={"proposal_id": proposal_id, "accepted": accepted},
+                           headers=api.headers("client"))
+
+
+def find_loan(api, loan_id):
+    return api.run(api.server.db.loans.find_one, {"id": loan_id}, {"_id": 0})
+
+
+def test_accepting_activates_the_loan_with_the_proposed_terms(api):
+    loan = api.create_loan()
+    proposal = propose(api, loan["id"])
+
+    assert respond(api, proposal["id"]).status_code == 200
+
+    activated = find_loan(api, loan["id"])
+    assert activated["status"] == "active"
+    assert activated["interest_rate"] == proposal["proposed_interest_rate"]
+    assert activated["total_amount"] == proposal["proposed_total_amount"]
+    assert activated["loan_number"]
+    schedules = api.run(lambda: api.server.db.payment_schedules.find({"loan_id": loan["id"]}).to_list(None))
+    assert {schedule["amount"] for schedule in schedules[:-1]} == {proposal["proposed_monthly_payment"]}
+    assert activated["balance"]["outstanding"] == sum(schedule["amount"] for schedule in schedules)
+    # Status, terms and loan number are one write: one version bump
+    assert activated["version"] == loan["version"] + 1
+
+
+def test_accepting_after_the_loan_was_approved_changes_nothing(api):
+    loan = api.create_loan()
+    proposal = propose(api, loan["id"])
+    api.approve(loan["id"])
+    approved = find_loan(api, loan["id"])
+
+    response = respond(api, proposal["id"])
+
+    assert response.status_code == 400
+    assert find_loan(api, loan["id"]) == approved
+    stored = api.run(api.server.db.loan_proposals.find_one, {"id": proposal["id"]})
+    assert stored["status"] == "pending"
+
+
+def test_a_proposal_can_only_be_answered_once(api):
+    loan = api.create_loan()
+    proposal = propose(api, loan["id"])
+
+    assert respond(api, proposal["id"], accepted=False).status_code == 200
+    assert respond(api, proposal["id"]).status_code == 400
+    assert find_loan(api, loan["id"])["status"] == "pending"
@@ -0,0 +1,75 @@
+"""GET /api/lenders/{id}/route-sheet: today's and past-due schedules, oldest first."""
+from datetime import datetime, timezone, timedelta
+
+
+def seed_schedules(api):
+    server = api.server
+    lender_id, client_id = api.user_id("lender"), api.user_id("client")
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def schedule(schedule_id, days, status="pending", payment_number=1, lender=lender_id, amount=1000):
+        return {
+            "id": schedule_id, "loan_id": f"loan-{schedule_id}", "client_id": client_id,
+            "client_name": "client", "lender_id": lender, "payment_number": payment_number,
+            "due_date": (today + timedelta(days=days, hours=12)).isoformat(), "amount": amount,
+            "status": status, "paid_date": None
+        }
+
+    api.run(server.db.payment_schedules.insert_many, [
+        schedule("today-2", 0, payment_number=2, amount=300),
+        schedule("overdue", -40, status="overdue", amount=5000),
+        schedule("today-1", 0, payment_number=1, amount=200),
+        schedule("late", -3, status="late", amount=1500),
+        # Not on today's route
+        schedule("tomorrow", 1),
+        schedule("paid", -2, status="paid"),
+        schedule("other-lender", -1, lender="someone-else"),
+    ])
+
+
+def test_route_sheet_lists_due_and_past_due_rows_in_due_order(api):
+    seed_schedules(api)
+    lender_id = api.user_id("lender")
+
+    response = api.client.get(f"/api/lenders/{lender_id}/route-sheet", headers=api.headers("lender"))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [item["id"] for item in body["items"]] == ["overdue", "late", "today-1", "today-2"]
+    assert [item["status"] for item in body["items"]] == ["overdue", "late", "pending", "pending"]
+    assert (body["total"], body["total_amount"]) == (4, 7000)
+    assert body["date"] == datetime.now(timezone.utc).date().isoformat()
+    # The client's contact data comes with each row
+    assert {(item["phone"], item["address"]) for item in body["items"]} == {("1", "a")}
+    assert set(body["items"][0]) == {
+        "id", "loan_id", "client_id", "client_name", "payment_number", "due_date", "amount",
+        "status", "phone", "address"
+    }
+
+
+def test_route_sheet_pages_keep_the_order_and_the_totals(api):
+    seed_schedules(api)
+    path = f"/api/lenders/{api.user_id('lender')}/route-sheet"
+
+    pages = [
+        api.client.get(f"{path}?page={page}&page_size=3", headers=api.headers("admin")).json()
+        for page in (1, 2, 3)
+    ]
+
+    assert [[item["id"] for item in page["items"]] for page in pages] == [
+        ["overdue", "late", "today-1"], ["today-2"], []
+    ]
+    assert {(page["total"], page["total_amount"]) for page in pages} == {(4, 7000)}
+
+
+def test_lenders_only_see_their_own_route_sheet(api):
+    seed_schedules(api)
+    api.register("lender", "other-lender")
+
+    response = api.client.get(f"/api/lenders/{api.user_id('lender')}/route-sheet",
+                              headers=api.headers("other-lender"))
+    assert response.status_code == 403
+
+    own = api.client.get(f"/api/lenders/{api.user_id('other-lender')}/route-sheet",
+                         headers=api.headers("other-lender")).json()
+    assert (own["total"], own["total_amount"], own["items"]) == (0, 0, [])
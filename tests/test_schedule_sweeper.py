@@ -0,0 +1,125 @@
+"""Schedule sweeper: LATE / OVERDUE transitions and per-lender events."""
+from datetime import datetime, timezone, timedelta
+
+
+def schedule(schedule_id, lender_id, due_date, status="pending"):
+    return {"id": schedule_id, "loan_id": f"loan-{lender_id}", "client_id": "c1", "lender_id": lender_id,
+            "payment_number": 1, "amount": 100, "due_date": due_date.isoformat(), "status": status,
+            "paid_date": None}
+
+
+def insert_schedules(api, docs):
+    # Forget the sweep that ran at startup so these past due dates are in range
+    api.run(api.server.db.system_state.delete_many, {"id": "schedule_sweeper"})
+    api.run(api.server.db.payment_schedules.insert_many, docs)
+
+
+def statuses(api):
+    docs = api.run(lambda: api.server.db.payment_schedules.find({}, {"_id": 0}).to_list(None))
+    return {doc["id"]: doc["status"] for doc in docs}
+
+
+def test_sweep_marks_late_and_overdue_incrementally(api):
+    now = datetime(2026, 10, 19, 9, tzinfo=timezone.utc)
+    insert_schedules(api, [
+        schedule("late", "l1", datetime(2026, 10, 10, tzinfo=timezone.utc)),
+        schedule("overdue", "l1", datetime(2026, 9, 1, tzinfo=timezone.utc)),
+        schedule("future", "l1", datetime(2026, 10, 25, tzinfo=timezone.utc)),
+        schedule("paid", "l1", datetime(2026, 9, 1, tzinfo=timezone.utc), status="paid"),
+        schedule("other-lender", "l2", datetime(2026, 10, 18, tzinfo=timezone.utc)),
+    ])
+
+    result = api.run(api.server.sweep_schedule_statuses, now)
+
+    # The pending schedule past the overdue cutoff goes through LATE on its way to OVERDUE
+    assert (result["marked_late"], result["marked_overdue"]) == (3, 1)
+    assert sorted(result["lenders"], key=lambda lender: lender["lender_id"]) == [
+        {"lender_id": "l1", "marked_late": 2, "marked_overdue": 1},
+        {"lender_id": "l2", "marked_late": 1, "marked_overdue": 0},
+    ]
+    assert statuses(api) == {"late": "late", "overdue": "overdue", "future": "pending",
+                             "paid": "paid", "other-lender": "late"}
+
+    # A month later the late schedules pass the overdue cutoff; nothing is counted twice
+    result = api.run(api.server.sweep_schedule_statuses, now + timedelta(days=30))
+
+    assert (result["marked_late"], result["marked_overdue"]) == (1, 2)
+    assert statuses(api) == {"late": "overdue", "overdue": "overdue", "future": "late",
+                             "paid": "paid", "other-lender": "overdue"}
+
+
+def test_manual_sweep_notifies_each_lender_only_of_its_schedules(api):
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    lender_id = api.user_id("lender")
+    insert_schedules(api, [
+        schedule("mine", lender_id, yesterday),
+        schedule("theirs", "someone-else", yesterday),
+    ])
+    subscription = api.server.event_bus.subscribe(lender_id=lender_id)
+    try:
+        response = api.client.post("/api/admin/schedules/sweep", headers=api.headers("admin"))
+        assert response.status_code == 200
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+    finally:
+        api.server.event_bus.unsubscribe(subscription)
+
+    assert [(event["type"], event["lender_id"], event["data"]["marked_late"]) for event in events] == [
+        ("schedules.status_changed", lender_id, 1)
+    ]
+
+
+def test_sweep_catches_pending_schedules_below_the_high_water_mark(api):
+    now = datetime(2026, 10, 19, 9, tzinfo=timezone.utc)
+    insert_schedules(api, [schedule("swept", "l1", datetime(2026, 10, 10, tzinfo=timezone.utc))])
+    api.run(api.server.sweep_schedule_statuses, now)
+    state = api.run(api.server.db.system_state.find_one, {"id": "schedule_sweeper"})
+
+    # Written as PENDING with a date the sweeper already passed (e.g. a failed sweep)
+    api.run(api.server.db.payment_schedules.insert_one,
+            schedule("missed", "l1", datetime(2026, 10, 12, tzinfo=timezone.utc)))
+    result = api.run(api.server.sweep_schedule_statuses, now)
+
+    assert (result["marked_late"], result["marked_overdue"]) == (1, 0)
+    assert statuses(api) == {"swept": "late", "missed": "late"}
+    assert api.run(api.server.db.system_state.find_one, {"id": "schedule_sweeper"})["changed_at"] != state["changed_at"]
+
+
+def test_sweep_counts_lenders_from_the_batches_it_updates(api, monkeypatch):
+    monkeypatch.setattr(api.server, "SCHEDULE_SWEEP_BATCH_SIZE", 2)
+    now = datetime(2026, 10, 19, 9, tzinfo=timezone.utc)
+    insert_schedules(api, [
+        schedule(f"s{index}", f"l{index % 2}", datetime(2026, 10, 10, tzinfo=timezone.utc)) for index in range(5)
+    ])
+
+    result = api.run(api.server.sweep_schedule_statuses, now)
+
+    assert (result["marked_late"], result["marked_overdue"]) == (5, 0)
+    assert sorted(result["lenders"], key=lambda lender: lender["lender_id"]) == [
+        {"lender_id": "l0", "marked_late": 3, "marked_overdue": 0},
+        {"lender_id": "l1", "marked_late": 2, "marked_overdue": 0},
+    ]
+    assert set(statuses(api).values()) == {"late"}
+
+
+def test_schedule_paid_between_read_and_write_is_not_counted_for_its_lender(api, monkeypatch):
+    now = datetime(2026, 10, 19, 9, tzinfo=timezone.utc)
+    insert_schedules(api, [
+        schedule("paid-meanwhile", "l1", datetime(2026, 10, 10, tzinfo=timezone.utc)),
+        schedule("still-due", "l2", datetime(2026, 10, 10, tzinfo=timezone.utc)),
+    ])
+    collection_class = type(api.server.db.payment_schedules)
+    update_many = collection_class.update_many
+
+    async def pay_then_update(self, query, update, *args, **kwargs):
+        # A payment commits after the sweeper read the batch
+        await update_many(self, {"id": "paid-meanwhile"}, {"$set": {"status": "paid"}})
+        return await update_many(self, query, update, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "update_many", pay_then_update)
+    result = api.run(api.server.sweep_schedule_statuses, now)
+
+    assert (result["marked_late"], result["marked_overdue"]) == (1, 0)
+    assert result["lenders"] == [{"lender_id": "l2", "marked_late": 1, "marked_overdue": 0}]
+    assert statuses(api) == {"paid-meanwhile": "paid", "still-due": "late"}
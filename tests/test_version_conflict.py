@@ -0,0 +1,57 @@
+"""Optimistic version check on loans: claim_loan and run_with_version_retry."""
+import pytest
+
+
+def test_retry_runs_the_callback_again_after_a_conflict(api):
+    server = api.server
+    calls = []
+
+    async def callback(session):
+        calls.append(session)
+        if len(calls) < 3:
+            raise server.VersionConflict("loan")
+        return "done"
+
+    assert api.run(server.run_with_version_retry, callback) == "done"
+    assert len(calls) == 3
+
+
+def test_retry_gives_up_with_409(api):
+    server = api.server
+    calls = []
+
+    async def callback(session):
+        calls.append(session)
+        raise server.VersionConflict("loan")
+
+    with pytest.raises(server.HTTPException) as raised:
+        api.run(server.run_with_version_retry, callback)
+    assert raised.value.status_code == 409
+    assert len(calls) == server.OCC_MAX_RETRIES
+
+
+def test_payment_racing_another_write_is_applied_once_on_fresh_data(api, monkeypatch):
+    server = api.server
+    loan = api.create_loan()
+    api.approve(loan["id"])
+    claim_loan = server.claim_loan
+    claims = []
+
+    async def claim_after_concurrent_write(loan_doc, update, session=None):
+        claims.append(loan_doc["version"])
+        if len(claims) == 1:
+            # Another request bumps the loan between this payment's read and its claim
+            await server.db.loans.update_one({"id": loan_doc["id"]}, {"$inc": {"version": 1}})
+        return await claim_loan(loan_doc, update, session=session)
+
+    monkeypatch.setattr(server, "claim_loan", claim_after_concurrent_write)
+
+    response = api.client.post("/api/payments", json={"loan_id": loan["id"], "amount": 5000},
+                               headers=api.headers("client"))
+
+    assert response.status_code == 200, response.text
+    assert claims[1] == claims[0] + 1  # the retry read the bumped version
+    stored = api.run(server.db.loans.find_one, {"id": loan["id"]})
+    assert stored["balance"]["payment_count"] == 1
+    assert stored["balance"]["total_paid"] == 5000
+    assert stored["version"] == claims[1] + 1